@@ -2,31 +2,114 @@
 Agentes oftalmológicos adaptados para arquitectura de microservicios.
 """
 
-from typing import Dict
-from .cliente_groq import ClienteGroq
+import os
+import time
+from typing import Dict, List, Optional, AsyncGenerator
+from prometheus_client import Histogram
+import structlog
+from .proveedores import Proveedor
+from .compactacion import compactar_reportes
+from .esquemas import MAX_TOKENS_ESTRUCTURADO, ReporteEspecialista, instrucciones_formato
+from .cascada import CASCADE_COUNTER, INSTRUCCION_CERTEZA, PoliticaCascada, ResultadoCascada
+from .rate_limit import estimar_tokens
+
+logger = structlog.get_logger()
+
+_BUCKETS_TOKENS = (500, 1000, 2000, 4000, 6000, 8000, 12000, 16000, 24000, 32000)
+DIRECTOR_PROMPT_TOKENS = Histogram(
+    'director_prompt_tokens', 'Estimated director prompt size in tokens', ['stage'], buckets=_BUCKETS_TOKENS
+)
+DIRECTOR_LATENCY = Histogram('director_latency_seconds', 'Time taken by the director synthesis call')
 
 class AgenteOftalmologico:
     """Clase base para agentes oftalmológicos."""
     
-    def __init__(self, cliente: ClienteGroq, nombre: str, especialidad: str):
+    def __init__(self, cliente: Proveedor, nombre: str, especialidad: str):
         self.cliente = cliente
         self.nombre = nombre
         self.especialidad = especialidad
+        self.cascada: Optional[PoliticaCascada] = None
     
-    def analizar(self, historial: str) -> str:
+    async def analizar(self, historial: str, max_tokens: Optional[int] = None) -> str:
         """Analiza el historial clínico y genera reporte."""
         system_prompt = self._obtener_prompt_sistema()
         prompt_usuario = self._construir_prompt_analisis(historial)
         
         # print(f"  → Analizando con {self.nombre}...") # Removed for microservice clean logs
-        respuesta = self.cliente.generar_respuesta(
+        respuesta = await self.cliente.generar_respuesta(
             prompt=prompt_usuario,
             system_prompt=system_prompt,
-            temperature=0.3
+            temperature=0.3,
+            max_tokens=max_tokens
         )
         
         return respuesta
     
+    async def analizar_en_cascada(
+        self,
+        historial: str,
+        max_tokens: Optional[int] = None,
+        nivel: Optional[str] = None
+    ) -> ResultadoCascada:
+        """
+        Analiza con la cascada configurada en `self.cascada`: modelo rápido primero y
+        modelo grande solo si el reporte no pasa la verificación (o con nivel "quality").
+        Sin cascada equivale a `analizar`.
+        """
+        if self.cascada is None:
+            texto = await self.analizar(historial, max_tokens=max_tokens)
+            return ResultadoCascada(texto, self.cliente.modelo, False, None)
+
+        politica = self.cascada
+        nivel = politica.nivel(nivel)
+        prompt = self._construir_prompt_analisis(historial) + INSTRUCCION_CERTEZA
+
+        async def generar(modelo: str) -> str:
+            return await self.cliente.generar_respuesta(
+                prompt=prompt,
+                system_prompt=self._obtener_prompt_sistema(),
+                temperature=0.3,
+                max_tokens=max_tokens,
+                modelo=modelo
+            )
+
+        if nivel == "quality":
+            CASCADE_COUNTER.labels(agent=politica.agente, outcome="direct", reason="quality_tier").inc()
+            return ResultadoCascada(await generar(politica.modelo_grande), politica.modelo_grande, False, None)
+
+        texto = await generar(politica.modelo_rapido)
+        motivo = politica.motivo_escalado(texto)
+        if motivo is None or nivel == "fast":
+            CASCADE_COUNTER.labels(agent=politica.agente, outcome="accepted", reason=motivo or "passed").inc()
+            return ResultadoCascada(texto, politica.modelo_rapido, False, motivo)
+
+        logger.info("cascade_escalated", agent=politica.agente, reason=motivo, model=politica.modelo_grande)
+        CASCADE_COUNTER.labels(agent=politica.agente, outcome="escalated", reason=motivo).inc()
+        return ResultadoCascada(await generar(politica.modelo_grande), politica.modelo_grande, True, motivo)
+    
+    async def analizar_estructurado(self, historial: str, max_tokens: Optional[int] = None) -> ReporteEspecialista:
+        """
+        Modo estructurado (opt-in): el modelo responde en JSON y se valida contra
+        ReporteEspecialista. Lanza ValueError si la respuesta no cumple el esquema.
+        """
+        respuesta = await self.cliente.generar_respuesta(
+            prompt=self._construir_prompt_estructurado(historial),
+            system_prompt=self._obtener_prompt_sistema(),
+            temperature=0.3,
+            max_tokens=min(max_tokens or MAX_TOKENS_ESTRUCTURADO, MAX_TOKENS_ESTRUCTURADO),
+            formato_json=True
+        )
+        return ReporteEspecialista.desde_json(respuesta)
+    
+    async def analizar_stream(self, historial: str) -> AsyncGenerator[str, None]:
+        """Analiza el historial emitiendo el reporte por fragmentos."""
+        async for fragmento in self.cliente.generar_respuesta_stream(
+            prompt=self._construir_prompt_analisis(historial),
+            system_prompt=self._obtener_prompt_sistema(),
+            temperature=0.3
+        ):
+            yield fragmento
+    
     def _obtener_prompt_sistema(self) -> str:
         """Retorna el prompt de sistema específico del agente."""
         raise NotImplementedError
@@ -47,12 +130,24 @@ Por favor proporciona un reporte médico profesional que incluya:
 5. **NIVEL DE URGENCIA**: Clasificar como BAJO / MEDIO / ALTO / CRÍTICO
 
 Formato: Profesional, conciso, basado en evidencia médica actual."""
+    
+    def _construir_prompt_estructurado(self, historial: str) -> str:
+        """Prompt del modo estructurado: mismas secciones, salida JSON con límites por campo."""
+        return f"""Analiza el siguiente historial clínico desde tu especialidad en {self.especialidad}:
+
+HISTORIAL CLÍNICO:
+{historial}
+
+Incluye los hallazgos relevantes a tu especialidad, el diagnóstico diferencial priorizado,
+las pruebas diagnósticas recomendadas, el tratamiento sugerido y el nivel de urgencia.
+
+{instrucciones_formato()}"""
 
 
 class AgenteOftalmologoGeneral(AgenteOftalmologico):
     """Oftalmólogo general - Primera línea de evaluación."""
     
-    def __init__(self, cliente: ClienteGroq):
+    def __init__(self, cliente: Proveedor):
         super().__init__(
             cliente=cliente,
             nombre="Dr. Oftalmólogo General",
@@ -90,7 +185,7 @@ Prioriza la seguridad del paciente identificando condiciones que puedan causar p
 class AgenteRetina(AgenteOftalmologico):
     """Especialista en retina y vítreo."""
     
-    def __init__(self, cliente: ClienteGroq):
+    def __init__(self, cliente: Proveedor):
         super().__init__(
             cliente=cliente,
             nombre="Dra. Especialista en Retina",
@@ -129,7 +224,7 @@ Basa tus recomendaciones en guías AAO y EURETINA. Considera siempre la anatomí
 class AgenteCornea(AgenteOftalmologico):
     """Especialista en córnea y superficie ocular."""
     
-    def __init__(self, cliente: ClienteGroq):
+    def __init__(self, cliente: Proveedor):
         super().__init__(
             cliente=cliente,
             nombre="Dr. Especialista en Córnea",
@@ -172,7 +267,7 @@ Evalúa siempre la necesidad de tratamiento urgente en infecciones corneales."""
 class AgenteNeuroOftalmologia(AgenteOftalmologico):
     """Especialista en neuro-oftalmología."""
     
-    def __init__(self, cliente: ClienteGroq):
+    def __init__(self, cliente: Proveedor):
         super().__init__(
             cliente=cliente,
             nombre="Dr. Neuro-oftalmólogo",
@@ -220,14 +315,50 @@ Identifica emergencias neuro-oftalmológicas que requieren manejo urgente multid
 class EquipoMultidisciplinarioOftalmologico:
     """Coordina y sintetiza los reportes de todos los especialistas."""
     
-    def __init__(self, cliente: ClienteGroq):
+    def __init__(self, cliente: Proveedor):
         self.cliente = cliente
+        # Presupuesto (tokens estimados) para el conjunto de reportes; 0 desactiva la compactación
+        self.presupuesto_reportes = int(os.environ.get("DIRECTOR_REPORTS_TOKEN_BUDGET", 6000))
     
-    def analizar_reportes(self, historial: str, reportes: Dict[str, str]) -> str:
+    async def analizar_reportes(
+        self,
+        historial: str,
+        reportes: Dict[str, str],
+        faltantes: Optional[List[str]] = None,
+        max_tokens: Optional[int] = None
+    ) -> str:
         """
         Integra todos los reportes en un consenso médico final.
+        `faltantes` lista los especialistas cuyo reporte no llegó a tiempo.
         """
-        system_prompt = """Eres el director médico de un equipo multidisciplinario de oftalmología en un hospital universitario.
+        inicio = time.perf_counter()
+        diagnostico_final = await self.cliente.generar_respuesta(
+            prompt=self._construir_prompt_consenso(historial, reportes, faltantes),
+            system_prompt=self._obtener_prompt_sistema(),
+            temperature=0.2,
+            max_tokens=max_tokens
+        )
+        DIRECTOR_LATENCY.observe(time.perf_counter() - inicio)
+        
+        return diagnostico_final
+    
+    async def analizar_reportes_stream(
+        self,
+        historial: str,
+        reportes: Dict[str, str],
+        faltantes: Optional[List[str]] = None
+    ) -> AsyncGenerator[str, None]:
+        """Genera el consenso final emitiéndolo por fragmentos."""
+        async for fragmento in self.cliente.generar_respuesta_stream(
+            prompt=self._construir_prompt_consenso(historial, reportes, faltantes),
+            system_prompt=self._obtener_prompt_sistema(),
+            temperature=0.2
+        ):
+            yield fragmento
+    
+    def _obtener_prompt_sistema(self) -> str:
+        """Prompt de sistema del director médico."""
+        return """Eres el director médico de un equipo multidisciplinario de oftalmología en un hospital universitario.
 
 TU MISIÓN:
 Revisar todos los reportes de especialistas y generar un CONSENSO MÉDICO FINAL integrado.
@@ -269,7 +400,15 @@ ESTILO:
 - Enfoque centrado en el paciente
 
 Cuando hay discrepancias entre especialistas, explica ambas perspectivas y justifica la conclusión final."""
-        
+    
+    def _construir_prompt_consenso(
+        self,
+        historial: str,
+        reportes: Dict[str, str],
+        faltantes: Optional[List[str]] = None
+    ) -> str:
+        """Construye el prompt con el historial y los reportes (compactados) de especialistas."""
+        reportes = self._compactar(reportes)
         prompt_completo = f"""==============================================
 HISTORIAL CLÍNICO ORIGINAL
 ==============================================
@@ -288,6 +427,15 @@ REPORTES DE ESPECIALISTAS
 {'─'*60}
 {reporte}
 
+"""
+        
+        if faltantes:
+            prompt_completo += f"""
+{'─'*60}
+⚠️ ESPECIALISTAS SIN REPORTE (no respondieron dentro del plazo): {', '.join(faltantes)}
+Indica explícitamente qué aspectos quedan sin evaluar por su ausencia.
+{'─'*60}
+
 """
         
         prompt_completo += f"""
@@ -304,10 +452,17 @@ Basándote en TODOS los reportes anteriores:
 
 El objetivo es proporcionar al médico tratante un consenso claro para tomar decisiones."""
         
-        diagnostico_final = self.cliente.generar_respuesta(
-            prompt=prompt_completo,
-            system_prompt=system_prompt,
-            temperature=0.2
-        )
-        
-        return diagnostico_final
+        DIRECTOR_PROMPT_TOKENS.labels(stage="final").observe(estimar_tokens(prompt_completo))
+        return prompt_completo
+    
+    def _compactar(self, reportes: Dict[str, str]) -> Dict[str, str]:
+        """Extrae las secciones, deduplica y ajusta los reportes al presupuesto de tokens."""
+        tokens_originales = sum(estimar_tokens(r) for r in reportes.values())
+        DIRECTOR_PROMPT_TOKENS.labels(stage="reports_raw").observe(tokens_originales)
+        if self.presupuesto_reportes <= 0:
+            return reportes
+        compactos = compactar_reportes(reportes, self.presupuesto_reportes)
+        tokens_compactos = sum(estimar_tokens(r) for r in compactos.values())
+        DIRECTOR_PROMPT_TOKENS.labels(stage="reports_compacted").observe(tokens_compactos)
+        logger.info("director_reports_compacted", tokens_before=tokens_originales, tokens_after=tokens_compactos)
+        return compactos
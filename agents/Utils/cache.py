@@ -0,0 +1,235 @@
+"""
+Caché de respuestas en dos niveles.
+
+- L1: LRU en memoria del proceso, acotada por bytes.
+- L2: Redis compartido, con valores comprimidos (zlib, o zstd si `zstandard` está instalado).
+
+Si Redis no responde, la caché sigue funcionando solo con L1 y una tarea en segundo
+plano intenta reconectar periódicamente.
+
+`canonicalizar` normaliza los textos antes de calcular la clave, para que historiales
+que solo difieren en espacios, saltos de línea o comillas tipográficas compartan entrada.
+"""
+
+import asyncio
+import re
+import unicodedata
+import zlib
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Iterable, Optional
+import redis.asyncio as aioredis
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+import structlog
+from .metricas import CACHE_LOOKUPS, agente_actual
+
+try:
+    import zstandard
+except ImportError:  # Dependencia opcional
+    zstandard = None
+
+logger = structlog.get_logger()
+
+# Cabeceras de formato en L2. Los valores antiguos (texto plano) no llevan cabecera.
+_ZLIB = b"\x01"
+_ZSTD = b"\x02"
+
+_TRADUCCION_TIPOGRAFICA = str.maketrans({
+    "\u201c": '"', "\u201d": '"', "\u201e": '"', "\u00ab": '"', "\u00bb": '"',
+    "\u2018": "'", "\u2019": "'", "\u201a": "'",
+    "\u2013": "-", "\u2014": "-", "\u2212": "-",
+    "\u00a0": " ", "\u2009": " ", "\u200b": "",
+})
+_ESPACIOS = re.compile(r"[ \t\f\v]+")
+_LINEAS_VACIAS = re.compile(r"\n{3,}")
+
+def canonicalizar(texto: str, campos_ignorados: Iterable[str] = ()) -> str:
+    """
+    Forma canónica de un texto para calcular claves de caché (no se envía al modelo).
+
+    Normaliza Unicode (NFKC), comillas y guiones tipográficos, finales de línea y
+    espacios. Las líneas de cabecera `CAMPO: valor` cuyo campo esté en
+    `campos_ignorados` (p. ej. FECHA, PACIENTE) se eliminan.
+    """
+    texto = unicodedata.normalize("NFKC", texto).translate(_TRADUCCION_TIPOGRAFICA)
+    texto = texto.replace("\r\n", "\n").replace("\r", "\n")
+    campos = {c.strip().upper() for c in campos_ignorados if c.strip()}
+    lineas = []
+    for linea in texto.split("\n"):
+        linea = _ESPACIOS.sub(" ", linea).strip()
+        if campos and ":" in linea and linea.split(":", 1)[0].strip().upper() in campos:
+            continue
+        lineas.append(linea)
+    return _LINEAS_VACIAS.sub("\n\n", "\n".join(lineas)).strip()
+
+def codificar(texto: str, compresion: str = "zlib") -> bytes:
+    """Serializa una respuesta para Redis aplicando la compresión indicada."""
+    datos = texto.encode("utf-8")
+    if compresion == "zstd" and zstandard is not None:
+        return _ZSTD + zstandard.ZstdCompressor(level=3).compress(datos)
+    if compresion in ("zlib", "zstd"):
+        return _ZLIB + zlib.compress(datos, 6)
+    return datos
+
+def decodificar(valor: bytes) -> str:
+    """Inverso de `codificar`; acepta también entradas sin comprimir."""
+    if valor[:1] == _ZLIB:
+        return zlib.decompress(valor[1:]).decode("utf-8")
+    if valor[:1] == _ZSTD:
+        if zstandard is None:
+            raise ValueError("Entrada comprimida con zstd pero 'zstandard' no está instalado")
+        return zstandard.ZstdDecompressor().decompress(valor[1:]).decode("utf-8")
+    return valor.decode("utf-8")
+
+
+class CacheLRU:
+    """LRU en memoria acotada por el tamaño total (bytes UTF-8) de los valores."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes_usados = 0
+        self.evictions = 0
+        self._datos: "OrderedDict[str, str]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        valor = self._datos.get(key)
+        if valor is not None:
+            self._datos.move_to_end(key)
+        return valor
+
+    def set(self, key: str, valor: str):
+        tamano = len(valor.encode("utf-8"))
+        if tamano > self.max_bytes:
+            return
+        if key in self._datos:
+            self.bytes_usados -= len(self._datos.pop(key).encode("utf-8"))
+        self._datos[key] = valor
+        self.bytes_usados += tamano
+        while self.bytes_usados > self.max_bytes:
+            _, expulsado = self._datos.popitem(last=False)
+            self.bytes_usados -= len(expulsado.encode("utf-8"))
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+
+class CacheDosNiveles:
+    """L1 en memoria delante de Redis, con reconexión automática y estadísticas."""
+
+    def __init__(
+        self,
+        redis_url: str,
+        ttl: timedelta,
+        l1_max_bytes: int = 32 * 1024 * 1024,
+        compresion: str = "zlib",
+        reconnect_interval: float = 5.0,
+        redis_enabled: bool = True,
+    ):
+        self.redis_url = redis_url
+        self.ttl = ttl
+        self.compresion = compresion
+        self.reconnect_interval = reconnect_interval
+        self.redis_enabled = redis_enabled
+        self.redis: Optional[aioredis.Redis] = None
+        self.l1 = CacheLRU(l1_max_bytes)
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "errors": 0}
+        self._reconexion: Optional[asyncio.Task] = None
+
+    async def conectar(self):
+        """Conecta con Redis; si falla, programa reintentos en segundo plano."""
+        if not self.redis_enabled:
+            return
+        if not await self._intentar_conexion():
+            self._programar_reconexion()
+
+    async def cerrar(self):
+        if self._reconexion:
+            self._reconexion.cancel()
+        if self.redis:
+            await self.redis.aclose()
+
+    async def _intentar_conexion(self) -> bool:
+        cliente = aioredis.from_url(self.redis_url, decode_responses=False, socket_connect_timeout=1)
+        try:
+            await cliente.ping()
+        except Exception as e:
+            logger.warning("cache_connection_failed", error=str(e))
+            await cliente.aclose()
+            return False
+        self.redis = cliente
+        logger.info("cache_connected", url=self.redis_url)
+        return True
+
+    def _programar_reconexion(self):
+        if self._reconexion is None or self._reconexion.done():
+            self._reconexion = asyncio.create_task(self._bucle_reconexion())
+
+    async def _bucle_reconexion(self):
+        while not await self._intentar_conexion():
+            await asyncio.sleep(self.reconnect_interval)
+
+    async def _marcar_caido(self, error: Exception):
+        """Descarta la conexión rota (L1 sigue activa) y arranca la reconexión."""
+        logger.warning("cache_connection_lost", error=str(error))
+        cliente, self.redis = self.redis, None
+        if cliente:
+            try:
+                await cliente.aclose()
+            except Exception:
+                pass
+        self._programar_reconexion()
+
+    async def get(self, key: str) -> Optional[str]:
+        valor = self.l1.get(key)
+        if valor is not None:
+            self.stats["l1_hits"] += 1
+            CACHE_LOOKUPS.labels(agent=agente_actual.get(), result="l1_hit").inc()
+            return valor
+
+        if self.redis:
+            try:
+                crudo = await self.redis.get(key)
+                if crudo is not None:
+                    valor = decodificar(crudo)
+                    self.l1.set(key, valor)
+                    self.stats["l2_hits"] += 1
+                    CACHE_LOOKUPS.labels(agent=agente_actual.get(), result="l2_hit").inc()
+                    return valor
+            except (RedisConnectionError, RedisTimeoutError, OSError) as e:
+                self.stats["errors"] += 1
+                await self._marcar_caido(e)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error("cache_read_error", error=str(e))
+
+        self.stats["misses"] += 1
+        CACHE_LOOKUPS.labels(agent=agente_actual.get(), result="miss").inc()
+        return None
+
+    async def set(self, key: str, valor: str):
+        self.l1.set(key, valor)
+        if not self.redis:
+            return
+        try:
+            await self.redis.setex(key, self.ttl, codificar(valor, self.compresion))
+        except (RedisConnectionError, RedisTimeoutError, OSError) as e:
+            self.stats["errors"] += 1
+            await self._marcar_caido(e)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error("cache_write_error", error=str(e))
+
+    def estadisticas(self) -> Dict[str, object]:
+        consultas = self.stats["l1_hits"] + self.stats["l2_hits"] + self.stats["misses"]
+        aciertos = self.stats["l1_hits"] + self.stats["l2_hits"]
+        return {
+            **self.stats,
+            "hit_ratio": aciertos / consultas if consultas else 0.0,
+            "l1_items": len(self.l1),
+            "l1_bytes": self.l1.bytes_usados,
+            "l1_max_bytes": self.l1.max_bytes,
+            "l1_evictions": self.l1.evictions,
+            "compresion": self.compresion if self.compresion != "zstd" or zstandard else "zlib",
+            "redis_connected": self.redis is not None,
+        }
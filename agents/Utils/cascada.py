@@ -0,0 +1,97 @@
+"""
+Cascada de modelos por agente: primero un modelo rápido y, solo si su reporte no pasa
+la verificación, el modelo grande.
+
+La verificación escala cuando:
+- falta alguna de las secciones numeradas del reporte,
+- la certeza declarada (`CERTEZA: NN%`) es baja o no aparece,
+- la urgencia es ALTO o CRÍTICO (los casos graves siempre los revisa el modelo grande).
+
+Cada petición puede elegir un nivel: "fast" (solo el modelo rápido), "balanced"
+(cascada) o "quality" (directamente el modelo grande).
+"""
+
+import os
+import re
+import unicodedata
+from typing import NamedTuple, Optional
+from prometheus_client import Counter
+from .compactacion import SECCIONES, extraer_secciones
+
+NIVELES = ("fast", "balanced", "quality")
+
+CASCADE_COUNTER = Counter('agent_cascade_total', 'Model cascade outcomes per agent', ['agent', 'outcome', 'reason'])
+
+INSTRUCCION_CERTEZA = (
+    "\n\nAl final añade una línea `CERTEZA: NN%` con tu confianza (0-100%) en el diagnóstico principal."
+)
+
+_CERTEZA = re.compile(r"CERTEZA\W{0,10}(\d{1,3})\s*%", re.IGNORECASE)
+_URGENCIA_GRAVE = re.compile(r"\b(ALTO|ALTA|CRITICO|CRITICA)\b")
+
+
+class ResultadoCascada(NamedTuple):
+    texto: str
+    modelo: str
+    escalado: bool
+    motivo: Optional[str]
+
+
+def _sin_acentos(texto: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", texto) if unicodedata.category(c) != "Mn")
+
+
+class PoliticaCascada:
+    """Modelos y umbral de certeza de la cascada de un agente."""
+
+    def __init__(
+        self,
+        agente: str,
+        modelo_rapido: str,
+        modelo_grande: str,
+        certeza_minima: int = 70,
+        nivel_por_defecto: str = "balanced"
+    ):
+        self.agente = agente
+        self.modelo_rapido = modelo_rapido
+        self.modelo_grande = modelo_grande
+        self.certeza_minima = certeza_minima
+        self.nivel_por_defecto = nivel_por_defecto if nivel_por_defecto in NIVELES else "balanced"
+
+    @classmethod
+    def desde_entorno(cls, agente: str, modelo_grande: str) -> Optional["PoliticaCascada"]:
+        """
+        Política de `agente` según CASCADE_* (p. ej. CASCADE_MIN_CERTAINTY_RETINA sobrescribe
+        CASCADE_MIN_CERTAINTY para ese agente). None si la cascada está desactivada.
+        """
+        def valor(nombre: str, defecto: str) -> str:
+            return os.environ.get(f"{nombre}_{agente}", os.environ.get(nombre, defecto))
+
+        if valor("CASCADE_ENABLED", "false").lower() != "true":
+            return None
+        return cls(
+            agente=agente,
+            modelo_rapido=valor("CASCADE_FAST_MODEL", "llama-3.1-8b-instant"),
+            modelo_grande=valor("CASCADE_LARGE_MODEL", modelo_grande),
+            certeza_minima=int(valor("CASCADE_MIN_CERTAINTY", "70")),
+            nivel_por_defecto=valor("CASCADE_DEFAULT_TIER", "balanced"),
+        )
+
+    def nivel(self, solicitado: Optional[str]) -> str:
+        return solicitado if solicitado in NIVELES else self.nivel_por_defecto
+
+    def motivo_escalado(self, reporte: str) -> Optional[str]:
+        """Por qué el reporte del modelo rápido no basta (None si se acepta)."""
+        secciones = extraer_secciones(reporte)
+        faltantes = [clave for clave, _, _ in SECCIONES if not secciones.get(clave)]
+        if faltantes:
+            return "missing_sections"
+        urgencia = _sin_acentos(" ".join(secciones["URGENCIA"])).upper()
+        if _URGENCIA_GRAVE.search(urgencia):
+            return "high_urgency"
+        certeza = _CERTEZA.search(reporte)
+        if certeza is None:
+            return "no_certainty"
+        if int(certeza.group(1)) < self.certeza_minima:
+            return "low_certainty"
+        return None
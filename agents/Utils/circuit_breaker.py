@@ -0,0 +1,265 @@
+"""
+Circuit breaker compartido entre réplicas.
+
+- El estado vive en Redis, así que todas las réplicas abren y cierran a la vez.
+- Abre cuando la tasa de error en una ventana deslizante (buckets por tiempo) supera
+  el umbral con un volumen mínimo de peticiones.
+- Tras `reset_timeout` pasa a half-open y solo deja pasar `max_probes` sondas
+  concurrentes; cierra cuando `max_probes` sondas terminan bien y reabre al primer fallo.
+  Una sonda cancelada devuelve su hueco con `liberar_sonda()`; si ni eso llega a ocurrir,
+  los huecos caducan a los `reset_timeout` segundos.
+Sin Redis se usa un estado local equivalente.
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Tuple
+from prometheus_client import Counter, Gauge
+import structlog
+
+logger = structlog.get_logger()
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_VALOR_ESTADO = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = Gauge('groq_circuit_breaker_state', 'Circuit breaker state (0=closed, 1=half-open, 2=open)', ['breaker'])
+BREAKER_TRANSITIONS = Counter('groq_circuit_breaker_transitions_total', 'Circuit breaker state transitions', ['breaker', 'state'])
+BREAKER_REJECTED = Counter('groq_circuit_breaker_rejected_total', 'Calls rejected by the circuit breaker', ['breaker'])
+
+# KEYS: open, half_open, probes. ARGV: max_probes, probe_ttl_ms
+# Devuelve {permitido (0/1), es_sonda (0/1), ms_hasta_half_open}
+_PERMITIR = """
+local pttl = redis.call('PTTL', KEYS[1])
+if pttl > 0 then return {0, 0, pttl} end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    local n = redis.call('INCR', KEYS[3])
+    redis.call('PEXPIRE', KEYS[3], tonumber(ARGV[2]))
+    if n > tonumber(ARGV[1]) then
+        redis.call('DECR', KEYS[3])
+        return {0, 0, 0}
+    end
+    return {1, 1, 0}
+end
+return {1, 0, 0}
+"""
+
+# KEYS: open, half_open, probes, probe_ok, bucket actual, buckets de la ventana...
+# ARGV: exito, es_sonda, max_probes, reset_ms, min_requests, failure_rate, bucket_ttl_ms
+_REGISTRAR = """
+local exito, sonda = ARGV[1] == '1', ARGV[2] == '1'
+local function abrir()
+    redis.call('SET', KEYS[1], '1', 'PX', tonumber(ARGV[4]))
+    redis.call('SET', KEYS[2], '1')
+    redis.call('DEL', KEYS[3], KEYS[4])
+    return 'open'
+end
+if sonda then
+    if not exito then return abrir() end
+    local ok = redis.call('INCR', KEYS[4])
+    redis.call('DECR', KEYS[3])
+    if ok >= tonumber(ARGV[3]) then
+        redis.call('DEL', KEYS[2], KEYS[3], KEYS[4])
+        for i = 6, #KEYS do redis.call('DEL', KEYS[i]) end
+        return 'closed'
+    end
+    return 'half_open'
+end
+redis.call('HINCRBY', KEYS[5], exito and 'ok' or 'fail', 1)
+redis.call('PEXPIRE', KEYS[5], tonumber(ARGV[7]))
+if exito or redis.call('EXISTS', KEYS[1]) == 1 then return 'unchanged' end
+local ok, fail = 0, 0
+for i = 6, #KEYS do
+    local d = redis.call('HMGET', KEYS[i], 'ok', 'fail')
+    ok = ok + (tonumber(d[1]) or 0)
+    fail = fail + (tonumber(d[2]) or 0)
+end
+local total = ok + fail
+if total >= tonumber(ARGV[5]) and fail / total >= tonumber(ARGV[6]) then return abrir() end
+return 'unchanged'
+"""
+
+# KEYS: probes. Devuelve el hueco de una sonda sin resultado (si sigue contada)
+_LIBERAR = """
+if tonumber(redis.call('GET', KEYS[1]) or '0') > 0 then redis.call('DECR', KEYS[1]) end
+return 0
+"""
+
+
+class CircuitBreakerOpenException(Exception):
+    pass
+
+
+class _EstadoLocal:
+    """Estado en memoria con la misma semántica que los scripts Lua (sin Redis)."""
+
+    def __init__(self):
+        self.abierto_hasta = 0.0
+        self.half_open = False
+        self.sondas = 0
+        self.sondas_ok = 0
+        self.sondas_caducan = 0.0
+        self.buckets: Dict[int, List[int]] = {}
+
+    def permitir(self, max_probes: int, probe_ttl: float) -> Tuple[bool, bool, float]:
+        ahora = time.time()
+        if self.abierto_hasta > ahora:
+            return False, False, self.abierto_hasta - ahora
+        if self.half_open:
+            # Como el PEXPIRE de la clave `probes`: los huecos caducan si nadie los devuelve
+            if self.sondas_caducan <= ahora:
+                self.sondas = 0
+            if self.sondas >= max_probes:
+                return False, False, 0.0
+            self.sondas += 1
+            self.sondas_caducan = ahora + probe_ttl
+            return True, True, 0.0
+        return True, False, 0.0
+
+    def liberar_sonda(self):
+        self.sondas = max(0, self.sondas - 1)
+
+    def registrar(self, exito: bool, sonda: bool, bucket: int, ventana: List[int], cb: "CircuitBreaker") -> str:
+        if sonda:
+            if not exito:
+                return self._abrir(cb.reset_timeout)
+            self.sondas_ok += 1
+            self.sondas = max(0, self.sondas - 1)
+            if self.sondas_ok >= cb.max_probes:
+                self.half_open, self.sondas, self.sondas_ok = False, 0, 0
+                self.buckets.clear()
+                return CLOSED
+            return HALF_OPEN
+        ok_fail = self.buckets.setdefault(bucket, [0, 0])
+        ok_fail[0 if exito else 1] += 1
+        for viejo in [b for b in self.buckets if b not in ventana]:
+            del self.buckets[viejo]
+        if exito or self.abierto_hasta > time.time():
+            return "unchanged"
+        ok = sum(self.buckets.get(b, [0, 0])[0] for b in ventana)
+        fail = sum(self.buckets.get(b, [0, 0])[1] for b in ventana)
+        if ok + fail >= cb.min_requests and fail / (ok + fail) >= cb.failure_rate:
+            return self._abrir(cb.reset_timeout)
+        return "unchanged"
+
+    def _abrir(self, reset_timeout: float) -> str:
+        self.abierto_hasta = time.time() + reset_timeout
+        self.half_open = True
+        self.sondas = self.sondas_ok = 0
+        return OPEN
+
+
+class CircuitBreaker:
+    """Circuit breaker con ventana deslizante de errores y sondas limitadas en half-open."""
+
+    def __init__(
+        self,
+        obtener_redis: Callable[[], Any],
+        nombre: str = "groq",
+        failure_rate: float = 0.5,
+        min_requests: int = 5,
+        window_seconds: int = 60,
+        buckets: int = 6,
+        reset_timeout: float = 60.0,
+        max_probes: int = 2,
+    ):
+        self.obtener_redis = obtener_redis
+        self.nombre = nombre
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.bucket_seconds = max(1, window_seconds // buckets)
+        self.buckets = buckets
+        self.reset_timeout = reset_timeout
+        self.max_probes = max_probes
+        self.prefijo = f"groq:breaker:{nombre}"
+        self.estado = CLOSED
+        self.abierto_hasta = 0.0  # según la última respuesta (Redis o estado local)
+        self._local = _EstadoLocal()
+        BREAKER_STATE.labels(breaker=nombre).set(0)
+
+    def _ventana(self) -> Tuple[int, List[int]]:
+        actual = int(time.time()) // self.bucket_seconds
+        return actual, [actual - i for i in range(self.buckets)]
+
+    def _claves_estado(self) -> List[str]:
+        return [f"{self.prefijo}:open", f"{self.prefijo}:half_open", f"{self.prefijo}:probes", f"{self.prefijo}:probe_ok"]
+
+    def _actualizar_estado(self, estado: str):
+        if estado == "unchanged" or estado == self.estado:
+            return
+        logger.warning("circuit_breaker_transition", breaker=self.nombre, previous=self.estado, state=estado)
+        self.estado = estado
+        BREAKER_STATE.labels(breaker=self.nombre).set(_VALOR_ESTADO[estado])
+        BREAKER_TRANSITIONS.labels(breaker=self.nombre, state=estado).inc()
+
+    def abierto(self) -> bool:
+        """Si el circuito estaba abierto la última vez que se consultó (sin ir a Redis)."""
+        return self.estado == OPEN and time.time() < self.abierto_hasta
+
+    async def permitir(self) -> bool:
+        """
+        Autoriza una llamada. Devuelve True si la llamada es una sonda de half-open.
+
+        Raises:
+            CircuitBreakerOpenException: si el circuito está abierto o no quedan sondas.
+        """
+        redis = self.obtener_redis()
+        resultado = None
+        if redis is not None:
+            try:
+                permitido, sonda, pttl = await redis.eval(
+                    _PERMITIR, 3, *self._claves_estado()[:3], self.max_probes, int(self.reset_timeout * 1000)
+                )
+                resultado = (bool(permitido), bool(sonda), int(pttl) / 1000)
+            except Exception as e:
+                logger.warning("circuit_breaker_redis_error", error=str(e))
+        if resultado is None:
+            resultado = self._local.permitir(self.max_probes, self.reset_timeout)
+
+        permitido, sonda, restante = resultado
+        if not permitido:
+            BREAKER_REJECTED.labels(breaker=self.nombre).inc()
+            if restante > 0:
+                self.abierto_hasta = time.time() + restante
+                self._actualizar_estado(OPEN)
+                raise CircuitBreakerOpenException(f"Circuit open. Retrying in {restante:.0f}s")
+            self._actualizar_estado(HALF_OPEN)
+            raise CircuitBreakerOpenException("Circuit half-open. Probe slots busy")
+        self._actualizar_estado(HALF_OPEN if sonda else CLOSED)
+        return sonda
+
+    async def liberar_sonda(self, sonda: bool = True):
+        """
+        Devuelve el hueco de una sonda que terminó sin resultado (cancelada por un deadline,
+        por hedging o por el cliente) sin contarla como éxito ni como fallo.
+        """
+        if not sonda:
+            return
+        redis = self.obtener_redis()
+        if redis is not None:
+            try:
+                await redis.eval(_LIBERAR, 1, self._claves_estado()[2])
+                return
+            except Exception as e:
+                logger.warning("circuit_breaker_redis_error", error=str(e))
+        self._local.liberar_sonda()
+
+    async def registrar(self, exito: bool, sonda: bool = False):
+        """Registra el resultado de una llamada autorizada por `permitir()`."""
+        actual, ventana = self._ventana()
+        redis = self.obtener_redis()
+        estado = None
+        if redis is not None:
+            try:
+                claves = self._claves_estado() + [f"{self.prefijo}:w:{b}" for b in [actual] + ventana]
+                estado = await redis.eval(
+                    _REGISTRAR, len(claves), *claves,
+                    int(exito), int(sonda), self.max_probes, int(self.reset_timeout * 1000),
+                    self.min_requests, self.failure_rate, self.bucket_seconds * self.buckets * 1000,
+                )
+                estado = estado.decode() if isinstance(estado, bytes) else estado
+            except Exception as e:
+                logger.warning("circuit_breaker_redis_error", error=str(e))
+        if estado is None:
+            estado = self._local.registrar(exito, sonda, actual, ventana, self)
+        if estado == OPEN:
+            self.abierto_hasta = time.time() + self.reset_timeout
+        self._actualizar_estado(estado)
@@ -1,14 +1,26 @@
 """
 Cliente para API de Groq con patrones de resiliencia.
-Incluye: Circuit Breaker, Retry Backoff, Caching (Redis), Rate Limiting handling.
+Incluye: Circuit Breaker, Retry Backoff, Caching (Redis), Rate Limiting handling y un
+pool de API keys (GROQ_API_KEYS) repartido según la cuota restante de cada una.
+
+Se ofrecen dos variantes con la misma configuración:
+- ClienteGroq: API síncrona (scripts y CLI).
+- ClienteGroqAsync: API asíncrona (AsyncGroq + redis.asyncio) para los microservicios,
+  de modo que un pod pueda mantener muchas llamadas a Groq en vuelo sin bloquear el event loop.
+  Implementa la interfaz `Proveedor`; `cliente_openai` la reutiliza para otras APIs
+  compatibles con OpenAI (Gemini) y `enrutador` reparte entre proveedores.
 """
 
 import os
-import json
+import asyncio
+import logging
 import hashlib
 import time
-from typing import Optional, Dict, Any, Generator
-from groq import Groq, APIConnectionError, RateLimitError, APIStatusError
+from typing import Optional, Dict, Any, AsyncGenerator, AsyncIterator, List, Mapping, Tuple
+from groq import (
+    Groq, AsyncGroq, APIConnectionError, RateLimitError, APIStatusError, AuthenticationError, PermissionDeniedError
+)
+from groq.types.chat import ChatCompletion, ChatCompletionChunk
 import redis
 from tenacity import (
     retry,
@@ -18,59 +30,231 @@ from tenacity import (
     before_sleep_log
 )
 import structlog
+from contextvars import ContextVar
 from datetime import timedelta
+from opentelemetry import trace
+from .single_flight import SingleFlight, RedisSingleFlight
+from .cache import CacheDosNiveles, canonicalizar, codificar, decodificar
+from .rate_limit import LimitadorTasa, estimar_tokens, parsear_duracion
+from .circuit_breaker import CircuitBreaker, CircuitBreakerOpenException
+from .pool_claves import ClaveGroq, PoolClavesGroq
+from .proveedores import EstadisticasRodantes
+from .metricas import (
+    GROQ_IN_FLIGHT, GROQ_LATENCY, GROQ_RETRIES, GROQ_TOKENS, GROQ_TTFT, agente_actual, resultado_error
+)
+from .trazas import tracer
 
 # Configuración de Logging
 logger = structlog.get_logger()
 
-class CircuitBreakerOpenException(Exception):
-    pass
+_log_reintento = before_sleep_log(logger, logging.WARNING)
+
+# Número de intento de la llamada en curso (lo fija tenacity antes de cada intento)
+intento_actual: ContextVar[int] = ContextVar("intento_actual", default=1)
+
+def _antes_de_intentar(retry_state):
+    """Cierra el span de la pausa anterior, si la hubo, y anota el número de intento."""
+    pausa = getattr(retry_state, "span_pausa", None)
+    if pausa is not None:
+        pausa.end()
+        retry_state.span_pausa = None
+    intento_actual.set(retry_state.attempt_number)
+
+def _antes_de_reintentar(retry_state):
+    """Registra el reintento en el log y en `groq_retries_total` y abre el span de la pausa."""
+    _log_reintento(retry_state)
+    error = retry_state.outcome.exception()
+    motivo = resultado_error(error) if error else "unknown"
+    GROQ_RETRIES.labels(agent=agente_actual.get(), reason=motivo).inc()
+    retry_state.span_pausa = tracer.start_span("groq.retry_wait", attributes={
+        "groq.attempt": retry_state.attempt_number,
+        "groq.retry_reason": motivo,
+        "groq.wait_seconds": retry_state.upcoming_sleep,
+    })
+
+# Política de reintentos compartida (tenacity detecta corrutinas y usa asyncio.sleep)
+reintentar_groq = retry(
+    retry=retry_if_exception_type((APIConnectionError, RateLimitError, APIStatusError)),
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=1, min=2, max=60),
+    before=_antes_de_intentar,
+    before_sleep=_antes_de_reintentar
+)
+
+def registrar_uso(modelo: str, prompt_tokens: int, completion_tokens: int):
+    agente = agente_actual.get()
+    GROQ_TOKENS.labels(agent=agente, model=modelo, kind="prompt").inc(prompt_tokens)
+    GROQ_TOKENS.labels(agent=agente, model=modelo, kind="completion").inc(completion_tokens)
+
+def es_fallo_proveedor(error: Exception) -> bool:
+    """Errores que indican caída del proveedor (cuentan para el circuit breaker)."""
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500
+    return False
+
+class _ClienteGroqBase:
+    """Configuración y utilidades comunes a ambos clientes."""
+
+    # Nombre del proveedor (caché, Redis, breaker) y prefijo de sus variables de entorno
+    proveedor = "groq"
+    entorno = "GROQ"
+    modelo_por_defecto = "llama-3.3-70b-versatile"
+
+    def __init__(
+        self, api_key: Optional[str] = None, redis_url: Optional[str] = None, api_keys: Optional[List[str]] = None
+    ):
+        """
+        Lee la configuración del entorno.
+
+        Args:
+            api_key: API key de Groq.
+            redis_url: URL de conexión a Redis para caché.
+            api_keys: Pool de API keys (por defecto GROQ_API_KEYS); tiene prioridad sobre `api_key`.
+        """
+        self.api_keys = PoolClavesGroq.leer_claves(api_key, api_keys, self.entorno)
+        if not self.api_keys:
+            raise ValueError(f"Se requiere {self.entorno}_API_KEY")
+        self.api_key = self.api_keys[0]
+
+        # Redis para caché
+        self.redis_url = redis_url or os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+        self.cache_enabled = os.environ.get("ENABLE_CACHE", "true").lower() == "true"
+        self.cache_ttl = timedelta(seconds=int(os.environ.get("CACHE_TTL_SECONDS", 24 * 3600)))
+        self.cache_compresion = os.environ.get("CACHE_COMPRESSION", "zlib").lower() # zlib, zstd, none
+        # Canonicalización de claves: normaliza espacios/Unicode y puede ignorar campos de cabecera
+        self.cache_key_canonical = os.environ.get("CACHE_KEY_CANONICAL", "true").lower() == "true"
+        self.cache_key_ignored_fields = [
+            campo for campo in os.environ.get("CACHE_KEY_IGNORED_FIELDS", "").split(",") if campo.strip()
+        ]
+
+        # Configuración de modelo (generación y temperatura comunes salvo <PROVEEDOR>_MAX_TOKENS/_TEMP)
+        self.modelo = os.environ.get(f"{self.entorno}_MODEL", self.modelo_por_defecto)
+        self.max_tokens = int(self._config("MAX_TOKENS", 4096))
+        self.temperature = float(self._config("TEMP", 0.7))
+
+        # Límites del proveedor (por organización) compartidos entre réplicas
+        self.rate_limit_enabled = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+        self.rpm_limit = int(os.environ.get(f"{self.entorno}_RPM_LIMIT", 30))
+        self.tpm_limit = int(os.environ.get(f"{self.entorno}_TPM_LIMIT", 12000))
+        self.completion_tokens_estimados = int(self._config("EST_COMPLETION_TOKENS", 1024))
+
+        # Circuit Breaker
+        self.reset_timeout = float(os.environ.get("BREAKER_RESET_TIMEOUT", 60))  # seconds
+
+    def _config(self, nombre: str, defecto: Any) -> Any:
+        """`<PROVEEDOR>_<nombre>`, o el valor de Groq si el proveedor no define uno propio."""
+        return os.environ.get(f"{self.entorno}_{nombre}", os.environ.get(f"GROQ_{nombre}", defecto))
+
+    def _cliente_de_clave(self, cliente: Any, key: str) -> Any:
+        """Copia de `cliente` para `key` que comparte su pool de conexiones HTTP."""
+        return cliente if key == self.api_key else cliente.with_options(api_key=key)
+
+    def _crear_pool(self, cliente: Any) -> PoolClavesGroq:
+        """Pool de keys, cada una con su cliente (`_cliente_de_clave`)."""
+        claves = [ClaveGroq(key, self._cliente_de_clave(cliente, key)) for key in self.api_keys]
+        return PoolClavesGroq(
+            claves,
+            reposo_por_defecto=float(os.environ.get("GROQ_KEY_COOLDOWN_SECONDS", 5)),
+            max_espera=float(os.environ.get("RATE_LIMIT_MAX_WAIT", 120)),
+        )
+
+    def _actualizar_clave(self, clave: ClaveGroq, error: Exception) -> Optional[float]:
+        """Aplica al pool el error de una key: reposo tras un 429, retirada tras un 401/403. Devuelve el reposo."""
+        if isinstance(error, APIStatusError):
+            self.pool.registrar_cabeceras(clave, error.response.headers)
+        if isinstance(error, RateLimitError):
+            reposo = parsear_duracion(error.response.headers.get("retry-after")) or self.pool.reposo_por_defecto
+            self.pool.enfriar(clave, reposo)
+            return reposo
+        if isinstance(error, (AuthenticationError, PermissionDeniedError)):
+            self.pool.retirar(clave, type(error).__name__)
+        return None
+
+    def _temperatura(self, temperature: Optional[float]) -> float:
+        """Temperatura efectiva (0.0 es un valor válido, no 'usar el predeterminado')."""
+        return self.temperature if temperature is None else temperature
+
+    def _get_cache_key(
+        self,
+        prompt: str,
+        system_prompt: str,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        formato_json: bool = False
+    ) -> str:
+        """
+        Genera una clave única para caché basada en los inputs (canonicalizados si está activo).
+        Cada proveedor y modelo tiene su espacio (`<proveedor>:cache:<modelo>:`), de modo que una
+        respuesta de respaldo nunca se sirve como si fuera del modelo principal.
+        """
+        if self.cache_key_canonical:
+            prompt = canonicalizar(prompt, self.cache_key_ignored_fields)
+            system_prompt = canonicalizar(system_prompt)
+        content = f"{prompt}|{system_prompt}|{model}|{temperature}|{max_tokens}"
+        if formato_json:
+            content += "|json_object"
+        return f"{self.proveedor}:cache:{model}:{hashlib.sha256(content.encode()).hexdigest()}"
+
+    def _estimar_tokens_peticion(
+        self,
+        prompt: str,
+        system_prompt: str,
+        completion_tokens: Optional[int] = None,
+        max_tokens: Optional[int] = None
+    ) -> int:
+        """Tokens que se reservan en el bucket TPM antes de conocer el uso real."""
+        if completion_tokens is None:
+            completion_tokens = min(max_tokens or self.max_tokens, self.completion_tokens_estimados)
+        return estimar_tokens(prompt) + estimar_tokens(system_prompt) + completion_tokens
 
-class ClienteGroq:
+    @staticmethod
+    def _construir_mensajes(prompt: str, system_prompt: str) -> List[Dict[str, str]]:
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+
+class ClienteGroq(_ClienteGroqBase):
     """
     Cliente robusto para interactuar con la API de Groq.
     Implementa patrones de diseño para microservicios cloud-native.
     """
-    
-    def __init__(self, api_key: Optional[str] = None, redis_url: Optional[str] = None):
+
+    def __init__(
+        self, api_key: Optional[str] = None, redis_url: Optional[str] = None, api_keys: Optional[List[str]] = None
+    ):
         """
         Inicializa el cliente de Groq mejorado.
-        
+
         Args:
             api_key: API key de Groq.
             redis_url: URL de conexión a Redis para caché.
+            api_keys: Pool de API keys (por defecto GROQ_API_KEYS).
         """
-        self.api_key = api_key or os.environ.get("GROQ_API_KEY")
-        if not self.api_key:
-            raise ValueError("Se requiere GROQ_API_KEY")
-            
+        super().__init__(api_key=api_key, redis_url=redis_url, api_keys=api_keys)
         self.client = Groq(api_key=self.api_key)
-        
-        # Redis para caché
-        self.redis_url = redis_url or os.environ.get("REDIS_URL", "redis://localhost:6379/0")
-        self.cache_enabled = os.environ.get("ENABLE_CACHE", "true").lower() == "true"
+        self.pool = self._crear_pool(self.client)
         self.redis = None
-        
+
+        # Circuit Breaker State (Simple implementation, local al proceso)
+        self.failure_count = 0
+        self.failure_threshold = 5
+        self.last_failure_time = 0
+
         if self.cache_enabled:
             try:
-                self.redis = redis.from_url(self.redis_url, decode_responses=True, socket_connect_timeout=1)
+                self.redis = redis.from_url(self.redis_url, decode_responses=False, socket_connect_timeout=1)
                 self.redis.ping()
                 logger.info("cache_connected", url=self.redis_url)
             except Exception as e:
                 logger.warning("cache_connection_failed", error=str(e))
                 self.redis = None # Fallback sin caché
 
-        # Configuración de modelo
-        self.modelo = os.environ.get("GROQ_MODEL", "llama-3.3-70b-versatile")
-        self.max_tokens = int(os.environ.get("GROQ_MAX_TOKENS", 4096))
-        self.temperature = float(os.environ.get("GROQ_TEMP", 0.7))
-
-        # Circuit Breaker State (Simple implementation)
-        self.failure_count = 0
-        self.failure_threshold = 5
-        self.reset_timeout = 60  # seconds
-        self.last_failure_time = 0
-
     def _check_circuit_breaker(self):
         """Verifica si el circuito está abierto."""
         if self.failure_count >= self.failure_threshold:
@@ -79,22 +263,18 @@ class ClienteGroq:
                 raise CircuitBreakerOpenException(f"Circuit open. Retrying in {self.reset_timeout - time_since_failure:.0f}s")
             else:
                 # Half-open: Permite intentar de nuevo
-                self.failure_count = 0 
-
-    def _get_cache_key(self, prompt: str, system_prompt: str, model: str) -> str:
-        """Genera una clave única para caché basada en los inputs."""
-        content = f"{prompt}|{system_prompt}|{model}"
-        return f"groq:cache:{hashlib.sha256(content.encode()).hexdigest()}"
-
-    @retry(
-        retry=retry_if_exception_type((APIConnectionError, RateLimitError, APIStatusError)),
-        stop=stop_after_attempt(5),
-        wait=wait_exponential(multiplier=1, min=2, max=60),
-        before_sleep=before_sleep_log(logger, "warning")
-    )
+                self.failure_count = 0
+
+    def _registrar_fallo(self, error: Exception, clave: ClaveGroq):
+        self.failure_count += 1
+        self.last_failure_time = time.time()
+        logger.error("groq_request_failed", error=str(error), attempt=self.failure_count, key=clave.etiqueta)
+        self._actualizar_clave(clave, error)
+
+    @reintentar_groq
     def generar_respuesta(
-        self, 
-        prompt: str, 
+        self,
+        prompt: str,
         system_prompt: Optional[str] = None,
         temperature: Optional[float] = None
     ) -> str:
@@ -102,45 +282,55 @@ class ClienteGroq:
         Genera respuesta con retry, cache y circuit breaker.
         """
         self._check_circuit_breaker()
-        
+
         system_prompt = system_prompt or ""
-        
+
+        temperature = self._temperatura(temperature)
+
         # 1. Verificar Caché
         if self.redis:
-            cache_key = self._get_cache_key(prompt, system_prompt, self.modelo)
+            cache_key = self._get_cache_key(prompt, system_prompt, self.modelo, temperature, self.max_tokens)
             try:
                 cached = self.redis.get(cache_key)
                 if cached:
                     logger.info("cache_hit", key=cache_key)
-                    return cached
+                    return decodificar(cached)
             except Exception as e:
                 logger.error("cache_read_error", error=str(e))
 
-        # 2. Llamada a API
+        # 2. Llamada a API con la key más desahogada del pool
+        clave, espera = self.pool.elegir()
+        if espera > 0:
+            time.sleep(espera)
         try:
-            messages = []
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            messages.append({"role": "user", "content": prompt})
+            messages = self._construir_mensajes(prompt, system_prompt)
 
             start_time = time.time()
-            chat_completion = self.client.chat.completions.create(
-                messages=messages,
-                model=self.modelo,
-                temperature=temperature or self.temperature,
-                max_tokens=self.max_tokens,
-            )
+            try:
+                with self.pool.usar(clave):
+                    raw_response = clave.cliente.chat.completions.with_raw_response.create(
+                        messages=messages,
+                        model=self.modelo,
+                        temperature=temperature,
+                        max_tokens=self.max_tokens,
+                    )
+                    chat_completion = raw_response.parse()
+            except Exception as e:
+                GROQ_LATENCY.labels(agent=agente_actual.get(), model=self.modelo, outcome=resultado_error(e)).observe(time.time() - start_time)
+                raise
             duration = time.time() - start_time
-            
+            self.pool.registrar_cabeceras(clave, raw_response.headers)
+
             response_text = chat_completion.choices[0].message.content
-            
-            # Log metrics (podríamos pushear a prometheus aquí también)
+
+            GROQ_LATENCY.labels(agent=agente_actual.get(), model=self.modelo, outcome="success").observe(duration)
+            registrar_uso(self.modelo, chat_completion.usage.prompt_tokens, chat_completion.usage.completion_tokens)
             logger.info("groq_request_success", model=self.modelo, duration=duration, tokens=chat_completion.usage.total_tokens)
 
-            # 3. Guardar en Caché (TTL 24h)
+            # 3. Guardar en Caché
             if self.redis:
                 try:
-                    self.redis.setex(cache_key, timedelta(hours=24), response_text)
+                    self.redis.setex(cache_key, self.cache_ttl, codificar(response_text, self.cache_compresion))
                 except Exception as e:
                     logger.error("cache_write_error", error=str(e))
 
@@ -148,7 +338,384 @@ class ClienteGroq:
             return response_text
 
         except Exception as e:
-            self.failure_count += 1
-            self.last_failure_time = time.time()
-            logger.error("groq_request_failed", error=str(e), attempt=self.failure_count)
+            self._registrar_fallo(e, clave)
             raise
+
+
+class ClienteGroqAsync(_ClienteGroqBase):
+    """
+    Variante asíncrona de ClienteGroq para los servicios FastAPI.
+    Usa AsyncGroq, redis.asyncio y reintentos no bloqueantes, con caché en dos
+    niveles (LRU en memoria + Redis comprimido).
+    """
+
+    def __init__(
+        self, api_key: Optional[str] = None, redis_url: Optional[str] = None, api_keys: Optional[List[str]] = None
+    ):
+        """
+        Inicializa el cliente asíncrono. La conexión a Redis se valida en `conectar()`.
+
+        Args:
+            api_key: API key de Groq.
+            redis_url: URL de conexión a Redis para caché.
+            api_keys: Pool de API keys (por defecto GROQ_API_KEYS).
+        """
+        super().__init__(api_key=api_key, redis_url=redis_url, api_keys=api_keys)
+        self.client = self._crear_cliente()
+        self.pool = self._crear_pool(self.client)
+        # Latencia y errores recientes de la API, para el enrutador de proveedores
+        self.estadisticas = EstadisticasRodantes(ventana=float(os.environ.get("ROUTER_WINDOW_SECONDS", 60)))
+
+        self.cache: Optional[CacheDosNiveles] = None
+        if self.cache_enabled:
+            self.cache = CacheDosNiveles(
+                self.redis_url,
+                ttl=self.cache_ttl,
+                l1_max_bytes=int(os.environ.get("CACHE_L1_MAX_BYTES", 32 * 1024 * 1024)),
+                compresion=self.cache_compresion,
+                reconnect_interval=float(os.environ.get("CACHE_RECONNECT_INTERVAL", 5)),
+                redis_enabled=os.environ.get("CACHE_L2_REDIS", "true").lower() == "true",
+            )
+
+        # Single-flight: en proceso siempre; entre réplicas opcional (requiere Redis)
+        self.single_flight = SingleFlight()
+        self.single_flight_distribuido = os.environ.get("SINGLEFLIGHT_DISTRIBUTED", "false").lower() == "true"
+        self.redis_single_flight: Optional[RedisSingleFlight] = None
+
+        # Circuit breaker compartido entre réplicas (estado en Redis)
+        self.breaker = CircuitBreaker(
+            lambda: self.redis,
+            nombre=self.proveedor,
+            failure_rate=float(os.environ.get("BREAKER_FAILURE_RATE", 0.5)),
+            min_requests=int(os.environ.get("BREAKER_MIN_REQUESTS", 5)),
+            window_seconds=int(os.environ.get("BREAKER_WINDOW_SECONDS", 60)),
+            reset_timeout=self.reset_timeout,
+            max_probes=int(os.environ.get("BREAKER_HALF_OPEN_PROBES", 2)),
+        )
+
+        # Un bucket por key: cada una tiene los límites de su organización (una sola key
+        # conserva las claves de Redis de siempre)
+        if self.rate_limit_enabled:
+            for clave in self.pool.claves:
+                clave.limitador = LimitadorTasa(
+                    lambda: self.redis,
+                    rpm=self.rpm_limit,
+                    tpm=self.tpm_limit,
+                    prefijo=f"{self.proveedor}:ratelimit" + ("" if len(self.pool.claves) == 1 else f":{clave.etiqueta}"),
+                    max_espera=float(os.environ.get("RATE_LIMIT_MAX_WAIT", 120)),
+                )
+
+    def _crear_cliente(self) -> AsyncGroq:
+        """Cliente del SDK para la primera key (GROQ_BASE_URL permite apuntar a un servidor local)."""
+        return AsyncGroq(api_key=self.api_key)
+
+    async def _completar(self, clave: ClaveGroq, **parametros) -> Tuple[Mapping[str, str], ChatCompletion]:
+        """POST a chat/completions con la key `clave`; devuelve las cabeceras y la respuesta."""
+        raw_response = await clave.cliente.chat.completions.with_raw_response.create(**parametros)
+        return raw_response.headers, await raw_response.parse()
+
+    async def _abrir_stream(
+        self, clave: ClaveGroq, **parametros
+    ) -> Tuple[Mapping[str, str], AsyncIterator[ChatCompletionChunk]]:
+        """Como `_completar` en streaming: cabeceras y los fragmentos según llegan."""
+        stream = await clave.cliente.chat.completions.create(stream=True, **parametros)
+        return stream.response.headers, stream
+
+    @property
+    def redis(self):
+        """Conexión Redis vigente (None si la caché está caída o deshabilitada)."""
+        return self.cache.redis if self.cache else None
+
+    async def conectar(self):
+        """Conecta la caché (L2 en Redis) y el single-flight distribuido (llamar en el startup del servicio)."""
+        if not self.cache:
+            return
+        await self.cache.conectar()
+
+        if self.single_flight_distribuido:
+            self.redis_single_flight = RedisSingleFlight(
+                lambda: self.redis,
+                lock_ttl=float(os.environ.get("SINGLEFLIGHT_LOCK_TTL", 180)),
+                wait_timeout=float(os.environ.get("SINGLEFLIGHT_WAIT_TIMEOUT", 150)),
+            )
+
+    async def cerrar(self):
+        """Libera el pool HTTP de Groq y la conexión a Redis."""
+        await self.client.close()
+        if self.cache:
+            await self.cache.cerrar()
+
+    async def _leer_cache(self, cache_key: str) -> Optional[str]:
+        if not self.cache:
+            return None
+        with tracer.start_as_current_span("cache.lookup") as span:
+            valor = await self.cache.get(cache_key)
+            span.set_attribute("cache.hit", valor is not None)
+            return valor
+
+    async def _guardar_cache(self, cache_key: str, response_text: str):
+        if self.cache:
+            await self.cache.set(cache_key, response_text)
+
+    def estadisticas_cache(self) -> Dict[str, Any]:
+        return self.cache.estadisticas() if self.cache else {"enabled": False}
+
+    def estado(self) -> Dict[str, Any]:
+        """Proveedor, breaker, latencia y errores recientes y estado de cada key."""
+        return {
+            "provider": self.proveedor,
+            "model": self.modelo,
+            "breaker": self.breaker.estado,
+            **self.estadisticas.resumen(),
+            "keys": self.pool.estado(),
+        }
+
+    async def _elegir_clave(self) -> ClaveGroq:
+        """Key del pool para la llamada; si todas reposan tras un 429, espera a la primera libre."""
+        clave, espera = self.pool.elegir()
+        if espera > 0:
+            with tracer.start_as_current_span("groq.key_wait", attributes={"groq.key": clave.etiqueta}):
+                logger.info("groq_keys_resting", seconds=round(espera, 2), key=clave.etiqueta)
+                await asyncio.sleep(espera)
+        return clave
+
+    async def generar_respuesta(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        formato_json: bool = False,
+        modelo: Optional[str] = None
+    ) -> str:
+        """
+        Genera respuesta con retry, cache y circuit breaker sin bloquear el event loop.
+        Las peticiones idénticas en vuelo se agrupan y comparten una sola llamada a Groq.
+
+        Args:
+            max_tokens: Límite de tokens generados (p. ej. para ajustarse a un deadline).
+                Por defecto GROQ_MAX_TOKENS.
+            formato_json: Pide a Groq un objeto JSON (`response_format=json_object`).
+            modelo: Modelo a usar en lugar de GROQ_MODEL (p. ej. el rápido de una cascada).
+        """
+        system_prompt = system_prompt or ""
+        temperature = self._temperatura(temperature)
+        max_tokens = max_tokens or self.max_tokens
+        modelo = modelo or self.modelo
+        cache_key = self._get_cache_key(prompt, system_prompt, modelo, temperature, max_tokens, formato_json)
+
+        with tracer.start_as_current_span("groq.generate", attributes={
+            "agent": agente_actual.get(), "provider": self.proveedor, "groq.model": modelo, "groq.max_tokens": max_tokens, "groq.json": formato_json
+        }):
+            # 1. Verificar Caché
+            cached = await self._leer_cache(cache_key)
+            if cached:
+                logger.info("cache_hit", key=cache_key)
+                return cached
+
+            # 2. Llamada a API (una por clave en vuelo)
+            async def llamar() -> str:
+                if self.redis_single_flight:
+                    return await self.redis_single_flight.ejecutar(
+                        cache_key,
+                        lambda: self._llamar_api(cache_key, prompt, system_prompt, temperature, max_tokens, formato_json, modelo),
+                        lambda: self._leer_cache(cache_key),
+                    )
+                return await self._llamar_api(cache_key, prompt, system_prompt, temperature, max_tokens, formato_json, modelo)
+
+            return await self.single_flight.ejecutar(cache_key, llamar)
+
+    @reintentar_groq
+    async def _llamar_api(
+        self,
+        cache_key: str,
+        prompt: str,
+        system_prompt: str,
+        temperature: float,
+        max_tokens: int,
+        formato_json: bool = False,
+        modelo: Optional[str] = None
+    ) -> str:
+        """Llamada a Groq con reintentos; guarda el resultado en caché."""
+        modelo = modelo or self.modelo
+        tokens_estimados = self._estimar_tokens_peticion(prompt, system_prompt, max_tokens=max_tokens)
+        clave = await self._elegir_clave()
+        # El breaker va antes que el limitador: una llamada rechazada no gasta tokens del cubo
+        es_sonda = await self.breaker.permitir()
+        try:
+            if clave.limitador:
+                with tracer.start_as_current_span("rate_limit.acquire", attributes={"tokens": tokens_estimados}):
+                    await clave.limitador.adquirir(tokens_estimados)
+        except BaseException:
+            await self.breaker.liberar_sonda(es_sonda)
+            raise
+        agente = agente_actual.get()
+        try:
+            messages = self._construir_mensajes(prompt, system_prompt)
+            extra = {"response_format": {"type": "json_object"}} if formato_json else {}
+
+            start_time = time.time()
+            GROQ_IN_FLIGHT.labels(agent=agente).inc()
+            try:
+                with tracer.start_as_current_span("groq.chat_completion", kind=trace.SpanKind.CLIENT, attributes={
+                    "groq.model": modelo, "groq.attempt": intento_actual.get(), "groq.probe": es_sonda,
+                    "groq.key": clave.etiqueta,
+                }) as span, self.pool.usar(clave):
+                    cabeceras, chat_completion = await self._completar(
+                        clave,
+                        messages=messages,
+                        model=modelo,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        **extra,
+                    )
+                    span.set_attribute("groq.prompt_tokens", chat_completion.usage.prompt_tokens)
+                    span.set_attribute("groq.completion_tokens", chat_completion.usage.completion_tokens)
+            except BaseException as e:
+                GROQ_LATENCY.labels(agent=agente, model=modelo, outcome=resultado_error(e)).observe(time.time() - start_time)
+                if isinstance(e, Exception):  # una cancelación (deadline del llamante) no es culpa del proveedor
+                    self.estadisticas.registrar(False, time.time() - start_time)
+                raise
+            finally:
+                GROQ_IN_FLIGHT.labels(agent=agente).dec()
+            duration = time.time() - start_time
+            GROQ_LATENCY.labels(agent=agente, model=modelo, outcome="success").observe(duration)
+            self.estadisticas.registrar(True, duration)
+            registrar_uso(modelo, chat_completion.usage.prompt_tokens, chat_completion.usage.completion_tokens)
+
+            self.pool.registrar_cabeceras(clave, cabeceras)
+            if clave.limitador:
+                await clave.limitador.sincronizar_cabeceras(cabeceras)
+                await clave.limitador.registrar_uso(tokens_estimados, chat_completion.usage.total_tokens)
+
+            response_text = chat_completion.choices[0].message.content
+
+            logger.info(
+                "groq_request_success", provider=self.proveedor, model=modelo, duration=duration,
+                tokens=chat_completion.usage.total_tokens
+            )
+
+            await self.breaker.registrar(True, es_sonda)
+
+            # 3. Guardar en Caché
+            await self._guardar_cache(cache_key, response_text)
+
+            return response_text
+
+        except Exception as e:
+            await self._registrar_error(e, es_sonda, clave)
+            raise
+        except BaseException:
+            # Cancelada (deadline, hedging): sin resultado que registrar, pero la sonda se devuelve
+            await self.breaker.liberar_sonda(es_sonda)
+            raise
+
+    async def _registrar_error(self, error: Exception, es_sonda: bool, clave: ClaveGroq):
+        """
+        Informa al circuit breaker y al pool; ante un 429 la key reposa y su bucket se pausa
+        en todas las réplicas durante el Retry-After. Los errores que no son del proveedor
+        (429, 4xx) son neutros para el breaker: la sonda se devuelve sin éxito ni fallo.
+        """
+        logger.error("groq_request_failed", provider=self.proveedor, error=str(error), key=clave.etiqueta)
+        if es_fallo_proveedor(error):
+            await self.breaker.registrar(False, es_sonda)
+        else:
+            await self.breaker.liberar_sonda(es_sonda)
+        reposo = self._actualizar_clave(clave, error)
+        if clave.limitador and reposo:
+            await clave.limitador.pausar(reposo)
+
+    async def generar_respuesta_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Genera respuesta en modo streaming (fragmentos conforme llegan de Groq).
+
+        Un acierto de caché se emite como un único fragmento. Al completar el stream
+        el texto acumulado se guarda en caché, igual que en `generar_respuesta`.
+        No se reintenta: una vez emitidos fragmentos no es posible repetir la llamada.
+        """
+        system_prompt = system_prompt or ""
+        temperature = self._temperatura(temperature)
+        max_tokens = max_tokens or self.max_tokens
+        cache_key = self._get_cache_key(prompt, system_prompt, self.modelo, temperature, max_tokens)
+
+        # 1. Verificar Caché
+        cached = await self._leer_cache(cache_key)
+        if cached:
+            logger.info("cache_hit", key=cache_key, stream=True)
+            yield cached
+            return
+
+        # 2. Llamada a API en streaming
+        tokens_estimados = self._estimar_tokens_peticion(prompt, system_prompt, max_tokens=max_tokens)
+        clave = await self._elegir_clave()
+        es_sonda = await self.breaker.permitir()
+        try:
+            if clave.limitador:
+                await clave.limitador.adquirir(tokens_estimados)
+        except BaseException:
+            await self.breaker.liberar_sonda(es_sonda)
+            raise
+        agente = agente_actual.get()
+        fragmentos = []
+        # Span sin activar: un generador no puede mantener el contexto entre `yield`
+        span = tracer.start_span("groq.chat_completion.stream", kind=trace.SpanKind.CLIENT, attributes={
+            "agent": agente, "provider": self.proveedor, "groq.model": self.modelo, "groq.probe": es_sonda, "groq.key": clave.etiqueta
+        })
+        with self.pool.usar(clave):
+            GROQ_IN_FLIGHT.labels(agent=agente).inc()
+            try:
+                start_time = time.time()
+                cabeceras, stream = await self._abrir_stream(
+                    clave,
+                    messages=self._construir_mensajes(prompt, system_prompt),
+                    model=self.modelo,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                )
+                self.pool.registrar_cabeceras(clave, cabeceras)
+                if clave.limitador:
+                    await clave.limitador.sincronizar_cabeceras(cabeceras)
+                first_token_time = None
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token_time is None:
+                            first_token_time = time.time() - start_time
+                            GROQ_TTFT.labels(agent=agente, model=self.modelo).observe(first_token_time)
+                            span.add_event("first_token")
+                        fragmentos.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+                duration = time.time() - start_time
+            except BaseException as e:
+                GROQ_LATENCY.labels(agent=agente, model=self.modelo, outcome=resultado_error(e)).observe(time.time() - start_time)
+                span.record_exception(e)
+                span.set_status(trace.Status(trace.StatusCode.ERROR, str(e)))
+                if isinstance(e, Exception):
+                    self.estadisticas.registrar(False, time.time() - start_time)
+                    await self._registrar_error(e, es_sonda, clave)
+                else:  # cancelado o cliente desconectado (GeneratorExit)
+                    await self.breaker.liberar_sonda(es_sonda)
+                raise
+            finally:
+                GROQ_IN_FLIGHT.labels(agent=agente).dec()
+                span.end()
+        await self.breaker.registrar(True, es_sonda)
+        GROQ_LATENCY.labels(agent=agente, model=self.modelo, outcome="success").observe(duration)
+        self.estadisticas.registrar(True, duration)
+
+        response_text = "".join(fragmentos)
+        # El stream no informa `usage`: se estima con el texto generado
+        registrar_uso(self.modelo, self._estimar_tokens_peticion(prompt, system_prompt, 0), estimar_tokens(response_text))
+        if clave.limitador:
+            tokens_reales = self._estimar_tokens_peticion(prompt, system_prompt, estimar_tokens(response_text))
+            await clave.limitador.registrar_uso(tokens_estimados, tokens_reales)
+        logger.info("groq_stream_success", provider=self.proveedor, model=self.modelo, duration=duration, ttft=first_token_time, chars=len(response_text))
+
+        # 3. Guardar en Caché solo si el stream terminó completo
+        if response_text:
+            await self._guardar_cache(cache_key, response_text)
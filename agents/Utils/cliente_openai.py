@@ -0,0 +1,132 @@
+"""
+Cliente para APIs compatibles con OpenAI (Gemini, OpenAI, un servidor local...).
+
+`ClienteOpenAICompatAsync` reutiliza todo `ClienteGroqAsync` (caché, single-flight, breaker,
+limitador, pool de keys, métricas) con otro nombre de proveedor y su propio prefijo de
+configuración; solo cambia el transporte: `POST <base_url>/chat/completions` con httpx.
+
+    LLM_FALLBACK_PROVIDERS=gemini
+    GEMINI_API_KEY=...            # o GEMINI_API_KEYS=k1,k2
+    GEMINI_MODEL=gemini-2.0-flash # opcional
+    GEMINI_BASE_URL=...           # opcional; obligatorio para proveedores no conocidos
+
+Los errores HTTP se convierten en las excepciones del SDK de Groq (mismo protocolo), de
+modo que reintentos, breaker y reposo de keys tras un 429 funcionan igual que con Groq.
+La caché, el breaker y los cubos de Redis quedan bajo `<proveedor>:`.
+"""
+
+import json
+import os
+from typing import AsyncIterator, List, Mapping, Optional, Tuple
+import httpx
+from groq import (
+    APIConnectionError, APIStatusError, APITimeoutError, AuthenticationError, InternalServerError,
+    PermissionDeniedError, RateLimitError
+)
+from groq.types.chat import ChatCompletion, ChatCompletionChunk
+from .cliente_groq import ClienteGroqAsync
+from .pool_claves import ClaveGroq
+
+# base_url y modelo por defecto de los proveedores conocidos
+PROVEEDORES_CONOCIDOS = {
+    "gemini": ("https://generativelanguage.googleapis.com/v1beta/openai", "gemini-2.0-flash"),
+    "openai": ("https://api.openai.com/v1", "gpt-4o-mini"),
+}
+
+_ERRORES_POR_ESTADO = {401: AuthenticationError, 403: PermissionDeniedError, 429: RateLimitError}
+
+
+def error_de_estado(respuesta: httpx.Response) -> APIStatusError:
+    """Excepción del SDK de Groq equivalente a una respuesta de error de la API."""
+    try:
+        cuerpo = respuesta.json()
+    except ValueError:
+        cuerpo = respuesta.text
+    clase = _ERRORES_POR_ESTADO.get(
+        respuesta.status_code, InternalServerError if respuesta.status_code >= 500 else APIStatusError
+    )
+    return clase(f"Error code: {respuesta.status_code} - {cuerpo}", response=respuesta, body=cuerpo)
+
+
+class ClienteOpenAICompatAsync(ClienteGroqAsync):
+    """`ClienteGroqAsync` para un proveedor compatible con OpenAI configurado con `<NOMBRE>_*`."""
+
+    def __init__(
+        self,
+        nombre: str,
+        api_key: Optional[str] = None,
+        redis_url: Optional[str] = None,
+        api_keys: Optional[List[str]] = None
+    ):
+        """
+        Args:
+            nombre: Proveedor (gemini, openai u otro con <NOMBRE>_BASE_URL y <NOMBRE>_MODEL).
+            api_key: API key del proveedor (por defecto <NOMBRE>_API_KEY).
+            redis_url: URL de conexión a Redis para caché.
+            api_keys: Pool de API keys (por defecto <NOMBRE>_API_KEYS).
+        """
+        self.proveedor = nombre.lower()
+        self.entorno = nombre.upper()
+        base_url, modelo = PROVEEDORES_CONOCIDOS.get(self.proveedor, (None, None))
+        self.base_url = os.environ.get(f"{self.entorno}_BASE_URL", base_url)
+        self.modelo_por_defecto = modelo or os.environ.get(f"{self.entorno}_MODEL")
+        if not self.base_url or not self.modelo_por_defecto:
+            raise ValueError(f"Proveedor desconocido: se requieren {self.entorno}_BASE_URL y {self.entorno}_MODEL")
+        super().__init__(api_key=api_key, redis_url=redis_url, api_keys=api_keys)
+
+    def _crear_cliente(self) -> httpx.AsyncClient:
+        """Cliente httpx contra `base_url`, compartido por todas las keys (van en cada petición)."""
+        return httpx.AsyncClient(
+            base_url=self.base_url.rstrip("/") + "/",
+            timeout=httpx.Timeout(60.0, connect=5.0),  # los del SDK de Groq
+        )
+
+    def _cliente_de_clave(self, cliente: httpx.AsyncClient, key: str) -> httpx.AsyncClient:
+        return cliente
+
+    async def _enviar(self, clave: ClaveGroq, parametros: dict, stream: bool = False) -> httpx.Response:
+        """POST a chat/completions; los errores de red y HTTP salen como excepciones del SDK."""
+        peticion = clave.cliente.build_request(
+            "POST", "chat/completions", json=parametros, headers={"Authorization": f"Bearer {clave.api_key}"}
+        )
+        try:
+            respuesta = await clave.cliente.send(peticion, stream=stream)
+        except httpx.TimeoutException as e:
+            raise APITimeoutError(request=peticion) from e
+        except httpx.TransportError as e:
+            raise APIConnectionError(request=peticion) from e
+        if respuesta.is_error:
+            await respuesta.aread()
+            await respuesta.aclose()
+            raise error_de_estado(respuesta)
+        return respuesta
+
+    async def _completar(self, clave: ClaveGroq, **parametros) -> Tuple[Mapping[str, str], ChatCompletion]:
+        respuesta = await self._enviar(clave, parametros)
+        return respuesta.headers, ChatCompletion.model_construct(**respuesta.json())
+
+    async def _abrir_stream(
+        self, clave: ClaveGroq, **parametros
+    ) -> Tuple[Mapping[str, str], AsyncIterator[ChatCompletionChunk]]:
+        respuesta = await self._enviar(clave, {**parametros, "stream": True}, stream=True)
+
+        async def fragmentos() -> AsyncIterator[ChatCompletionChunk]:
+            # Server-sent events: `data: <chunk JSON>` hasta `data: [DONE]`
+            try:
+                async for linea in respuesta.aiter_lines():
+                    if not linea.startswith("data:"):
+                        continue
+                    datos = linea[len("data:"):].strip()
+                    if datos == "[DONE]":
+                        break
+                    yield ChatCompletionChunk.model_construct(**json.loads(datos))
+            finally:
+                await respuesta.aclose()
+
+        return respuesta.headers, fragmentos()
+
+    async def cerrar(self):
+        """Libera el cliente httpx y la conexión a Redis."""
+        await self.client.aclose()
+        if self.cache:
+            await self.cache.cerrar()
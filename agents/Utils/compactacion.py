@@ -0,0 +1,178 @@
+"""
+Compactación de los reportes de especialistas antes de la llamada al director.
+
+Los especialistas responden con las secciones numeradas que pide
+`AgenteOftalmologico._construir_prompt_analisis`. Antes de sintetizar:
+
+1. Se extraen esas secciones (el preámbulo y el texto de cortesía se descartan).
+2. Se eliminan las líneas repetidas o casi idénticas entre reportes.
+3. Se reparte un presupuesto de tokens (estimados localmente) entre los reportes,
+   recortando primero las secciones menos prioritarias. La urgencia nunca se recorta.
+
+Si un reporte no sigue el formato se conserva su texto completo, sujeto al mismo presupuesto.
+"""
+
+import re
+import unicodedata
+from typing import Dict, List, Optional, Set, Tuple
+from .rate_limit import estimar_tokens
+
+# (clave, título mostrado al director, patrón sin acentos) en el orden del prompt de análisis
+SECCIONES: List[Tuple[str, str, str]] = [
+    ("HALLAZGOS", "HALLAZGOS RELEVANTES", r"HALLAZGOS"),
+    ("DIAGNOSTICO", "DIAGNÓSTICO DIFERENCIAL", r"DIAGNOSTICOS?\s+DIFERENCIAL(?:ES)?"),
+    ("PRUEBAS", "PRUEBAS DIAGNÓSTICAS RECOMENDADAS", r"PRUEBAS"),
+    ("TRATAMIENTO", "TRATAMIENTO SUGERIDO", r"TRATAMIENTO"),
+    ("URGENCIA", "NIVEL DE URGENCIA", r"(?:NIVEL\s+DE\s+)?URGENCIA"),
+]
+# Orden en que se recortan las secciones cuando no cabe el reporte
+PRIORIDAD_RECORTE = ["PRUEBAS", "TRATAMIENTO", "HALLAZGOS", "DIAGNOSTICO"]
+
+_ENCABEZADO = re.compile(
+    r"^\s*(?P<prefijo>(?:#+\s*)?(?:[*_]{1,2}\s*)?(?:\d+\s*[.)-]\s*)?(?:[*_]{1,2}\s*)?)(?P<titulo>"
+    + "|".join(f"(?P<{clave}>{patron})" for clave, _, patron in SECCIONES)
+    + r")(?P<resto>.*)$",
+    re.IGNORECASE,
+)
+_PALABRA = re.compile(r"\w+")
+_MARCAS = re.compile(r"^[\s*_#:\-–—.)]+|[\s*_#]+$")
+_SIMILITUD_DUPLICADO = 0.8
+_MIN_PALABRAS_SIMILITUD = 4
+
+def _sin_acentos(texto: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", texto) if unicodedata.category(c) != "Mn")
+
+def _encabezado(linea: str) -> Optional[re.Match]:
+    """Un encabezado va numerado o marcado (#, **) o con el título en mayúsculas."""
+    if len(linea) >= 120:
+        return None
+    m = _ENCABEZADO.match(_sin_acentos(linea))
+    if m and (m.group("prefijo").strip() or m.group("titulo").isupper()):
+        return m
+    return None
+
+def extraer_secciones(reporte: str) -> Dict[str, List[str]]:
+    """Líneas de cada sección numerada del reporte (vacío si no sigue el formato)."""
+    secciones: Dict[str, List[str]] = {}
+    actual: Optional[str] = None
+    for linea in unicodedata.normalize("NFC", reporte).splitlines():
+        m = _encabezado(linea)
+        if m:
+            actual = next(clave for clave, _, _ in SECCIONES if m.group(clave))
+            secciones.setdefault(actual, [])
+            # "**NIVEL DE URGENCIA**: ALTO" -> conserva "ALTO"; "**PRUEBAS DIAGNÓSTICAS**" -> nada
+            resto = linea[m.start("resto"):]
+            if ":" in resto:
+                resto = _MARCAS.sub("", resto.split(":", 1)[1])
+            elif resto.upper() == resto:
+                resto = ""
+            else:
+                resto = _MARCAS.sub("", resto)
+            if resto:
+                secciones[actual].append(resto)
+        elif actual == "URGENCIA" and not linea.strip() and secciones[actual]:
+            # La urgencia es la última sección: lo que sigue suele ser texto de cortesía
+            actual = None
+        elif actual and linea.strip():
+            secciones[actual].append(linea.rstrip())
+    return secciones
+
+def _huella(linea: str) -> Set[str]:
+    return set(_PALABRA.findall(_sin_acentos(linea).lower()))
+
+def _es_duplicada(palabras: Set[str], vistas: List[Set[str]]) -> bool:
+    for otra in vistas:
+        if palabras == otra:
+            return True
+        if len(palabras) >= _MIN_PALABRAS_SIMILITUD and len(otra) >= _MIN_PALABRAS_SIMILITUD:
+            if len(palabras & otra) / len(palabras | otra) >= _SIMILITUD_DUPLICADO:
+                return True
+    return False
+
+def _deduplicar(reportes: Dict[str, Dict[str, List[str]]]):
+    """Elimina, en orden de llegada, las líneas que ya aparecieron en otro reporte o sección."""
+    vistas: List[Set[str]] = []
+    for secciones in reportes.values():
+        for clave, lineas in secciones.items():
+            if clave == "URGENCIA":
+                continue
+            conservadas = []
+            for linea in lineas:
+                palabras = _huella(linea)
+                if not palabras:
+                    continue
+                if _es_duplicada(palabras, vistas):
+                    continue
+                vistas.append(palabras)
+                conservadas.append(linea)
+            secciones[clave] = conservadas
+
+def _tokens(secciones: Dict[str, List[str]]) -> int:
+    return sum(estimar_tokens(l) for lineas in secciones.values() for l in lineas) + 8 * len(secciones)
+
+def _recortar(secciones: Dict[str, List[str]], presupuesto: int) -> bool:
+    """Quita líneas del final de las secciones menos prioritarias hasta caber en `presupuesto`."""
+    total = _tokens(secciones)
+    recortado = False
+    for clave in PRIORIDAD_RECORTE:
+        lineas = secciones.get(clave, [])
+        while total > presupuesto and lineas:
+            total -= estimar_tokens(lineas.pop())
+            recortado = True
+        if total <= presupuesto:
+            break
+    return recortado
+
+def _renderizar(secciones: Dict[str, List[str]], recortado: bool) -> str:
+    partes = []
+    for numero, (clave, titulo, _) in enumerate(SECCIONES, start=1):
+        if secciones.get(clave):
+            partes.append(f"{numero}. {titulo}\n" + "\n".join(secciones[clave]))
+    if recortado:
+        partes.append("[reporte recortado por presupuesto de tokens]")
+    return "\n\n".join(partes)
+
+def _repartir(necesarios: Dict[str, int], presupuesto: int) -> Dict[str, int]:
+    """Reparto equitativo: lo que un reporte corto no usa pasa a los demás."""
+    asignado: Dict[str, int] = {}
+    pendientes = sorted(necesarios, key=necesarios.get)
+    restante = presupuesto
+    while pendientes:
+        cuota = restante // len(pendientes)
+        nombre = pendientes.pop(0)
+        asignado[nombre] = min(necesarios[nombre], cuota)
+        restante -= asignado[nombre]
+    return asignado
+
+def compactar_reportes(reportes: Dict[str, str], presupuesto_tokens: int) -> Dict[str, str]:
+    """
+    Versión compacta de los reportes (mismo orden de claves), con un total estimado de
+    como mucho `presupuesto_tokens` tokens.
+    """
+    estructurados: Dict[str, Dict[str, List[str]]] = {}
+    libres: Dict[str, List[str]] = {}
+    for nombre, reporte in reportes.items():
+        secciones = extraer_secciones(reporte)
+        if len(secciones) >= 2:
+            estructurados[nombre] = secciones
+        else:
+            libres[nombre] = [l.rstrip() for l in reporte.splitlines() if l.strip()]
+    _deduplicar(estructurados)
+
+    necesarios = {n: _tokens(s) for n, s in estructurados.items()}
+    necesarios.update({n: _tokens({"": l}) for n, l in libres.items()})
+    asignado = _repartir(necesarios, presupuesto_tokens)
+
+    compactos: Dict[str, str] = {}
+    for nombre in reportes:
+        if nombre in estructurados:
+            secciones = estructurados[nombre]
+            compactos[nombre] = _renderizar(secciones, _recortar(secciones, asignado[nombre]))
+        else:
+            lineas = libres[nombre]
+            total, recortado = _tokens({"": lineas}), False
+            while total > asignado[nombre] and lineas:
+                total -= estimar_tokens(lineas.pop())
+                recortado = True
+            compactos[nombre] = "\n".join(lineas) + ("\n[reporte recortado por presupuesto de tokens]" if recortado else "")
+    return compactos
@@ -0,0 +1,181 @@
+"""
+Enrutador de proveedores de LLM con conmutación por latencia y por fallo.
+
+Con `LLM_FALLBACK_PROVIDERS=gemini[,openai...]` cada agente llama a un `EnrutadorProveedores`
+en lugar de directamente a Groq:
+
+- El orden de cada llamada sale de las estadísticas recientes de cada proveedor (latencia
+  media / tasa de éxito en `ROUTER_WINDOW_SECONDS`). Mientras la diferencia no supere
+  `ROUTER_LATENCY_TOLERANCE` se respeta el orden configurado (Groq primero).
+- Un proveedor con el circuit breaker abierto pasa al final; si una llamada falla (breaker
+  abierto, reintentos agotados, sin cuota) se repite en el siguiente proveedor.
+- El modelo pedido (p. ej. el rápido de la cascada) solo se aplica al proveedor principal;
+  los de respaldo usan su `<PROVEEDOR>_MODEL`.
+
+Sin proveedores de respaldo `crear_cliente_llm` devuelve el `ClienteGroqAsync` de siempre.
+"""
+
+import os
+from typing import Any, AsyncGenerator, Dict, List, Optional
+import structlog
+from tenacity import RetryError
+from .circuit_breaker import CircuitBreakerOpenException
+from .cliente_groq import ClienteGroqAsync
+from .cliente_openai import ClienteOpenAICompatAsync
+from .metricas import PROVIDER_FAILOVERS, PROVIDER_REQUESTS, PROVIDER_SCORE, agente_actual, resultado_error
+from .proveedores import Proveedor
+
+logger = structlog.get_logger()
+
+
+def motivo_fallo(error: BaseException) -> str:
+    """Etiqueta `reason` de una conmutación."""
+    if isinstance(error, RetryError) and error.last_attempt.failed:
+        error = error.last_attempt.exception()
+    if isinstance(error, CircuitBreakerOpenException):
+        return "breaker_open"
+    return resultado_error(error)
+
+
+class EnrutadorProveedores:
+    """Implementa `Proveedor` repartiendo cada llamada entre varios proveedores."""
+
+    def __init__(self, proveedores: List[ClienteGroqAsync], tolerancia: float = 1.5):
+        if not proveedores:
+            raise ValueError("Se requiere al menos un proveedor")
+        self.proveedores = proveedores
+        self.principal = proveedores[0]
+        self.tolerancia = tolerancia
+        self.proveedor = "router"
+        self.modelo = self.principal.modelo
+        self.max_tokens = self.principal.max_tokens
+
+    def orden(self) -> List[ClienteGroqAsync]:
+        """
+        Proveedores en el orden a intentar: primero los que tienen el breaker cerrado, los
+        que están dentro de `tolerancia` respecto al más rápido en el orden configurado y
+        después el resto de menor a mayor puntuación.
+        """
+        puntuaciones = {}
+        for proveedor in self.proveedores:
+            puntuacion = proveedor.estadisticas.puntuacion()
+            puntuaciones[proveedor.proveedor] = puntuacion
+            if puntuacion is not None:
+                PROVIDER_SCORE.labels(provider=proveedor.proveedor).set(puntuacion)
+        conocidas = [p for p in puntuaciones.values() if p is not None]
+        mejor = min(conocidas) if conocidas else None
+
+        def prioridad(indice: int) -> tuple:
+            proveedor = self.proveedores[indice]
+            puntuacion = puntuaciones[proveedor.proveedor]
+            # Sin datos todavía no hay motivo para saltarse el orden configurado
+            if puntuacion is None or puntuacion <= mejor * self.tolerancia:
+                return (proveedor.breaker.abierto(), 0, indice)
+            return (proveedor.breaker.abierto(), 1, puntuacion)
+
+        return [self.proveedores[i] for i in sorted(range(len(self.proveedores)), key=prioridad)]
+
+    def _modelo_para(self, proveedor: ClienteGroqAsync, modelo: Optional[str]) -> Optional[str]:
+        return modelo if proveedor is self.principal else None
+
+    def _conmutar(self, proveedor: ClienteGroqAsync, siguiente: ClienteGroqAsync, error: Exception):
+        motivo = motivo_fallo(error)
+        PROVIDER_FAILOVERS.labels(agent=agente_actual.get(), provider=proveedor.proveedor, reason=motivo).inc()
+        logger.warning(
+            "llm_provider_failover", provider=proveedor.proveedor, next=siguiente.proveedor, reason=motivo, error=str(error)
+        )
+
+    async def generar_respuesta(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        formato_json: bool = False,
+        modelo: Optional[str] = None
+    ) -> str:
+        """Genera con el primer proveedor de `orden()` y pasa al siguiente si falla."""
+        orden = self.orden()
+        for i, proveedor in enumerate(orden):
+            try:
+                respuesta = await proveedor.generar_respuesta(
+                    prompt,
+                    system_prompt=system_prompt,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    formato_json=formato_json,
+                    modelo=self._modelo_para(proveedor, modelo),
+                )
+            except Exception as e:
+                PROVIDER_REQUESTS.labels(agent=agente_actual.get(), provider=proveedor.proveedor, outcome="error").inc()
+                if i == len(orden) - 1:
+                    raise
+                self._conmutar(proveedor, orden[i + 1], e)
+                continue
+            PROVIDER_REQUESTS.labels(agent=agente_actual.get(), provider=proveedor.proveedor, outcome="success").inc()
+            return respuesta
+
+    async def generar_respuesta_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> AsyncGenerator[str, None]:
+        """Como `generar_respuesta`; solo se conmuta si el proveedor falla antes del primer fragmento."""
+        orden = self.orden()
+        for i, proveedor in enumerate(orden):
+            emitido = False
+            try:
+                async for fragmento in proveedor.generar_respuesta_stream(
+                    prompt, system_prompt=system_prompt, temperature=temperature, max_tokens=max_tokens
+                ):
+                    emitido = True
+                    yield fragmento
+            except Exception as e:
+                PROVIDER_REQUESTS.labels(agent=agente_actual.get(), provider=proveedor.proveedor, outcome="error").inc()
+                if emitido or i == len(orden) - 1:
+                    raise
+                self._conmutar(proveedor, orden[i + 1], e)
+                continue
+            PROVIDER_REQUESTS.labels(agent=agente_actual.get(), provider=proveedor.proveedor, outcome="success").inc()
+            return
+
+    async def conectar(self):
+        for proveedor in self.proveedores:
+            await proveedor.conectar()
+
+    async def cerrar(self):
+        for proveedor in self.proveedores:
+            await proveedor.cerrar()
+
+    def estadisticas_cache(self) -> Dict[str, Any]:
+        """Totales de la caché (mismos campos que un solo cliente) y el detalle por proveedor."""
+        por_proveedor = {p.proveedor: p.estadisticas_cache() for p in self.proveedores}
+        totales = {
+            campo: sum(stats.get(campo, 0) for stats in por_proveedor.values())
+            for campo in ("l1_hits", "l2_hits", "misses")
+        }
+        return {**totales, "providers": por_proveedor}
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "order": [p.proveedor for p in self.orden()],
+            "providers": [p.estado() for p in self.proveedores],
+        }
+
+
+def crear_cliente_llm(api_key: Optional[str] = None) -> Proveedor:
+    """
+    Cliente de LLM de los agentes: Groq y, si hay LLM_FALLBACK_PROVIDERS, un enrutador
+    con esos proveedores de respaldo detrás.
+    """
+    principal = ClienteGroqAsync(api_key=api_key)
+    respaldo = [nombre.strip() for nombre in os.environ.get("LLM_FALLBACK_PROVIDERS", "").split(",") if nombre.strip()]
+    if not respaldo:
+        return principal
+    logger.info("llm_router_enabled", providers=[principal.proveedor] + respaldo)
+    return EnrutadorProveedores(
+        [principal] + [ClienteOpenAICompatAsync(nombre) for nombre in respaldo],
+        tolerancia=float(os.environ.get("ROUTER_LATENCY_TOLERANCE", 1.5)),
+    )
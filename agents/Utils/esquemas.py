@@ -0,0 +1,111 @@
+"""
+Esquema del modo estructurado de los especialistas (salida JSON validada con Pydantic).
+
+Los límites por campo se anuncian al modelo en el prompt y se aplican al validar:
+listas y textos demasiado largos se recortan en lugar de rechazar el reporte.
+"""
+
+import json
+import unicodedata
+from enum import Enum
+from typing import Any, List
+from pydantic import BaseModel, Field, field_validator
+
+MAX_ELEMENTOS = {"hallazgos": 8, "diagnostico_diferencial": 5, "pruebas": 6, "tratamiento": 6}
+MAX_CARACTERES = 240
+# Con los límites anteriores el JSON completo cabe holgadamente en este tope de generación
+MAX_TOKENS_ESTRUCTURADO = 1200
+
+
+def _recortar_texto(valor: Any) -> Any:
+    if isinstance(valor, str) and len(valor) > MAX_CARACTERES:
+        return valor[:MAX_CARACTERES - 1].rstrip() + "…"
+    return valor
+
+
+class NivelUrgencia(str, Enum):
+    BAJO = "BAJO"
+    MEDIO = "MEDIO"
+    ALTO = "ALTO"
+    CRITICO = "CRÍTICO"
+
+    @classmethod
+    def _missing_(cls, valor: object):
+        # Acepta "critico", "Crítico", " alto " ...
+        if isinstance(valor, str):
+            limpio = "".join(
+                c for c in unicodedata.normalize("NFD", valor.strip().upper()) if unicodedata.category(c) != "Mn"
+            )
+            for nivel in cls:
+                if nivel.name == limpio:
+                    return nivel
+        return None
+
+
+class DiagnosticoDiferencial(BaseModel):
+    diagnostico: str
+    justificacion: str = ""
+
+    _recortar = field_validator("diagnostico", "justificacion", mode="before")(_recortar_texto)
+
+
+class ReporteEspecialista(BaseModel):
+    """Reporte de un especialista; `diagnostico_diferencial` va ordenado de más a menos probable."""
+
+    hallazgos: List[str] = Field(default_factory=list)
+    diagnostico_diferencial: List[DiagnosticoDiferencial] = Field(default_factory=list)
+    pruebas: List[str] = Field(default_factory=list)
+    tratamiento: List[str] = Field(default_factory=list)
+    nivel_urgencia: NivelUrgencia
+    justificacion_urgencia: str = ""
+
+    @field_validator("hallazgos", "diagnostico_diferencial", "pruebas", "tratamiento", mode="before")
+    @classmethod
+    def _limitar_lista(cls, valor: Any, info) -> Any:
+        if isinstance(valor, str):
+            valor = [valor]
+        if isinstance(valor, list):
+            valor = [_recortar_texto(v) for v in valor[:MAX_ELEMENTOS[info.field_name]]]
+        return valor
+
+    _recortar = field_validator("justificacion_urgencia", mode="before")(_recortar_texto)
+
+    @classmethod
+    def desde_json(cls, texto: str) -> "ReporteEspecialista":
+        """Valida la respuesta del modelo. Lanza ValueError si no es JSON o no cumple el esquema."""
+        try:
+            return cls.model_validate(json.loads(texto))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Respuesta estructurada no es JSON válido: {e}") from e
+
+    def a_texto(self) -> str:
+        """Versión en texto con las secciones numeradas del reporte libre (para el director)."""
+        diferencial = [
+            f"{i}. {d.diagnostico}" + (f" - {d.justificacion}" if d.justificacion else "")
+            for i, d in enumerate(self.diagnostico_diferencial, start=1)
+        ]
+        urgencia = self.nivel_urgencia.value + (f" - {self.justificacion_urgencia}" if self.justificacion_urgencia else "")
+        secciones = [
+            ("1. HALLAZGOS RELEVANTES", [f"- {h}" for h in self.hallazgos]),
+            ("2. DIAGNÓSTICO DIFERENCIAL", diferencial),
+            ("3. PRUEBAS DIAGNÓSTICAS RECOMENDADAS", [f"- {p}" for p in self.pruebas]),
+            ("4. TRATAMIENTO SUGERIDO", [f"- {t}" for t in self.tratamiento]),
+            ("5. NIVEL DE URGENCIA", [urgencia]),
+        ]
+        return "\n\n".join(f"{titulo}\n" + "\n".join(lineas) for titulo, lineas in secciones if lineas)
+
+
+def instrucciones_formato() -> str:
+    """Descripción del JSON esperado, con los límites por campo, para el prompt."""
+    return f"""Responde ÚNICAMENTE con un objeto JSON con esta forma:
+{{
+  "hallazgos": ["..."],                      // máximo {MAX_ELEMENTOS['hallazgos']}
+  "diagnostico_diferencial": [               // máximo {MAX_ELEMENTOS['diagnostico_diferencial']}, del más al menos probable
+    {{"diagnostico": "...", "justificacion": "..."}}
+  ],
+  "pruebas": ["..."],                        // máximo {MAX_ELEMENTOS['pruebas']}
+  "tratamiento": ["..."],                    // máximo {MAX_ELEMENTOS['tratamiento']}
+  "nivel_urgencia": "BAJO" | "MEDIO" | "ALTO" | "CRÍTICO",
+  "justificacion_urgencia": "..."
+}}
+Cada texto debe tener como máximo {MAX_CARACTERES} caracteres. Sin markdown ni texto fuera del JSON."""
@@ -0,0 +1,79 @@
+"""
+Métricas Prometheus de los agentes y del cliente de Groq.
+
+Todas llevan la etiqueta `agent`. En un servicio de agente es su AGENT_TYPE; en modo
+monolito varios agentes comparten el cliente, así que cada llamada indica el suyo con
+`agente_actual.set(...)` (un ContextVar, propio de cada tarea de asyncio).
+"""
+
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator
+from prometheus_client import Counter, Gauge, Histogram
+
+agente_actual: ContextVar[str] = ContextVar(
+    "agente_actual", default=os.environ.get("AGENT_TYPE", "GENERAL").upper()
+)
+
+BUCKETS_LLM = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+AGENT_LATENCY = Histogram(
+    'agent_analysis_duration_seconds', 'End-to-end analysis time per agent', ['agent', 'kind', 'outcome'],
+    buckets=BUCKETS_LLM
+)
+AGENT_IN_FLIGHT = Gauge('agent_analyses_in_flight', 'Analyses currently running per agent', ['agent'])
+
+GROQ_LATENCY = Histogram(
+    'groq_request_duration_seconds', 'Groq API call latency (one attempt)', ['agent', 'model', 'outcome'],
+    buckets=BUCKETS_LLM
+)
+GROQ_TTFT = Histogram(
+    'groq_time_to_first_token_seconds', 'Time to first streamed token', ['agent', 'model'], buckets=BUCKETS_LLM
+)
+GROQ_IN_FLIGHT = Gauge('groq_requests_in_flight', 'Groq API calls currently open', ['agent'])
+GROQ_TOKENS = Counter('groq_tokens_total', 'Tokens reported by Groq', ['agent', 'model', 'kind'])
+GROQ_RETRIES = Counter('groq_retries_total', 'Groq calls retried after an error', ['agent', 'reason'])
+
+CACHE_LOOKUPS = Counter('groq_cache_lookups_total', 'Response cache lookups', ['agent', 'result'])
+
+# Pool de API keys: `key` es la etiqueta (hash corto), nunca la key
+KEY_REQUESTS = Counter('groq_key_requests_total', 'Groq calls routed to each API key', ['key'])
+KEY_COOLDOWNS = Counter('groq_key_cooldowns_total', 'API keys put to rest after a 429 or exhausted quota', ['key'])
+KEY_REMAINING = Gauge('groq_key_remaining_ratio', 'Remaining quota fraction reported for each API key', ['key', 'kind'])
+
+# Enrutador de proveedores (Groq, Gemini...)
+PROVIDER_REQUESTS = Counter('llm_provider_requests_total', 'Generations attempted per provider', ['agent', 'provider', 'outcome'])
+PROVIDER_FAILOVERS = Counter('llm_provider_failovers_total', 'Generations moved to the next provider', ['agent', 'provider', 'reason'])
+PROVIDER_SCORE = Gauge('llm_provider_expected_seconds', 'Rolling latency divided by success rate per provider', ['provider'])
+
+
+def resultado_error(error: BaseException) -> str:
+    """Etiqueta `outcome` de una llamada fallida."""
+    nombre = type(error).__name__
+    if nombre == "RateLimitError" or getattr(error, "status_code", None) == 429:
+        return "rate_limited"
+    if nombre in ("TimeoutError", "CancelledError", "APITimeoutError") or getattr(error, "status_code", None) == 504:
+        return "timeout"
+    return "error"
+
+
+@asynccontextmanager
+async def medir_analisis(agente: str, tipo: str) -> AsyncIterator[None]:
+    """
+    `async with medir_analisis("RETINA", "specialist"):` fija el agente de las métricas
+    del cliente y registra la duración y las peticiones en curso del análisis.
+    """
+    agente_actual.set(agente)
+    AGENT_IN_FLIGHT.labels(agent=agente).inc()
+    inicio = time.perf_counter()
+    resultado = "success"
+    try:
+        yield
+    except BaseException as e:
+        resultado = resultado_error(e)
+        raise
+    finally:
+        AGENT_IN_FLIGHT.labels(agent=agente).dec()
+        AGENT_LATENCY.labels(agent=agente, kind=tipo, outcome=resultado).observe(time.perf_counter() - inicio)
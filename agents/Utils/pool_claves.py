@@ -0,0 +1,201 @@
+"""
+Pool de API keys de Groq.
+
+Los límites de Groq (peticiones por día, tokens por minuto) son por organización: con
+una sola key todo el despliegue comparte esa cuota. Con `GROQ_API_KEYS=gsk_a,gsk_b,...`
+(keys de organizaciones distintas) cada llamada va a la key sana con más margen:
+
+- La cuota restante de cada key se toma de las cabeceras `x-ratelimit-*` de sus propias
+  respuestas y se supone que se recupera linealmente hasta el `reset` indicado.
+- Una key que recibe un 429 (o agota sus peticiones diarias) queda en reposo durante el
+  `Retry-After` (o el reset); mientras tanto las llamadas van a las demás.
+- Una key rechazada (401/403) se retira del pool, salvo que sea la última activa.
+
+Sin GROQ_API_KEYS, GROQ_API_KEY forma un pool de una key y el comportamiento no cambia.
+"""
+
+import hashlib
+import itertools
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+import structlog
+from .metricas import KEY_COOLDOWNS, KEY_REMAINING, KEY_REQUESTS
+from .rate_limit import LimiteTasaExcedido, parsear_duracion
+
+logger = structlog.get_logger()
+
+# Ventana supuesta cuando Groq no informa cuándo se recupera la cuota
+RESET_POR_DEFECTO = 60.0
+
+
+class SinClavesDisponibles(Exception):
+    """Todas las API keys del pool fueron rechazadas por Groq."""
+    pass
+
+
+def etiqueta_clave(api_key: str) -> str:
+    """Identificador estable de la key para logs, métricas y Redis, sin exponerla."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:8]
+
+
+def _numero(valor: Optional[str]) -> Optional[float]:
+    try:
+        return float(valor) if valor is not None else None
+    except ValueError:
+        return None
+
+
+class _Cuota:
+    """Un límite de una key (peticiones o tokens) según su última cabecera."""
+
+    def __init__(self):
+        self.limite: Optional[float] = None
+        self.restante: Optional[float] = None
+        self.reset = RESET_POR_DEFECTO
+        self.ts = 0.0
+
+    def actualizar(self, limite: Optional[str], restante: Optional[str], reset: Optional[str]):
+        restante_num = _numero(restante)
+        if restante_num is None:
+            return
+        self.limite = _numero(limite) or self.limite
+        self.restante = restante_num
+        self.reset = parsear_duracion(reset) or RESET_POR_DEFECTO
+        self.ts = time.monotonic()
+
+    def fraccion(self, ahora: float) -> float:
+        """Fracción del límite disponible ahora (1.0 mientras no haya cabeceras)."""
+        if self.restante is None or not self.limite:
+            return 1.0
+        recuperado = (self.limite - self.restante) * min(1.0, (ahora - self.ts) / self.reset)
+        return max(0.0, min(1.0, (self.restante + recuperado) / self.limite))
+
+
+class ClaveGroq:
+    """Una key del pool: su cliente del SDK, su limitador de tasa y su estado."""
+
+    def __init__(self, api_key: str, cliente: Any):
+        self.api_key = api_key
+        self.etiqueta = etiqueta_clave(api_key)
+        self.cliente = cliente
+        self.limitador = None  # LimitadorTasa propio (solo el cliente asíncrono)
+        self.peticiones = _Cuota()
+        self.tokens = _Cuota()
+        self.en_vuelo = 0
+        self.reposo_hasta = 0.0
+        self.retirada = False
+
+    def margen(self, ahora: float) -> float:
+        return min(self.peticiones.fraccion(ahora), self.tokens.fraccion(ahora))
+
+
+class PoolClavesGroq:
+    """Reparte las llamadas entre las keys según su cuota restante y su carga."""
+
+    def __init__(self, claves: List[ClaveGroq], reposo_por_defecto: float = 5.0, max_espera: float = 120.0):
+        if not claves:
+            raise ValueError("Se requiere al menos una API key de Groq")
+        self.claves = claves
+        self.reposo_por_defecto = reposo_por_defecto
+        self.max_espera = max_espera
+        # Rota el orden de desempate para repartir las keys sin cabeceras todavía
+        self._turno = itertools.count()
+
+    @staticmethod
+    def leer_claves(
+        api_key: Optional[str] = None, api_keys: Optional[List[str]] = None, entorno: str = "GROQ"
+    ) -> List[str]:
+        """
+        Keys configuradas: `api_keys`, GROQ_API_KEYS (separadas por comas) o `api_key`/GROQ_API_KEY.
+        `entorno` cambia el prefijo para otros proveedores (GEMINI_API_KEYS, ...).
+        """
+        if not api_keys:
+            api_keys = os.environ.get(f"{entorno}_API_KEYS", "").split(",")
+        claves = [clave.strip() for clave in api_keys if clave and clave.strip()]
+        if not claves:
+            clave = api_key or os.environ.get(f"{entorno}_API_KEY")
+            claves = [clave] if clave else []
+        return list(dict.fromkeys(claves))
+
+    def elegir(self) -> Tuple[ClaveGroq, float]:
+        """
+        Key para la siguiente llamada y segundos a esperar antes de usarla. Entre las keys
+        sanas gana la de mayor margen por llamada en vuelo (espera 0); si todas están en
+        reposo, la que antes sale de él.
+
+        Raises:
+            SinClavesDisponibles: si todas las keys fueron retiradas.
+            LimiteTasaExcedido: si la primera key libre tarda más de `max_espera`.
+        """
+        ahora = time.monotonic()
+        activas = [clave for clave in self.claves if not clave.retirada]
+        if not activas:
+            raise SinClavesDisponibles("Groq rechazó todas las API keys configuradas")
+        inicio = next(self._turno) % len(activas)
+        sanas = [clave for clave in activas[inicio:] + activas[:inicio] if clave.reposo_hasta <= ahora]
+        if sanas:
+            return max(sanas, key=lambda clave: clave.margen(ahora) / (1 + clave.en_vuelo)), 0.0
+        clave = min(activas, key=lambda clave: clave.reposo_hasta)
+        espera = clave.reposo_hasta - ahora
+        if espera > self.max_espera:
+            raise LimiteTasaExcedido(f"Todas las API keys de Groq en reposo durante más de {self.max_espera:.0f}s")
+        return clave, espera
+
+    @contextmanager
+    def usar(self, clave: ClaveGroq) -> Iterator[ClaveGroq]:
+        """Cuenta la llamada como en vuelo en la key mientras dura el bloque."""
+        clave.en_vuelo += 1
+        KEY_REQUESTS.labels(key=clave.etiqueta).inc()
+        try:
+            yield clave
+        finally:
+            clave.en_vuelo -= 1
+
+    def registrar_cabeceras(self, clave: ClaveGroq, headers: Mapping[str, str]):
+        """Actualiza la cuota de la key; si agotó sus peticiones, reposa hasta el reset."""
+        clave.peticiones.actualizar(
+            headers.get("x-ratelimit-limit-requests"),
+            headers.get("x-ratelimit-remaining-requests"),
+            headers.get("x-ratelimit-reset-requests"),
+        )
+        clave.tokens.actualizar(
+            headers.get("x-ratelimit-limit-tokens"),
+            headers.get("x-ratelimit-remaining-tokens"),
+            headers.get("x-ratelimit-reset-tokens"),
+        )
+        ahora = time.monotonic()
+        KEY_REMAINING.labels(key=clave.etiqueta, kind="requests").set(clave.peticiones.fraccion(ahora))
+        KEY_REMAINING.labels(key=clave.etiqueta, kind="tokens").set(clave.tokens.fraccion(ahora))
+        if clave.peticiones.restante == 0:
+            self.enfriar(clave, parsear_duracion(headers.get("x-ratelimit-reset-requests")))
+
+    def enfriar(self, clave: ClaveGroq, segundos: Optional[float] = None):
+        """Deja la key en reposo `segundos` (Retry-After) o `reposo_por_defecto`."""
+        segundos = segundos or self.reposo_por_defecto
+        clave.reposo_hasta = max(clave.reposo_hasta, time.monotonic() + segundos)
+        KEY_COOLDOWNS.labels(key=clave.etiqueta).inc()
+        logger.warning("groq_key_cooldown", key=clave.etiqueta, seconds=segundos)
+
+    def retirar(self, clave: ClaveGroq, motivo: str):
+        """Retira una key rechazada por Groq; la última activa se conserva para no quedar sin ninguna."""
+        if sum(not c.retirada for c in self.claves) <= 1:
+            return
+        clave.retirada = True
+        logger.error("groq_key_retired", key=clave.etiqueta, reason=motivo)
+
+    def estado(self) -> List[Dict[str, Any]]:
+        """Resumen por key (sin exponerla) para el endpoint /providers/stats."""
+        ahora = time.monotonic()
+        return [
+            {
+                "key": clave.etiqueta,
+                "retired": clave.retirada,
+                "resting_s": round(max(0.0, clave.reposo_hasta - ahora), 1),
+                "in_flight": clave.en_vuelo,
+                "requests_ratio": round(clave.peticiones.fraccion(ahora), 3),
+                "tokens_ratio": round(clave.tokens.fraccion(ahora), 3),
+            }
+            for clave in self.claves
+        ]
@@ -0,0 +1,93 @@
+"""
+Interfaz común de los proveedores de LLM y sus estadísticas de salud.
+
+`ClienteGroqAsync` y `ClienteOpenAICompatAsync` (Gemini u otra API compatible con OpenAI)
+la implementan, igual que `EnrutadorProveedores`, de modo que los agentes no saben a qué
+proveedor llaman. Cada proveedor anota en `estadisticas` la latencia y el resultado de
+cada llamada a su API; el enrutador ordena los proveedores con esos datos.
+"""
+
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Deque, Dict, Optional, Protocol, Tuple
+
+
+class Proveedor(Protocol):
+    """Lo que los agentes necesitan de un cliente de LLM."""
+
+    proveedor: str
+    modelo: str
+    max_tokens: int
+
+    async def generar_respuesta(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        formato_json: bool = False,
+        modelo: Optional[str] = None
+    ) -> str: ...
+
+    def generar_respuesta_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> AsyncGenerator[str, None]: ...
+
+    async def conectar(self): ...
+
+    async def cerrar(self): ...
+
+    def estadisticas_cache(self) -> Dict[str, Any]: ...
+
+    def estado(self) -> Dict[str, Any]: ...
+
+
+class EstadisticasRodantes:
+    """Latencia media y tasa de error de las llamadas de los últimos `ventana` segundos."""
+
+    def __init__(self, ventana: float = 60.0, min_muestras: int = 5, max_muestras: int = 1000):
+        self.ventana = ventana
+        self.min_muestras = min_muestras
+        # (instante, éxito, latencia)
+        self.muestras: Deque[Tuple[float, bool, float]] = deque(maxlen=max_muestras)
+
+    def registrar(self, exito: bool, latencia: float):
+        self.muestras.append((time.monotonic(), exito, latencia))
+
+    def _vigentes(self):
+        limite = time.monotonic() - self.ventana
+        while self.muestras and self.muestras[0][0] < limite:
+            self.muestras.popleft()
+        return self.muestras
+
+    def latencia(self) -> Optional[float]:
+        """Latencia media de las llamadas correctas (None sin datos)."""
+        latencias = [latencia for _, exito, latencia in self._vigentes() if exito]
+        return sum(latencias) / len(latencias) if latencias else None
+
+    def tasa_error(self) -> float:
+        """Fracción de llamadas fallidas; 0 mientras haya menos de `min_muestras`."""
+        muestras = self._vigentes()
+        if len(muestras) < self.min_muestras:
+            return 0.0
+        return sum(not exito for _, exito, _ in muestras) / len(muestras)
+
+    def puntuacion(self) -> Optional[float]:
+        """Segundos esperados por respuesta correcta (latencia / tasa de éxito); None sin datos."""
+        tasa_error = self.tasa_error()
+        if tasa_error >= 1.0:
+            return float("inf")
+        latencia = self.latencia()
+        return None if latencia is None else latencia / (1.0 - tasa_error)
+
+    def resumen(self) -> Dict[str, Any]:
+        latencia = self.latencia()
+        return {
+            "samples": len(self._vigentes()),
+            "latency_s": round(latencia, 3) if latencia is not None else None,
+            "error_rate": round(self.tasa_error(), 3),
+        }
@@ -0,0 +1,229 @@
+"""
+Limitador de tasa RPM/TPM compartido entre réplicas (token bucket en Redis).
+
+Todas las réplicas de agentes consumen de los mismos buckets, de modo que las llamadas
+esperan su turno en lugar de chocar contra errores 429. Los buckets se corrigen con
+las cabeceras `x-ratelimit-*` de Groq y con `Retry-After` cuando llega un 429.
+Sin Redis se usa un bucket local equivalente.
+"""
+
+import asyncio
+import re
+import time
+from typing import Any, Callable, Mapping, Optional
+import structlog
+
+logger = structlog.get_logger()
+
+# KEYS: bucket rpm, bucket tpm, clave de pausa global
+# ARGV: capacidad rpm, capacidad tpm, tokens solicitados
+# Devuelve 0 si se concedió capacidad, o los milisegundos a esperar.
+_ADQUIRIR = """
+local pausa = redis.call('PTTL', KEYS[3])
+if pausa > 0 then return pausa end
+local t = redis.call('TIME')
+local ahora = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local function rellenar(key, cap)
+    local d = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(d[1]) or cap
+    local ts = tonumber(d[2]) or ahora
+    return math.min(cap, tokens + (ahora - ts) * cap / 60000)
+end
+local rpm_cap, tpm_cap = tonumber(ARGV[1]), tonumber(ARGV[2])
+local pedidos = math.min(tonumber(ARGV[3]), tpm_cap)
+local r = rellenar(KEYS[1], rpm_cap)
+local k = rellenar(KEYS[2], tpm_cap)
+local espera = 0
+if r < 1 then espera = math.max(espera, math.ceil((1 - r) * 60000 / rpm_cap)) end
+if k < pedidos then espera = math.max(espera, math.ceil((pedidos - k) * 60000 / tpm_cap)) end
+if espera == 0 then
+    r = r - 1
+    k = k - pedidos
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(r), 'ts', ahora)
+redis.call('HSET', KEYS[2], 'tokens', tostring(k), 'ts', ahora)
+redis.call('PEXPIRE', KEYS[1], 120000)
+redis.call('PEXPIRE', KEYS[2], 120000)
+return espera
+"""
+
+# KEYS: bucket. ARGV: capacidad, delta (negativo consume), techo (-1 = sin techo)
+_AJUSTAR = """
+local t = redis.call('TIME')
+local ahora = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local cap = tonumber(ARGV[1])
+local d = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(d[1]) or cap
+local ts = tonumber(d[2]) or ahora
+tokens = math.min(cap, tokens + (ahora - ts) * cap / 60000) + tonumber(ARGV[2])
+local techo = tonumber(ARGV[3])
+if techo >= 0 then tokens = math.min(tokens, techo) end
+tokens = math.max(-cap, math.min(cap, tokens))
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', ahora)
+redis.call('PEXPIRE', KEYS[1], 120000)
+return 0
+"""
+
+_DURACION = re.compile(r"(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+(?:\.\d+)?)ms)?$")
+
+def estimar_tokens(texto: str) -> int:
+    """Estimación local de tokens (~4 caracteres por token en español)."""
+    return len(texto) // 4 + 1
+
+def parsear_duracion(valor: Optional[str]) -> Optional[float]:
+    """Convierte '2m59.56s', '7.66s', '320ms' o '12' (Retry-After) a segundos."""
+    if not valor:
+        return None
+    valor = valor.strip()
+    try:
+        return float(valor)
+    except ValueError:
+        pass
+    m = _DURACION.match(valor)
+    if not m or not any(m.groups()):
+        return None
+    h, mins, s, ms = (float(g) if g else 0.0 for g in m.groups())
+    return h * 3600 + mins * 60 + s + ms / 1000
+
+
+class LimiteTasaExcedido(Exception):
+    """No hubo capacidad de Groq dentro del tiempo máximo de espera."""
+    pass
+
+
+class _BucketLocal:
+    """Equivalente en memoria de los scripts Lua, usado cuando Redis no está disponible."""
+
+    def __init__(self, rpm: int, tpm: int):
+        ahora = time.monotonic()
+        self.cap = {"rpm": float(rpm), "tpm": float(tpm)}
+        self.tokens = dict(self.cap)
+        self.ts = {"rpm": ahora, "tpm": ahora}
+        self.pausa_hasta = 0.0
+
+    def _rellenar(self, nombre: str, ahora: float):
+        cap = self.cap[nombre]
+        self.tokens[nombre] = min(cap, self.tokens[nombre] + (ahora - self.ts[nombre]) * cap / 60)
+        self.ts[nombre] = ahora
+
+    def adquirir(self, pedidos: int) -> float:
+        ahora = time.monotonic()
+        if self.pausa_hasta > ahora:
+            return self.pausa_hasta - ahora
+        self._rellenar("rpm", ahora)
+        self._rellenar("tpm", ahora)
+        pedidos = min(pedidos, self.cap["tpm"])
+        espera = 0.0
+        if self.tokens["rpm"] < 1:
+            espera = max(espera, (1 - self.tokens["rpm"]) * 60 / self.cap["rpm"])
+        if self.tokens["tpm"] < pedidos:
+            espera = max(espera, (pedidos - self.tokens["tpm"]) * 60 / self.cap["tpm"])
+        if espera == 0:
+            self.tokens["rpm"] -= 1
+            self.tokens["tpm"] -= pedidos
+        return espera
+
+    def ajustar(self, nombre: str, delta: float, techo: Optional[float] = None):
+        self._rellenar(nombre, time.monotonic())
+        cap = self.cap[nombre]
+        tokens = self.tokens[nombre] + delta
+        if techo is not None:
+            tokens = min(tokens, techo)
+        self.tokens[nombre] = max(-cap, min(cap, tokens))
+
+    def pausar(self, segundos: float):
+        self.pausa_hasta = max(self.pausa_hasta, time.monotonic() + segundos)
+
+
+class LimitadorTasa:
+    """
+    Token bucket de peticiones y tokens por minuto.
+
+    Dentro de un proceso las esperas son FIFO (un único turno activo consultando el
+    bucket); entre réplicas el reparto lo decide el bucket compartido en Redis.
+    """
+
+    def __init__(
+        self,
+        obtener_redis: Callable[[], Any],
+        rpm: int,
+        tpm: int,
+        prefijo: str = "groq:ratelimit",
+        max_espera: float = 120.0,
+    ):
+        self.obtener_redis = obtener_redis
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_espera = max_espera
+        self.claves = (f"{prefijo}:rpm", f"{prefijo}:tpm", f"{prefijo}:pause")
+        self._local = _BucketLocal(rpm, tpm)
+        self._turno = asyncio.Lock()
+
+    async def _intentar(self, tokens: int) -> float:
+        """Intenta consumir capacidad; devuelve los segundos a esperar (0 = concedido)."""
+        redis = self.obtener_redis()
+        if redis is not None:
+            try:
+                espera_ms = await redis.eval(_ADQUIRIR, 3, *self.claves, self.rpm, self.tpm, tokens)
+                return int(espera_ms) / 1000
+            except Exception as e:
+                logger.warning("ratelimit_redis_error", error=str(e))
+        return self._local.adquirir(tokens)
+
+    async def adquirir(self, tokens_estimados: int):
+        """Espera hasta que haya capacidad para una petición de `tokens_estimados` tokens."""
+        inicio = time.monotonic()
+        async with self._turno:
+            while True:
+                espera = await self._intentar(tokens_estimados)
+                if espera <= 0:
+                    esperado = time.monotonic() - inicio
+                    if esperado > 0.05:
+                        logger.info("ratelimit_waited", seconds=round(esperado, 3), tokens=tokens_estimados)
+                    return
+                if time.monotonic() - inicio + espera > self.max_espera:
+                    raise LimiteTasaExcedido(f"Sin capacidad de Groq en {self.max_espera:.0f}s")
+                await asyncio.sleep(espera)
+
+    async def _ajustar(self, indice: int, capacidad: int, delta: float, techo: Optional[float] = None):
+        redis = self.obtener_redis()
+        if redis is not None:
+            try:
+                await redis.eval(_AJUSTAR, 1, self.claves[indice], capacidad, delta, -1 if techo is None else techo)
+                return
+            except Exception as e:
+                logger.warning("ratelimit_redis_error", error=str(e))
+        self._local.ajustar(("rpm", "tpm")[indice], delta, techo)
+
+    async def registrar_uso(self, tokens_estimados: int, tokens_reales: int):
+        """Corrige el bucket TPM con el uso real informado por la API."""
+        if tokens_reales != tokens_estimados:
+            await self._ajustar(1, self.tpm, tokens_estimados - tokens_reales)
+
+    async def sincronizar_cabeceras(self, headers: Mapping[str, str]):
+        """
+        Aplica las cabeceras de Groq: `remaining-tokens` limita el bucket TPM y, si se
+        agotaron las peticiones diarias (`remaining-requests` = 0), se pausa hasta el reset.
+        """
+        restantes_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if restantes_tokens is not None:
+            try:
+                await self._ajustar(1, self.tpm, 0, techo=float(restantes_tokens))
+            except ValueError:
+                pass
+        if headers.get("x-ratelimit-remaining-requests") == "0":
+            reset = parsear_duracion(headers.get("x-ratelimit-reset-requests"))
+            if reset:
+                await self.pausar(reset)
+
+    async def pausar(self, segundos: float):
+        """Detiene las peticiones de todas las réplicas durante `segundos` (p. ej. tras un 429)."""
+        logger.warning("ratelimit_paused", seconds=segundos)
+        redis = self.obtener_redis()
+        if redis is not None:
+            try:
+                await redis.set(self.claves[2], "1", px=max(1, int(segundos * 1000)))
+                return
+            except Exception as e:
+                logger.warning("ratelimit_redis_error", error=str(e))
+        self._local.pausar(segundos)
@@ -0,0 +1,136 @@
+"""
+Coalescencia de llamadas idénticas en vuelo (single-flight).
+
+Cuando el mismo historial llega varias veces en pocos segundos (reintentos del cliente,
+doble clic, re-envíos de lotes) solo la primera petición llama a Groq; las demás esperan
+su resultado.
+
+- SingleFlight: deduplicación dentro del proceso.
+- RedisSingleFlight: deduplicación entre réplicas con un lock en Redis y un canal pub/sub
+  por el que el líder publica el resultado.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+import structlog
+
+logger = structlog.get_logger()
+
+# Libera el lock solo si sigue siendo nuestro (evita borrar el de otro líder tras expirar)
+_LIBERAR_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class SingleFlight:
+    """Agrupa las llamadas concurrentes con la misma clave en una sola ejecución."""
+
+    def __init__(self):
+        self._en_vuelo: Dict[str, asyncio.Task] = {}
+
+    async def ejecutar(self, key: str, fn: Callable[[], Awaitable[str]]) -> str:
+        """
+        Ejecuta `fn` una sola vez por clave mientras haya una llamada en vuelo.
+
+        La ejecución corre en su propia tarea: si el primer solicitante se cancela,
+        los demás siguen esperando el mismo resultado.
+        """
+        task = self._en_vuelo.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._en_vuelo[key] = task
+            task.add_done_callback(lambda _: self._en_vuelo.pop(key, None))
+        else:
+            logger.info("singleflight_joined", key=key)
+        return await asyncio.shield(task)
+
+    def en_vuelo(self) -> int:
+        return len(self._en_vuelo)
+
+
+class RedisSingleFlight:
+    """
+    Single-flight entre réplicas. El líder toma `<key>:lock` con SET NX PX y publica
+    el resultado en `<key>:done`; los seguidores se suscriben y esperan hasta
+    `wait_timeout` segundos antes de llamar por su cuenta.
+    """
+
+    def __init__(self, obtener_redis: Callable[[], Any], lock_ttl: float = 180.0, wait_timeout: float = 150.0):
+        # Se pide la conexión en cada llamada: puede cambiar tras una reconexión
+        self.obtener_redis = obtener_redis
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+
+    async def ejecutar(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[str]],
+        leer_cache: Callable[[], Awaitable[Optional[str]]]
+    ) -> str:
+        redis = self.obtener_redis()
+        if redis is None:
+            return await fn()
+        token = uuid.uuid4().hex
+        lock_key, canal = f"{key}:lock", f"{key}:done"
+
+        try:
+            es_lider = await redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000))
+        except Exception as e:
+            logger.error("singleflight_lock_error", error=str(e))
+            return await fn()
+
+        if es_lider:
+            return await self._ejecutar_como_lider(redis, lock_key, canal, token, fn)
+
+        resultado = await self._esperar_lider(redis, canal, leer_cache)
+        if resultado is not None:
+            return resultado
+        logger.warning("singleflight_wait_failed", key=key)
+        return await fn()
+
+    async def _ejecutar_como_lider(self, redis, lock_key: str, canal: str, token: str, fn) -> str:
+        mensaje = {"ok": False}
+        try:
+            resultado = await fn()
+            mensaje = {"ok": True, "resultado": resultado}
+            return resultado
+        finally:
+            try:
+                await redis.publish(canal, json.dumps(mensaje))
+                await redis.eval(_LIBERAR_LOCK, 1, lock_key, token)
+            except Exception as e:
+                logger.error("singleflight_release_error", error=str(e))
+
+    async def _esperar_lider(self, redis, canal: str, leer_cache) -> Optional[str]:
+        """Devuelve el resultado del líder, o None si falló o no respondió a tiempo."""
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(canal)
+            # El líder pudo terminar antes de la suscripción: su resultado ya está en caché
+            cached = await leer_cache()
+            if cached:
+                return cached
+
+            limite = time.monotonic() + self.wait_timeout
+            while (restante := limite - time.monotonic()) > 0:
+                mensaje = await pubsub.get_message(ignore_subscribe_messages=True, timeout=restante)
+                if mensaje is None:
+                    continue
+                datos = json.loads(mensaje["data"])
+                logger.info("singleflight_joined", channel=canal, remote=True)
+                return datos["resultado"] if datos.get("ok") else None
+            return None
+        except Exception as e:
+            logger.error("singleflight_wait_error", error=str(e))
+            return None
+        finally:
+            try:
+                await pubsub.unsubscribe(canal)
+                await pubsub.aclose()
+            except Exception:
+                pass
@@ -0,0 +1,98 @@
+"""
+Trazas distribuidas (OpenTelemetry) desde /diagnose hasta cada llamada a Groq.
+
+Módulo común del orquestador y de los agentes (el orquestador lo toma de `Utils/`, igual
+que el modo monolito):
+
+- `middleware_trazas` abre un span de servidor por petición, con un request id
+  (`X-Request-ID`; se genera si no llega) en los logs de structlog y en la respuesta.
+- `hook_propagacion` añade ese id y el contexto W3C (`traceparent`) a las llamadas del
+  orquestador a los agentes, que continúan la misma traza hasta la caché y cada intento a
+  Groq (consulta a la caché, espera del limitador, cada intento y cada pausa entre reintentos).
+
+Con TRACE_DIR cada proceso escribe sus spans en `<TRACE_DIR>/<servicio>-<pid>.jsonl`, un
+span JSON por línea, para analizarlos sin colector (`scripts/trace_report.py`). Vacío = se
+usa el tracer nulo de OpenTelemetry (los spans no cuestan nada), pero el request id se
+sigue propagando. En modo monolito es el orquestador quien configura el exportador.
+"""
+
+import os
+import uuid
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Iterable, Optional
+import httpx
+import structlog
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+CABECERA_REQUEST_ID = "X-Request-ID"
+# Prometheus y las sondas de Kubernetes llaman constantemente: no se trazan
+RUTAS_SIN_TRAZA = ("/metrics", "/health")
+
+request_id_actual: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+tracer = trace.get_tracer("agentes")
+
+
+def configurar_trazas(servicio: str, directorio: str) -> Optional[str]:
+    """Exporta los spans del proceso a JSONL en `directorio`; devuelve la ruta (None si está vacío)."""
+    if not directorio:
+        return None
+    os.makedirs(directorio, exist_ok=True)
+    # Un archivo por proceso: varios workers nunca intercalan líneas en el mismo archivo
+    ruta = os.path.join(directorio, f"{servicio}-{os.getpid()}.jsonl")
+    salida = open(ruta, "a", encoding="utf-8")
+    exportador = ConsoleSpanExporter(out=salida, formatter=lambda span: span.to_json(indent=None) + "\n")
+    proveedor = TracerProvider(resource=Resource.create({"service.name": servicio}))
+    proveedor.add_span_processor(BatchSpanProcessor(exportador))
+    trace.set_tracer_provider(proveedor)
+    return ruta
+
+
+async def middleware_trazas(request, call_next):
+    """Middleware HTTP: continúa la traza entrante (si la hay) y fija el request id de los logs."""
+    if request.url.path.startswith(RUTAS_SIN_TRAZA):
+        return await call_next(request)
+    request_id = request.headers.get(CABECERA_REQUEST_ID) or uuid.uuid4().hex
+    request_id_actual.set(request_id)
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(request_id=request_id)
+    with tracer.start_as_current_span(
+        f"{request.method} {request.url.path}",
+        context=propagate.extract(request.headers),
+        kind=trace.SpanKind.SERVER,
+        attributes={"request_id": request_id},
+    ) as span:
+        contexto = span.get_span_context()
+        if contexto.is_valid:
+            structlog.contextvars.bind_contextvars(trace_id=trace.format_trace_id(contexto.trace_id))
+        response = await call_next(request)
+        span.set_attribute("http.status_code", response.status_code)
+    response.headers[CABECERA_REQUEST_ID] = request_id
+    return response
+
+
+def hook_propagacion(destinos: Iterable[str]) -> Callable[[httpx.Request], Awaitable[None]]:
+    """
+    Hook de httpx que añade el request id y `traceparent` a las peticiones dirigidas a
+    `destinos` (URLs de los agentes). El resto de peticiones del cliente sale sin ellas.
+    """
+    hosts = {httpx.URL(url).netloc for url in destinos}
+
+    async def inyectar(request: httpx.Request):
+        if request.url.netloc not in hosts:
+            return
+        request_id = request_id_actual.get()
+        if request_id:
+            request.headers[CABECERA_REQUEST_ID] = request_id
+        propagate.inject(request.headers)
+
+    return inyectar
+
+
+def marcar_error(error: BaseException):
+    """Marca como fallido el span actual cuando el error se captura y no llega a propagarse."""
+    span = trace.get_current_span()
+    span.record_exception(error)
+    span.set_status(trace.Status(trace.StatusCode.ERROR, str(error)))
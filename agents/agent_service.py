@@ -1,14 +1,22 @@
 import os
 import sys
-from fastapi import FastAPI, HTTPException, Body
+import json
+import asyncio
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Body, Header
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import structlog
 from dotenv import load_dotenv
+from prometheus_client import make_asgi_app
 
 # Add current directory to path so imports work
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from Utils.cliente_groq import ClienteGroq
+from Utils.enrutador import crear_cliente_llm
+from Utils.cascada import PoliticaCascada
+from Utils.metricas import medir_analisis
+from Utils.trazas import configurar_trazas, middleware_trazas
 from Utils.agentes import (
     AgenteOftalmologoGeneral,
     AgenteRetina,
@@ -27,14 +35,21 @@ app = FastAPI(title="Agente Oftalmológico Service")
 AGENT_TYPE = os.environ.get("AGENT_TYPE", "GENERAL").upper() # GENERAL, RETINA, CORNEA, NEURO, DIRECTOR
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 
-if not GROQ_API_KEY:
+# Deadline propagado por el orquestador (milisegundos restantes en la cabecera X-Deadline-Ms)
+MIN_BUDGET_MS = int(os.environ.get("AGENT_MIN_BUDGET_MS", 3000))
+TOKENS_PER_SECOND = float(os.environ.get("GROQ_TOKENS_PER_SECOND", 250))
+
+# Modo estructurado (JSON validado) por defecto para los especialistas; cada petición puede forzarlo
+STRUCTURED_OUTPUT = os.environ.get("STRUCTURED_OUTPUT", "false").lower() == "true"
+
+if not GROQ_API_KEY and not os.environ.get("GROQ_API_KEYS"):
     logger.error("startup_failed", reason="GROQ_API_KEY not found")
     # Don't exit here, let k8s restart or fail health check, but better to crash early
     # sys.exit(1)
 
 # Initialize Client
 try:
-    client = ClienteGroq(api_key=GROQ_API_KEY)
+    client = crear_cliente_llm(api_key=GROQ_API_KEY)
     logger.info("client_initialized")
 except Exception as e:
     logger.error("client_init_failed", error=str(e))
@@ -57,44 +72,151 @@ try:
     else:
         raise ValueError(f"Unknown AGENT_TYPE: {AGENT_TYPE}")
     
+    if AGENT_TYPE != "DIRECTOR":
+        agent_instance.cascada = PoliticaCascada.desde_entorno(AGENT_TYPE, client.modelo)
     logger.info("agent_initialized", type=AGENT_TYPE, name=getattr(agent_instance, 'nombre', 'Director'))
 
 except Exception as e:
     logger.error("agent_init_failed", error=str(e))
     sys.exit(1)
 
+# Trazas: continúa la traza del orquestador (traceparent + X-Request-ID); TRACE_DIR exporta a JSONL
+configurar_trazas(f"agent-{AGENT_TYPE.lower()}", os.environ.get("TRACE_DIR", ""))
+app.middleware("http")(middleware_trazas)
+
+
+@app.on_event("startup")
+async def startup_event():
+    await client.conectar()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await client.cerrar()
 
 class AnalysisRequest(BaseModel):
     historial: str
     reportes: dict = {} # Only for Director
+    faltantes: List[str] = [] # Only for Director: specialists that missed the deadline
+    estructurado: Optional[bool] = None # Only for specialists: overrides STRUCTURED_OUTPUT
+    nivel: Optional[str] = None # Only for specialists: cascade tier (fast, balanced, quality)
 
 class AnalysisResponse(BaseModel):
     resultado: str
     agent: str
+    estructurado: Optional[dict] = None # Validated JSON report when structured mode succeeded
+    modelo: Optional[str] = None # Model that produced the report when the cascade is enabled
+    escalado: Optional[bool] = None
 
 @app.get("/health")
 def health_check():
     return {"status": "ok", "agent_type": AGENT_TYPE}
 
+@app.get("/cache/stats")
+def cache_stats():
+    return client.estadisticas_cache()
+
+@app.get("/providers/stats")
+def providers_stats():
+    return client.estado()
+
+def max_tokens_for_budget(budget_s: Optional[float]) -> Optional[int]:
+    """Recorta la generación para que quepa en el presupuesto (1s reservado para el prompt)."""
+    if budget_s is None:
+        return None
+    affordable = int(max(0.0, budget_s - 1.0) * TOKENS_PER_SECOND)
+    return max(256, min(client.max_tokens, affordable))
+
+async def analyze_structured(historial: str, max_tokens: Optional[int]) -> AnalysisResponse:
+    """Reporte JSON validado; si el modelo no cumple el esquema se recurre al reporte libre."""
+    try:
+        report = await agent_instance.analizar_estructurado(historial, max_tokens=max_tokens)
+    except ValueError as e:
+        logger.warning("structured_output_invalid", agent=AGENT_TYPE, error=str(e))
+        result = await agent_instance.analizar(historial, max_tokens=max_tokens)
+        return AnalysisResponse(resultado=result, agent=AGENT_TYPE)
+    logger.info("analysis_completed", agent=AGENT_TYPE, structured=True)
+    return AnalysisResponse(resultado=report.a_texto(), agent=AGENT_TYPE, estructurado=report.model_dump(mode="json"))
+
+async def analyze_cascade(historial: str, max_tokens: Optional[int], tier: Optional[str]) -> AnalysisResponse:
+    """Modelo rápido primero; el grande solo si el reporte no pasa la verificación."""
+    cascade = await agent_instance.analizar_en_cascada(historial, max_tokens=max_tokens, nivel=tier)
+    logger.info("analysis_completed", agent=AGENT_TYPE, model=cascade.modelo, escalated=cascade.escalado, reason=cascade.motivo)
+    return AnalysisResponse(resultado=cascade.texto, agent=AGENT_TYPE, modelo=cascade.modelo, escalado=cascade.escalado)
+
+AGENT_KIND = "director" if AGENT_TYPE == "DIRECTOR" else "specialist"
+
 @app.post("/analyze", response_model=AnalysisResponse)
-async def analyze(request: AnalysisRequest):
+async def analyze(request: AnalysisRequest, x_deadline_ms: Optional[int] = Header(None)):
+    async with medir_analisis(AGENT_TYPE, AGENT_KIND):
+        return await run_analysis(request, x_deadline_ms)
+
+async def run_analysis(request: AnalysisRequest, x_deadline_ms: Optional[int]) -> AnalysisResponse:
+    budget_s = x_deadline_ms / 1000 if x_deadline_ms is not None else None
     try:
-        logger.info("analysis_started", agent=AGENT_TYPE)
+        logger.info("analysis_started", agent=AGENT_TYPE, budget_ms=x_deadline_ms)
+        if x_deadline_ms is not None and x_deadline_ms < MIN_BUDGET_MS:
+            raise HTTPException(status_code=504, detail="Deadline budget too small to analyze")
+        max_tokens = max_tokens_for_budget(budget_s)
         
         if AGENT_TYPE == "DIRECTOR":
             if not request.reportes:
                 raise HTTPException(status_code=400, detail="Director requires 'reportes'")
-            result = agent_instance.analizar_reportes(request.historial, request.reportes)
+            work = agent_instance.analizar_reportes(
+                request.historial, request.reportes, faltantes=request.faltantes, max_tokens=max_tokens
+            )
         else:
-            result = agent_instance.analizar(request.historial)
+            structured = STRUCTURED_OUTPUT if request.estructurado is None else request.estructurado
+            if structured:
+                return await asyncio.wait_for(analyze_structured(request.historial, max_tokens), timeout=budget_s)
+            if agent_instance.cascada:
+                return await asyncio.wait_for(analyze_cascade(request.historial, max_tokens, request.nivel), timeout=budget_s)
+            work = agent_instance.analizar(request.historial, max_tokens=max_tokens)
+        result = await asyncio.wait_for(work, timeout=budget_s)
             
         logger.info("analysis_completed", agent=AGENT_TYPE)
         return AnalysisResponse(resultado=result, agent=AGENT_TYPE)
         
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        logger.error("analysis_deadline_exceeded", agent=AGENT_TYPE, budget_ms=x_deadline_ms)
+        raise HTTPException(status_code=504, detail="Deadline exceeded")
     except Exception as e:
         logger.error("analysis_failed", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(event: str, data: dict) -> str:
+    """Serializa un evento Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: AnalysisRequest):
+    """Igual que /analyze pero emite los fragmentos de Groq como SSE (`delta`, `done`, `error`)."""
+    if AGENT_TYPE == "DIRECTOR":
+        if not request.reportes:
+            raise HTTPException(status_code=400, detail="Director requires 'reportes'")
+        fragmentos = agent_instance.analizar_reportes_stream(request.historial, request.reportes, request.faltantes)
+    else:
+        fragmentos = agent_instance.analizar_stream(request.historial)
+
+    async def event_generator():
+        logger.info("analysis_stream_started", agent=AGENT_TYPE)
+        try:
+            async with medir_analisis(AGENT_TYPE, AGENT_KIND):
+                async for fragmento in fragmentos:
+                    yield sse_event("delta", {"text": fragmento})
+            logger.info("analysis_stream_completed", agent=AGENT_TYPE)
+            yield sse_event("done", {"agent": AGENT_TYPE})
+        except Exception as e:
+            logger.error("analysis_stream_failed", error=str(e))
+            yield sse_event("error", {"agent": AGENT_TYPE, "detail": str(e)})
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+# Expose Prometheus metrics
+metrics_app = make_asgi_app()
+app.mount("/metrics", metrics_app)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
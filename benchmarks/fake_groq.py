@@ -0,0 +1,199 @@
+"""
+Servidor local compatible con la API de Groq/OpenAI (`/openai/v1/chat/completions`) para
+los benchmarks: sustituye a Groq sin consumir cuota y con un perfil de latencia y fallos
+reproducible.
+
+Perfil (variables de entorno o `POST /config` en caliente):
+- FAKE_GROQ_TTFT_MS: tiempo hasta el primer token.
+- FAKE_GROQ_TOKENS_PER_SECOND: velocidad de generación.
+- FAKE_GROQ_COMPLETION_TOKENS: tokens de cada respuesta (como mucho `max_tokens`).
+- FAKE_GROQ_ERROR_RATE / FAKE_GROQ_RATE_LIMIT_RATE: fracción de respuestas 500 / 429.
+- FAKE_GROQ_RETRY_AFTER: cabecera `Retry-After` (segundos) de los 429.
+- FAKE_GROQ_SEED: semilla de los fallos aleatorios.
+
+Los agentes lo usan con `GROQ_BASE_URL=http://localhost:9000` (el SDK de Groq añade
+`/openai/v1`). `GET /stats` devuelve las llamadas recibidas y `POST /reset` las pone a cero.
+
+    uvicorn fake_groq:app --app-dir benchmarks --port 9000
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from typing import Optional
+from fastapi import Body, FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+app = FastAPI(title="Fake Groq")
+
+
+class Profile(BaseModel):
+    ttft_ms: float = float(os.environ.get("FAKE_GROQ_TTFT_MS", 300))
+    tokens_per_second: float = float(os.environ.get("FAKE_GROQ_TOKENS_PER_SECOND", 250))
+    completion_tokens: int = int(os.environ.get("FAKE_GROQ_COMPLETION_TOKENS", 400))
+    error_rate: float = float(os.environ.get("FAKE_GROQ_ERROR_RATE", 0))
+    rate_limit_rate: float = float(os.environ.get("FAKE_GROQ_RATE_LIMIT_RATE", 0))
+    retry_after: float = float(os.environ.get("FAKE_GROQ_RETRY_AFTER", 1))
+    seed: Optional[int] = int(os.environ["FAKE_GROQ_SEED"]) if os.environ.get("FAKE_GROQ_SEED") else None
+
+
+profile = Profile()
+rng = random.Random(profile.seed)
+stats = {"calls": 0, "completed": 0, "rate_limited": 0, "errors": 0, "streams": 0,
+         "prompt_tokens": 0, "completion_tokens": 0, "by_model": {}}
+
+REPORT = """1. **HALLAZGOS RELEVANTES**
+- Disminución de agudeza visual referida por el paciente
+- Exploración compatible con afectación de la especialidad consultada
+
+2. **DIAGNÓSTICO DIFERENCIAL**
+1. Diagnóstico principal simulado
+2. Alternativa simulada
+
+3. **PRUEBAS DIAGNÓSTICAS RECOMENDADAS**
+- Tomografía de coherencia óptica
+- Campimetría
+
+4. **TRATAMIENTO SUGERIDO**
+- Seguimiento y tratamiento según hallazgos
+
+5. **NIVEL DE URGENCIA**: MEDIO
+
+CERTEZA: 85%
+"""
+
+STRUCTURED_REPORT = {
+    "hallazgos": ["Disminución de agudeza visual"],
+    "diagnostico_diferencial": [{"diagnostico": "Diagnóstico principal simulado", "justificacion": "simulado"}],
+    "pruebas": ["Tomografía de coherencia óptica"],
+    "tratamiento": ["Seguimiento según hallazgos"],
+    "nivel_urgencia": "MEDIO",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def completion_text(body: dict, tokens: int) -> str:
+    """Reporte con las secciones que esperan compactación y cascada, rellenado hasta `tokens`."""
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        system = " ".join(m["content"] for m in body["messages"] if m["role"] == "system").lower()
+        if "triage" in system:
+            return json.dumps({"especialistas": ["RETINA", "CORNEA", "NEURO"], "motivo": "simulado"})
+        return json.dumps(STRUCTURED_REPORT, ensure_ascii=False)
+    filler = max(0, tokens - estimate_tokens(REPORT))
+    return REPORT + "\nNotas: " + " ".join("seguimiento" for _ in range(filler // 3))
+
+
+def rate_limit_headers() -> dict:
+    return {
+        "x-ratelimit-limit-requests": "14400",
+        "x-ratelimit-remaining-requests": "14000",
+        "x-ratelimit-limit-tokens": "60000",
+        "x-ratelimit-remaining-tokens": "50000",
+        "x-ratelimit-reset-requests": "2s",
+        "x-ratelimit-reset-tokens": "1s",
+    }
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["calls"] += 1
+    model = body.get("model", "unknown")
+    stats["by_model"][model] = stats["by_model"].get(model, 0) + 1
+
+    draw = rng.random()
+    if draw < profile.rate_limit_rate:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": str(profile.retry_after), **rate_limit_headers()},
+            content={"error": {"message": "Rate limit reached (fake)", "type": "rate_limit_exceeded"}},
+        )
+    if draw < profile.rate_limit_rate + profile.error_rate:
+        stats["errors"] += 1
+        return JSONResponse(status_code=500, content={"error": {"message": "Internal error (fake)"}})
+
+    tokens = min(profile.completion_tokens, body.get("max_tokens") or profile.completion_tokens)
+    text = completion_text(body, tokens)
+    prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in body["messages"])
+    completion_tokens = estimate_tokens(text)
+    stats["prompt_tokens"] += prompt_tokens
+    stats["completion_tokens"] += completion_tokens
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+             "total_tokens": prompt_tokens + completion_tokens}
+
+    if body.get("stream"):
+        stats["streams"] += 1
+
+        async def events():
+            await asyncio.sleep(profile.ttft_ms / 1000)
+            words = text.split(" ")
+            # Un token ~ una palabra; se emiten en grupos para no saturar el event loop
+            per_chunk = 8
+            for i in range(0, len(words), per_chunk):
+                chunk = " ".join(words[i:i + per_chunk]) + (" " if i + per_chunk < len(words) else "")
+                payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                           "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]}
+                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(per_chunk / profile.tokens_per_second)
+            final = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "x_groq": {"usage": usage}}
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+            stats["completed"] += 1
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=rate_limit_headers())
+
+    await asyncio.sleep(profile.ttft_ms / 1000 + completion_tokens / profile.tokens_per_second)
+    stats["completed"] += 1
+    return JSONResponse(
+        headers=rate_limit_headers(),
+        content={
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        },
+    )
+
+
+@app.get("/config")
+def get_config():
+    return profile
+
+
+@app.post("/config")
+def set_config(changes: dict = Body(...)):
+    """Cambia el perfil (solo los campos enviados) y reinicia la semilla."""
+    global profile, rng
+    profile = Profile(**{**profile.model_dump(), **changes})
+    rng = random.Random(profile.seed)
+    return profile
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+
+@app.post("/reset")
+def reset_stats():
+    for key in stats:
+        stats[key] = {} if key == "by_model" else 0
+    return stats
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
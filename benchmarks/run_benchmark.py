@@ -0,0 +1,291 @@
+"""
+Benchmark macro del pipeline completo (orquestador + agentes + Redis) contra `fake_groq.py`.
+
+Para cada nivel de concurrencia lanza `--requests` diagnósticos a `/diagnose` y mide:
+latencia p50/p95/p99, throughput, errores HTTP, llamadas a Groq por diagnóstico (según
+`GET /stats` del servidor falso) y ratio de aciertos de caché (según `GET /cache/stats`
+del orquestador).
+
+Cada ejecución se guarda en `benchmarks/results/<fecha>_<escenario>_<commit>.json` y se compara con
+la anterior del mismo escenario para detectar regresiones entre commits:
+
+    python benchmarks/run_benchmark.py --scenario baseline --concurrency 1,4,16
+    python benchmarks/run_benchmark.py --scenario rate-limited --rate-limit-rate 0.1 --retry-after 2
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+HISTORIALES_DIR = os.path.join(os.path.dirname(BENCH_DIR), "Historales_Oftalmologicos")
+
+# Métricas comparadas con la ejecución anterior: (clave, sentido en que empeoran)
+REGRESSION_METRICS = (("p50_ms", "up"), ("p95_ms", "up"), ("p99_ms", "up"), ("throughput_per_min", "down"),
+                      ("groq_calls_per_diagnosis", "up"), ("error_rate", "up"))
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Percentil por interpolación lineal (0 si no hay valores)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=BENCH_DIR, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, cwd=BENCH_DIR).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_historiales(directory: str) -> List[str]:
+    historiales = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.txt"))):
+        with open(path, "rb") as f:
+            data = f.read()
+        try:
+            historiales.append(data.decode("utf-8-sig"))
+        except UnicodeDecodeError:
+            historiales.append(data.decode("latin-1"))
+    if not historiales:
+        raise SystemExit(f"No hay historiales .txt en {directory}")
+    return historiales
+
+
+def cache_totals(stats: Dict[str, dict]) -> Dict[str, int]:
+    """Suma aciertos y fallos de caché de todos los agentes (los que la tengan activa)."""
+    hits = sum(s.get("l1_hits", 0) + s.get("l2_hits", 0) for s in stats.values() if isinstance(s, dict))
+    misses = sum(s.get("misses", 0) for s in stats.values() if isinstance(s, dict))
+    return {"hits": hits, "misses": misses}
+
+
+async def fetch_json(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> Optional[dict]:
+    try:
+        response = await client.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"  ! {method} {url}: {e}")
+        return None
+
+
+async def run_level(client: httpx.AsyncClient, args: argparse.Namespace, historiales: List[str],
+                    concurrency: int) -> dict:
+    """Ejecuta `args.requests` diagnósticos con `concurrency` en vuelo y devuelve sus métricas."""
+    await fetch_json(client, "POST", f"{args.fake_url}/reset")
+    cache_before = cache_totals(await fetch_json(client, "GET", f"{args.orchestrator_url}/cache/stats") or {})
+
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    queue = asyncio.Queue()
+    for i in range(args.requests):
+        historial = historiales[i % len(historiales)]
+        if args.unique:
+            # Historial distinto en cada petición: mide el pipeline sin aciertos de caché
+            historial += f"\n\nReferencia de benchmark: {uuid.uuid4().hex}"
+        queue.put_nowait(historial)
+
+    async def worker():
+        while not queue.empty():
+            historial = queue.get_nowait()
+            payload = {"historial": historial}
+            if args.tier:
+                payload["tier"] = args.tier
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{args.orchestrator_url}{args.endpoint}", json=payload,
+                                             timeout=args.timeout)
+                status = str(response.status_code)
+                if response.status_code == 200:
+                    status = response.json().get("status", status)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            statuses[status] = statuses.get(status, 0) + 1
+            if status in ("completed", "partial"):
+                latencies.append(elapsed_ms)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+
+    groq = await fetch_json(client, "GET", f"{args.fake_url}/stats") or {}
+    cache_after = cache_totals(await fetch_json(client, "GET", f"{args.orchestrator_url}/cache/stats") or {})
+    hits = cache_after["hits"] - cache_before["hits"]
+    lookups = hits + cache_after["misses"] - cache_before["misses"]
+    succeeded = len(latencies)
+
+    return {
+        "concurrency": concurrency,
+        "requests": args.requests,
+        "succeeded": succeeded,
+        "statuses": statuses,
+        "error_rate": round(1 - succeeded / args.requests, 4) if args.requests else 0.0,
+        "duration_s": round(duration, 3),
+        "throughput_per_min": round(succeeded / duration * 60, 2) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(max(latencies, default=0.0), 1),
+        "groq_calls": groq.get("calls"),
+        "groq_rate_limited": groq.get("rate_limited"),
+        "groq_errors": groq.get("errors"),
+        "groq_calls_per_diagnosis": round(groq["calls"] / succeeded, 2) if succeeded and "calls" in groq else None,
+        "cache_hit_ratio": round(hits / lookups, 3) if lookups else None,
+    }
+
+
+def previous_result(scenario: str) -> Optional[dict]:
+    runs = []
+    for path in glob.glob(os.path.join(RESULTS_DIR, "*.json")):
+        with open(path, encoding="utf-8") as f:
+            run = json.load(f)
+        if run.get("scenario") == scenario:
+            runs.append((run.get("timestamp", ""), path, run))
+    if not runs:
+        return None
+    _, path, run = max(runs)
+    run["path"] = path
+    return run
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regresiones (más de `tolerance` relativo) por nivel de concurrencia frente a `baseline`."""
+    regressions = []
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in current["levels"]:
+        before = previous.get(level["concurrency"])
+        if not before:
+            continue
+        for key, worse in REGRESSION_METRICS:
+            old, new = before.get(key), level.get(key)
+            if old is None or new is None:
+                continue
+            if key == "error_rate":
+                regressed = new - old > tolerance
+            elif not old:
+                continue
+            else:
+                change = (new - old) / old
+                regressed = change > tolerance if worse == "up" else change < -tolerance
+            if regressed:
+                regressions.append(f"c={level['concurrency']} {key}: {old} -> {new}")
+    return regressions
+
+
+def print_table(levels: List[dict]):
+    header = f"{'conc':>5} {'ok':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'diag/min':>9} {'groq/diag':>10} {'cache hit':>10}"
+    print(header)
+    print("-" * len(header))
+    for level in levels:
+        per_diag = level["groq_calls_per_diagnosis"]
+        hit = level["cache_hit_ratio"]
+        print(f"{level['concurrency']:>5} {level['succeeded']:>5} {level['p50_ms']:>9} {level['p95_ms']:>9} "
+              f"{level['p99_ms']:>9} {level['throughput_per_min']:>9} "
+              f"{per_diag if per_diag is not None else '-':>10} {hit if hit is not None else '-':>10}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orchestrator-url", default=os.environ.get("BENCH_ORCHESTRATOR_URL", "http://localhost:8000"))
+    parser.add_argument("--fake-url", default=os.environ.get("BENCH_FAKE_GROQ_URL", "http://localhost:9000"))
+    parser.add_argument("--scenario", default="baseline", help="Nombre del escenario (agrupa las comparaciones)")
+    parser.add_argument("--concurrency", default="1,4,16", help="Niveles de concurrencia separados por comas")
+    parser.add_argument("--requests", type=int, default=32, help="Diagnósticos por nivel")
+    parser.add_argument("--endpoint", default="/diagnose")
+    parser.add_argument("--tier", choices=("fast", "balanced", "quality"))
+    parser.add_argument("--unique", action="store_true", help="Historial distinto en cada petición (sin caché)")
+    parser.add_argument("--historiales", default=HISTORIALES_DIR)
+    parser.add_argument("--timeout", type=float, default=180.0)
+    # Perfil del servidor falso; sin indicar se mantiene el que tenga
+    parser.add_argument("--ttft-ms", type=float)
+    parser.add_argument("--tokens-per-second", type=float)
+    parser.add_argument("--completion-tokens", type=int)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--rate-limit-rate", type=float)
+    parser.add_argument("--retry-after", type=float)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Cambio relativo que cuenta como regresión")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--no-save", action="store_true")
+    return parser.parse_args(argv)
+
+
+async def main(args: argparse.Namespace) -> int:
+    historiales = load_historiales(args.historiales)
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    profile_fields = ("ttft_ms", "tokens_per_second", "completion_tokens", "error_rate",
+                      "rate_limit_rate", "retry_after", "seed")
+    changes = {k: getattr(args, k) for k in profile_fields if getattr(args, k) is not None}
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=max(levels) + 8)) as client:
+        profile = await fetch_json(client, "POST", f"{args.fake_url}/config", json=changes) if changes \
+            else await fetch_json(client, "GET", f"{args.fake_url}/config")
+        if profile is None:
+            print(f"✗ Servidor falso no disponible en {args.fake_url}")
+            return 2
+        print(f"Escenario '{args.scenario}' · perfil {json.dumps(profile)}")
+
+        results = []
+        for concurrency in levels:
+            print(f"→ concurrencia {concurrency} ({args.requests} diagnósticos)...")
+            results.append(await run_level(client, args, historiales, concurrency))
+
+    run = {
+        "scenario": args.scenario,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "endpoint": args.endpoint,
+        "tier": args.tier,
+        "unique": args.unique,
+        "fake_groq_profile": profile,
+        "levels": results,
+    }
+    print()
+    print_table(results)
+
+    exit_code = 0
+    baseline = previous_result(args.scenario)
+    if baseline:
+        regressions = compare(run, baseline, args.tolerance)
+        print(f"\nComparado con {os.path.basename(baseline['path'])} (commit {baseline.get('commit')}):")
+        for key in ("fake_groq_profile", "endpoint", "tier", "unique"):
+            if baseline.get(key) != run[key]:
+                print(f"  ! {key} distinto del de la ejecución anterior: la comparación no es homogénea")
+        for regression in regressions:
+            print(f"  ✗ regresión {regression}")
+        if not regressions:
+            print(f"  ✓ sin regresiones (tolerancia {args.tolerance:.0%})")
+        elif args.fail_on_regression:
+            exit_code = 1
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{args.scenario}_{run['commit']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(run, f, ensure_ascii=False, indent=2)
+        print(f"\nResultados guardados en {path}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -1,7 +1,12 @@
 
+import argparse
+import json
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
 # Importar cliente y agentes
@@ -14,6 +19,10 @@ from Utils.agentes import (
     EquipoMultidisciplinarioOftalmologico
 )
 
+# Checkpoints de lotes en SQLite (mismo módulo que usa el orquestador)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "orchestrator"))
+from checkpoints import DIRECTOR_STAGE, CheckpointStore
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -56,6 +65,21 @@ def leer_historial(ruta_archivo: str) -> str:
         print(f"✗ Error al leer el archivo: {e}")
         sys.exit(1)
 
+def leer_historial_lote(ruta_archivo: str) -> str:
+    """
+    Lee un historial en modo lote: UTF-8 y, si no es válido, Latin-1. A diferencia de
+    `leer_historial` no termina el proceso: los errores se propagan al registro.
+    """
+    with open(ruta_archivo, 'rb') as f:
+        datos = f.read()
+    try:
+        contenido = datos.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        contenido = datos.decode('latin-1')
+    if not contenido.strip():
+        raise ValueError("Historial vacío")
+    return contenido
+
 def guardar_resultado(contenido: str, ruta_salida: str):
     """
     Guarda el resultado final en un archivo con timestamp.
@@ -96,6 +120,210 @@ def mostrar_progreso(paso: int, total: int, descripcion: str):
     barra = "█" * bloques_completos + "░" * (20 - bloques_completos)
     print(f"[{barra}] {porcentaje:.0f}% - {descripcion}")
 
+def consultar_especialistas(
+    historial: str,
+    agentes: list,
+    pool: ThreadPoolExecutor,
+    al_terminar=None
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Consulta a todos los especialistas a la vez (un hilo por agente en `pool`).
+
+    Args:
+        historial: Historial clínico
+        agentes: Agentes especialistas
+        pool: Pool de hilos compartido para las llamadas a Groq
+        al_terminar: Callback opcional (agente, reporte, error) por cada agente que termina
+
+    Returns:
+        (reportes, errores): reportes por especialidad, en el orden de `agentes`, y
+        los errores de los especialistas que fallaron
+    """
+    futuros = {pool.submit(agente.analizar, historial): agente for agente in agentes}
+    recibidos, errores = {}, {}
+    for futuro in as_completed(futuros):
+        agente = futuros[futuro]
+        try:
+            recibidos[agente.especialidad] = futuro.result()
+            if al_terminar:
+                al_terminar(agente, recibidos[agente.especialidad], None)
+        except Exception as e:
+            errores[agente.especialidad] = str(e)
+            if al_terminar:
+                al_terminar(agente, None, e)
+    # El director recibe los reportes siempre en el mismo orden
+    reportes = {a.especialidad: recibidos[a.especialidad] for a in agentes if a.especialidad in recibidos}
+    return reportes, errores
+
+def generar_metadata(modelo: str, especialistas: int, historial: str = None) -> str:
+    """Cabecera del documento de diagnóstico final."""
+    origen = f"Historial: {historial}\n" if historial else ""
+    return f"""{'='*70}
+DIAGNÓSTICO OFTALMOLÓGICO - REPORTE FINAL
+{'='*70}
+Fecha de generación: {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}
+{origen}Sistema: Multi-Agente Oftalmológico
+Modelo de IA: Groq - {modelo}
+Especialistas consultados: {especialistas}
+{'='*70}
+
+"""
+
+def procesar_registro(
+    ruta_historial: str,
+    agentes: list,
+    director,
+    modelo: str,
+    dir_salida: str,
+    pool_especialistas: ThreadPoolExecutor,
+    checkpoints: Optional[CheckpointStore] = None
+) -> dict:
+    """
+    Diagnostica un historial del lote: especialistas en paralelo, consenso del director y
+    resultado en `dir_salida/<historial>_diagnostico.txt`.
+
+    Con `checkpoints`, cada reporte y el consenso se guardan al terminar; las etapas ya
+    guardadas para este historial y modelo no se vuelven a pedir a Groq.
+
+    Returns:
+        dict: Métricas del registro (estado, latencias en segundos, especialistas, error)
+    """
+    nombre = os.path.basename(ruta_historial)
+    inicio = time.perf_counter()
+    registro = {"archivo": nombre, "estado": "fallido", "especialistas": 0, "etapas_reutilizadas": 0, "error": None}
+    try:
+        historial = leer_historial_lote(ruta_historial)
+        clave = CheckpointStore.record_key(historial, modelo) if checkpoints else None
+        previas = checkpoints.load(clave) if checkpoints else {}
+        registro["etapas_reutilizadas"] = len(previas)
+
+        def guardar_etapa(agente, respuesta, error):
+            if checkpoints and error is None:
+                checkpoints.save(clave, agente.especialidad, respuesta)
+
+        pendientes = [a for a in agentes if a.especialidad not in previas]
+        nuevos, errores = consultar_especialistas(historial, pendientes, pool_especialistas, guardar_etapa)
+        reportes = {
+            a.especialidad: previas[a.especialidad] if a.especialidad in previas else nuevos[a.especialidad]
+            for a in agentes if a.especialidad in previas or a.especialidad in nuevos
+        }
+        registro["latencia_especialistas"] = time.perf_counter() - inicio
+        registro["especialistas"] = len(reportes)
+        if not reportes:
+            raise RuntimeError(f"Ningún especialista respondió: {errores}")
+
+        inicio_director = time.perf_counter()
+        # El consenso guardado solo vale si se hizo con todos los reportes
+        diagnostico_final = previas.get(DIRECTOR_STAGE) if not errores else None
+        if diagnostico_final is None:
+            diagnostico_final = director.analizar_reportes(historial, reportes)
+            if checkpoints and not errores:
+                checkpoints.save(clave, DIRECTOR_STAGE, diagnostico_final)
+        registro["latencia_director"] = time.perf_counter() - inicio_director
+
+        ruta_salida = os.path.join(dir_salida, f"{os.path.splitext(nombre)[0]}_diagnostico.txt")
+        with open(ruta_salida, 'w', encoding='utf-8') as f:
+            f.write(generar_metadata(modelo, len(reportes), nombre) + diagnostico_final)
+        registro["salida"] = ruta_salida
+        registro["estado"] = "completado" if not errores else "parcial"
+        if errores:
+            registro["error"] = "; ".join(f"{esp}: {err}" for esp, err in errores.items())
+    except Exception as e:
+        registro["error"] = str(e)
+    registro["latencia"] = time.perf_counter() - inicio
+    return registro
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil por el método del rango más cercano (0 si no hay valores)."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+def procesar_directorio(
+    directorio: str,
+    agentes: list,
+    director,
+    modelo: str,
+    dir_salida: str = "resultados",
+    concurrencia: int = 2,
+    checkpoints: Optional[CheckpointStore] = None
+) -> dict:
+    """
+    Diagnostica todos los historiales `.txt` de `directorio`, con hasta `concurrencia`
+    registros a la vez y los especialistas de cada registro en paralelo.
+
+    Escribe un diagnóstico por registro en `dir_salida` y un resumen de rendimiento
+    (`resumen_lote_<timestamp>.json`). Con `checkpoints`, relanzar un lote interrumpido
+    solo repite las etapas que faltaban.
+
+    Returns:
+        dict: Resumen del lote
+    """
+    archivos = sorted(
+        os.path.join(directorio, nombre) for nombre in os.listdir(directorio)
+        if nombre.lower().endswith('.txt') and not nombre.startswith('.')
+    )
+    if not archivos:
+        raise FileNotFoundError(f"No hay historiales .txt en {directorio}")
+    os.makedirs(dir_salida, exist_ok=True)
+
+    print(f"✓ {len(archivos)} historiales en {directorio}")
+    print(f"  Registros simultáneos: {concurrencia} (hasta {concurrencia * len(agentes)} llamadas a Groq a la vez)\n")
+
+    registros = []
+    inicio = time.perf_counter()
+    # Dos pools: uno por registro y otro, compartido, para las llamadas a especialistas.
+    # Con uno solo, los registros ocuparían todos los hilos esperando a sus especialistas.
+    with ThreadPoolExecutor(max_workers=concurrencia * len(agentes)) as pool_especialistas, \
+            ThreadPoolExecutor(max_workers=concurrencia) as pool_registros:
+        futuros = [
+            pool_registros.submit(
+                procesar_registro, ruta, agentes, director, modelo, dir_salida, pool_especialistas, checkpoints
+            )
+            for ruta in archivos
+        ]
+        for idx, futuro in enumerate(as_completed(futuros), 1):
+            registro = futuro.result()
+            registros.append(registro)
+            simbolo = "✓" if registro["estado"] != "fallido" else "✗"
+            mostrar_progreso(idx, len(archivos), f"{simbolo} {registro['archivo']} ({registro['latencia']:.1f}s)")
+            if registro["error"]:
+                print(f"    {registro['error']}")
+    duracion = time.perf_counter() - inicio
+
+    latencias = [r["latencia"] for r in registros if r["estado"] != "fallido"]
+    resumen = {
+        "directorio": directorio,
+        "registros": len(registros),
+        "completados": sum(1 for r in registros if r["estado"] == "completado"),
+        "parciales": sum(1 for r in registros if r["estado"] == "parcial"),
+        "fallidos": sum(1 for r in registros if r["estado"] == "fallido"),
+        "concurrencia": concurrencia,
+        "etapas_reutilizadas": sum(r["etapas_reutilizadas"] for r in registros),
+        "duracion_s": round(duracion, 2),
+        "throughput_por_min": round(len(registros) / duracion * 60, 2) if duracion else 0.0,
+        "latencia_s": {
+            "p50": round(percentil(latencias, 50), 2),
+            "p95": round(percentil(latencias, 95), 2),
+            "max": round(max(latencias, default=0.0), 2),
+        },
+        "latencia_media_especialistas_s": round(
+            sum(r.get("latencia_especialistas", 0.0) for r in registros) / len(registros), 2
+        ),
+        "latencia_media_director_s": round(
+            sum(r.get("latencia_director", 0.0) for r in registros) / len(registros), 2
+        ),
+        "detalle": sorted(registros, key=lambda r: r["archivo"]),
+    }
+
+    ruta_resumen = os.path.join(dir_salida, f"resumen_lote_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(ruta_resumen, 'w', encoding='utf-8') as f:
+        json.dump(resumen, f, ensure_ascii=False, indent=2)
+    resumen["archivo_resumen"] = ruta_resumen
+    return resumen
+
 def verificar_api_key() -> str:
     """Verifica y obtiene la API key."""
     api_key = os.environ.get("GROQ_API_KEY")
@@ -130,8 +358,35 @@ def verificar_api_key() -> str:
     
     return api_key
 
+def parsear_argumentos(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Diagnóstico oftalmológico multi-agente (Groq)")
+    parser.add_argument(
+        "--archivo",
+        default=os.path.join("Historales_Oftalmologicos", "Reporte - Steve Rogers - Vision Borrosa.txt"),
+        help="Historial a diagnosticar (modo de un solo registro)"
+    )
+    parser.add_argument(
+        "--directorio",
+        help="Diagnostica todos los historiales .txt del directorio (modo lote)"
+    )
+    parser.add_argument(
+        "--concurrencia", type=int, default=int(os.environ.get("CLI_BATCH_CONCURRENCY", 2)),
+        help="Registros simultáneos en modo lote (cada uno consulta a los 4 especialistas a la vez)"
+    )
+    parser.add_argument("--salida", default="resultados", help="Directorio de resultados")
+    parser.add_argument(
+        "--checkpoints",
+        help="Base SQLite de checkpoints del modo lote (por defecto <salida>/checkpoints.sqlite3)"
+    )
+    parser.add_argument(
+        "--sin-checkpoints", action="store_true",
+        help="No reutilizar ni guardar etapas completadas en modo lote"
+    )
+    return parser.parse_args(argv)
+
 def main():
     """Función principal del sistema."""
+    args = parsear_argumentos()
     
     # Banner
     imprimir_banner()
@@ -182,6 +437,52 @@ def main():
         print("  • Límite de rate excedido\n")
         sys.exit(1)
     
+    # ========================================
+    # MODO LOTE: TODO UN DIRECTORIO
+    # ========================================
+    if args.directorio:
+        print("\n┌─────────────────────────────────────────────────────────────────────┐")
+        print("│ PASO 3: Diagnóstico en Lote                                         │")
+        print("└─────────────────────────────────────────────────────────────────────┘\n")
+        
+        checkpoints = None
+        if not args.sin_checkpoints:
+            try:
+                checkpoints = CheckpointStore(
+                    args.checkpoints or os.path.join(args.salida, "checkpoints.sqlite3"), pipeline="cli"
+                )
+            except ValueError as e:
+                print(f"✗ Error al abrir los checkpoints: {e}")
+                sys.exit(1)
+            estado = checkpoints.stats()
+            print(f"✓ Checkpoints: {checkpoints.path} ({estado['records']} registros, {estado['stages']} etapas)")
+        
+        try:
+            resumen = procesar_directorio(
+                args.directorio, agentes, director, cliente.modelo,
+                dir_salida=args.salida, concurrencia=max(1, args.concurrencia), checkpoints=checkpoints
+            )
+        finally:
+            if checkpoints:
+                checkpoints.close()
+        
+        print(f"\n{'='*70}")
+        print("RESUMEN DEL LOTE:")
+        print(f"  • Registros: {resumen['registros']} "
+              f"(completados {resumen['completados']}, parciales {resumen['parciales']}, fallidos {resumen['fallidos']})")
+        print(f"  • Duración total: {resumen['duracion_s']}s")
+        print(f"  • Throughput: {resumen['throughput_por_min']} registros/min")
+        print(f"  • Etapas reutilizadas de checkpoints: {resumen['etapas_reutilizadas']}")
+        print(f"  • Latencia por registro: p50 {resumen['latencia_s']['p50']}s, "
+              f"p95 {resumen['latencia_s']['p95']}s, máx {resumen['latencia_s']['max']}s")
+        print(f"  • Media especialistas / director: {resumen['latencia_media_especialistas_s']}s / "
+              f"{resumen['latencia_media_director_s']}s")
+        print(f"  • Resumen guardado en: {resumen['archivo_resumen']}")
+        print(f"{'='*70}\n")
+        if resumen["fallidos"] == resumen["registros"]:
+            sys.exit(1)
+        return
+    
     # ========================================
     # PASO 3: CARGA DE HISTORIAL CLÍNICO
     # ========================================
@@ -189,10 +490,7 @@ def main():
     print("│ PASO 3: Carga de Historial Clínico                                  │")
     print("└─────────────────────────────────────────────────────────────────────┘\n")
     
-    ruta_historial = os.path.join(
-        "Historales_Oftalmologicos", 
-        "Reporte - Steve Rogers - Vision Borrosa.txt"
-    )
+    ruta_historial = args.archivo
     
     historial = leer_historial(ruta_historial)
     
@@ -202,25 +500,24 @@ def main():
     print("┌─────────────────────────────────────────────────────────────────────┐")
     print("│ PASO 4: Consulta con Especialistas                                  │")
     print("└─────────────────────────────────────────────────────────────────────┘\n")
-    print(" Iniciando ronda de evaluaciones médicas...\n")
+    print(" Iniciando ronda de evaluaciones médicas (especialistas en paralelo)...\n")
     
-    reportes_generados = {}
     total_agentes = len(agentes)
+    terminados = []
     
-    for idx, agente in enumerate(agentes, 1):
+    def al_terminar(agente, respuesta, error):
+        terminados.append(agente)
         print(f"\n{'─'*70}")
-        mostrar_progreso(idx, total_agentes, f"{agente.nombre}")
+        mostrar_progreso(len(terminados), total_agentes, f"{agente.nombre}")
         print(f"{'─'*70}")
-        
-        try:
-            respuesta = agente.analizar(historial)
-            reportes_generados[agente.especialidad] = respuesta
+        if error is None:
             print(f"  ✓ Reporte recibido ({len(respuesta)} caracteres)")
-            
-        except Exception as e:
-            print(f"  ✗ Error en {agente.nombre}: {e}")
+        else:
+            print(f"  ✗ Error en {agente.nombre}: {error}")
             print(f"    Continuando con otros especialistas...")
-            continue
+    
+    with ThreadPoolExecutor(max_workers=total_agentes) as pool:
+        reportes_generados, _ = consultar_especialistas(historial, agentes, pool, al_terminar)
     
     # Verificar que tengamos al menos un reporte
     if not reportes_generados:
@@ -257,20 +554,11 @@ def main():
     print("└─────────────────────────────────────────────────────────────────────┘")
     
     # Agregar metadata al inicio del documento
-    metadata = f"""{'='*70}
-DIAGNÓSTICO OFTALMOLÓGICO - REPORTE FINAL
-{'='*70}
-Fecha de generación: {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}
-Sistema: Multi-Agente Oftalmológico
-Modelo de IA: Groq - {cliente.modelo}
-Especialistas consultados: {len(reportes_generados)}
-{'='*70}
-
-"""
+    metadata = generar_metadata(cliente.modelo, len(reportes_generados))
     
     contenido_completo = metadata + diagnostico_final
     
-    ruta_salida = os.path.join("resultados", "diagnostico_final.txt")
+    ruta_salida = os.path.join(args.salida, "diagnostico_final.txt")
     archivo_guardado = guardar_resultado(contenido_completo, ruta_salida)
     
     # ========================================
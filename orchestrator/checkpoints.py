@@ -0,0 +1,112 @@
+"""
+Checkpoints de lotes en SQLite: cada reporte de especialista y cada síntesis del director
+se guarda en disco por (hash del registro, etapa) en cuanto termina.
+
+Si un lote se interrumpe (cuota agotada, reinicio del pod), al relanzarlo se reutilizan
+las etapas ya completadas y solo se repiten las que faltan. A diferencia de la caché de
+Redis no caduca: las entradas se conservan hasta borrar la base de datos.
+
+Solo depende de la biblioteca estándar; lo usan el orquestador y `local_legacy_cli.py`.
+Sus reportes no son intercambiables (agentes, prompts y modelos distintos) y cada uno
+separa los registros por algo distinto: el CLI por modelo de Groq, el orquestador por
+nivel de la cascada (el modelo lo eligen los agentes). Por eso cada base de datos
+pertenece a un solo `pipeline` y abrirla desde el otro es un error.
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+DIRECTOR_STAGE = "DIRECTOR"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    record_hash TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (record_hash, stage)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+PIPELINES = ("cli", "orchestrator")
+
+
+class CheckpointStore:
+    """Resultados por etapa de cada registro, en una base SQLite local."""
+
+    def __init__(self, path: str, pipeline: str):
+        """
+        Args:
+            path: Archivo SQLite (se crea si no existe).
+            pipeline: "cli" u "orchestrator"; la base queda asignada al primero que la abre.
+
+        Raises:
+            ValueError: si la base ya pertenece al otro pipeline.
+        """
+        if pipeline not in PIPELINES:
+            raise ValueError(f"pipeline desconocido: {pipeline}")
+        self.path = path
+        self.pipeline = pipeline
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Una conexión compartida por hilos (CLI) o por el hilo de asyncio.to_thread (orquestador)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('pipeline', ?)", (pipeline,))
+        (owner,) = self._conn.execute("SELECT value FROM meta WHERE key = 'pipeline'").fetchone()
+        if owner != pipeline:
+            self._conn.close()
+            raise ValueError(f"{path} tiene checkpoints de '{owner}', no se puede usar desde '{pipeline}'")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def record_key(historial: str, *scope: Optional[str]) -> str:
+        """
+        Hash del registro. `scope` separa resultados que no son intercambiables para un
+        mismo historial: el modelo en el CLI, el nivel de la cascada en el orquestador.
+        """
+        parts = [historial.strip()] + [s or "" for s in scope]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def load(self, record_hash: str) -> Dict[str, str]:
+        """Etapas completadas del registro: {etapa: contenido}."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, content FROM checkpoints WHERE record_hash = ?", (record_hash,)
+            ).fetchall()
+        return dict(rows)
+
+    def save(self, record_hash: str, stage: str, content: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (record_hash, stage, content, created_at) VALUES (?, ?, ?, ?)",
+                (record_hash, stage, content, time.time()),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            records, stages = self._conn.execute(
+                "SELECT COUNT(DISTINCT record_hash), COUNT(*) FROM checkpoints"
+            ).fetchone()
+        return {"records": records, "stages": stages}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    async def aload(self, record_hash: str) -> Dict[str, str]:
+        return await asyncio.to_thread(self.load, record_hash)
+
+    async def asave(self, record_hash: str, stage: str, content: str):
+        await asyncio.to_thread(self.save, record_hash, stage, content)
@@ -0,0 +1,51 @@
+"""
+Política de hedging para llamadas lentas a especialistas.
+
+Se registra la latencia observada de cada agente; cuando una llamada supera su
+percentil configurado (p90 por defecto) se lanza una petición duplicada y gana la
+primera respuesta. El número de duplicados está acotado a una fracción de las llamadas.
+"""
+
+from collections import defaultdict, deque
+from typing import Deque, Dict, Optional
+
+
+class HedgePolicy:
+    """Percentiles de latencia por agente y presupuesto de peticiones duplicadas."""
+
+    def __init__(
+        self,
+        quantile: float = 0.9,
+        min_samples: int = 20,
+        window: int = 200,
+        max_ratio: float = 0.1,
+    ):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        # Últimos eventos: False = llamada primaria, True = duplicado lanzado
+        self._events: Deque[bool] = deque(maxlen=window)
+
+    def record(self, agent: str, seconds: float):
+        self._latencies[agent].append(seconds)
+
+    def threshold(self, agent: str) -> Optional[float]:
+        """Latencia (s) a partir de la cual duplicar; None si aún no hay suficientes muestras."""
+        samples = self._latencies[agent]
+        if len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+
+    def register_call(self):
+        self._events.append(False)
+
+    def allow_hedge(self) -> bool:
+        """Concede un duplicado si la proporción duplicados/llamadas reciente queda bajo `max_ratio`."""
+        hedges = sum(self._events)
+        calls = len(self._events) - hedges
+        if calls == 0 or (hedges + 1) / calls > self.max_ratio:
+            return False
+        self._events.append(True)
+        return True
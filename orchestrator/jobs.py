@@ -0,0 +1,126 @@
+"""
+Estado de los trabajos asíncronos de diagnóstico (POST /jobs, GET /jobs/{id}).
+
+El estado se guarda en Redis como JSON con TTL, de modo que cualquier réplica del
+orquestador puede responder a GET /jobs/{id}. Si Redis no está disponible se usa un
+almacén en memoria (solo válido con una réplica), acotado a `max_memory_jobs` y del que
+se barren los trabajos caducados en cada escritura.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import redis.asyncio as aioredis
+import structlog
+
+logger = structlog.get_logger()
+
+JOB_STATUSES = ("queued", "running", "completed", "partial", "failed")
+
+
+class JobStore:
+    """Persistencia de trabajos en Redis (`orchestrator:job:<id>`) con TTL."""
+
+    def __init__(
+        self, redis_url: str, ttl_seconds: int = 86400, prefix: str = "orchestrator:job", max_memory_jobs: int = 10000
+    ):
+        self.redis_url = redis_url
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.max_memory_jobs = max_memory_jobs
+        self.redis: Optional[aioredis.Redis] = None
+        # Orden de última escritura: con un TTL fijo los caducados quedan siempre al principio
+        self._memory: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        # Los especialistas terminan en paralelo: serializa las lecturas-escrituras de cada trabajo
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def connect(self):
+        client = aioredis.from_url(self.redis_url, decode_responses=True, socket_connect_timeout=1)
+        try:
+            await client.ping()
+        except Exception as e:
+            logger.warning("job_store_redis_unavailable", error=str(e))
+            await client.aclose()
+            return
+        self.redis = client
+        logger.info("job_store_connected", url=self.redis_url)
+
+    async def close(self):
+        if self.redis:
+            await self.redis.aclose()
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.prefix}:{job_id}"
+
+    async def _write(self, job: Dict[str, Any]):
+        job["updated_at"] = time.time()
+        data = json.dumps(job, ensure_ascii=False)
+        if self.redis:
+            try:
+                await self.redis.set(self._key(job["id"]), data, ex=self.ttl_seconds)
+                return
+            except Exception as e:
+                logger.error("job_store_write_error", job_id=job["id"], error=str(e))
+        self._memory.pop(job["id"], None)
+        self._memory[job["id"]] = (time.time() + self.ttl_seconds, data)
+        self._sweep_memory()
+
+    def _sweep_memory(self):
+        """Descarta los trabajos caducados y, si aún sobran, los escritos hace más tiempo."""
+        now = time.time()
+        while self._memory:
+            job_id, (expires, _) = next(iter(self._memory.items()))
+            if expires >= now and len(self._memory) <= self.max_memory_jobs:
+                break
+            self._memory.popitem(last=False)
+            self._locks.pop(job_id, None)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if self.redis:
+            try:
+                data = await self.redis.get(self._key(job_id))
+                if data is not None:
+                    return json.loads(data)
+            except Exception as e:
+                logger.error("job_store_read_error", job_id=job_id, error=str(e))
+        expires, data = self._memory.get(job_id, (0.0, None))
+        if data is None or expires < time.time():
+            self._memory.pop(job_id, None)
+            return None
+        return json.loads(data)
+
+    async def create(self, **fields: Any) -> Dict[str, Any]:
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "created_at": time.time(),
+            "reports": {},
+            "result": None,
+            "error": None,
+            **fields,
+        }
+        await self._write(job)
+        return job
+
+    async def update(self, job_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+        """Actualiza campos del trabajo. Solo escribe la réplica que lo ejecuta."""
+        async with self._locks.setdefault(job_id, asyncio.Lock()):
+            job = await self.get(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            await self._write(job)
+        if job["status"] in ("completed", "partial", "failed"):
+            self._locks.pop(job_id, None)
+        return job
+
+    async def add_report(self, job_id: str, agent: str, report: str):
+        async with self._locks.setdefault(job_id, asyncio.Lock()):
+            job = await self.get(job_id)
+            if job is None:
+                return
+            job["reports"][agent] = report
+            await self._write(job)
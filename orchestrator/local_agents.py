@@ -0,0 +1,145 @@
+"""
+Modo monolito: los cuatro especialistas y el director se ejecutan dentro del orquestador.
+
+Pensado para clínicas pequeñas y equipos edge donde todo el stack corre en un solo nodo.
+Todos los agentes comparten un único cliente de LLM (pool de conexiones, caché, Redis,
+limitador de tasa, circuit breaker y, con LLM_FALLBACK_PROVIDERS, el enrutador entre
+proveedores), sin saltos HTTP entre procesos. El contrato de
+/diagnose no cambia.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from typing import AsyncGenerator, Awaitable, Dict, List, Optional, Tuple
+import structlog
+
+logger = structlog.get_logger()
+
+# `Utils/` se comparte con los agentes (trazas y, en modo monolito, los agentes mismos). En
+# las imágenes se copia junto a main.py; en local se toma de ../agents
+AGENTS_DIR = os.environ.get(
+    "AGENTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agents")
+)
+if os.path.isdir(AGENTS_DIR) and AGENTS_DIR not in sys.path:
+    sys.path.insert(0, AGENTS_DIR)
+
+MIN_BUDGET_SECONDS = int(os.environ.get("AGENT_MIN_BUDGET_MS", 3000)) / 1000
+TOKENS_PER_SECOND = float(os.environ.get("GROQ_TOKENS_PER_SECOND", 250))
+STRUCTURED_OUTPUT = os.environ.get("STRUCTURED_OUTPUT", "false").lower() == "true"
+
+
+class LocalAgents:
+    """Instancias en proceso de los agentes, indexadas igual que AGENTS_CONFIG."""
+
+    def __init__(self, api_key: Optional[str] = None):
+        # Importación diferida: el orquestador distribuido no necesita groq/redis
+        from Utils.enrutador import crear_cliente_llm
+        from Utils.cascada import PoliticaCascada
+        from Utils.metricas import medir_analisis
+        from Utils.agentes import (
+            AgenteOftalmologoGeneral,
+            AgenteRetina,
+            AgenteCornea,
+            AgenteNeuroOftalmologia,
+            EquipoMultidisciplinarioOftalmologico
+        )
+
+        self.client = crear_cliente_llm(api_key=api_key or os.environ.get("GROQ_API_KEY"))
+        self.specialists = {
+            "GENERAL": AgenteOftalmologoGeneral(self.client),
+            "RETINA": AgenteRetina(self.client),
+            "CORNEA": AgenteCornea(self.client),
+            "NEURO": AgenteNeuroOftalmologia(self.client),
+        }
+        for name, agent in self.specialists.items():
+            agent.cascada = PoliticaCascada.desde_entorno(name, self.client.modelo)
+        self.director = EquipoMultidisciplinarioOftalmologico(self.client)
+        # Mismas métricas por agente que los servicios distribuidos
+        self.measure = medir_analisis
+        logger.info("local_agents_initialized", agents=list(self.specialists))
+
+    async def conectar(self):
+        await self.client.conectar()
+
+    async def cerrar(self):
+        await self.client.cerrar()
+
+    def _budget(self, deadline: Optional[float]) -> tuple[Optional[float], Optional[int]]:
+        """Segundos restantes y `max_tokens` que caben en ellos (misma regla que /analyze)."""
+        if deadline is None:
+            return None, None
+        remaining = deadline - time.monotonic()
+        if remaining < MIN_BUDGET_SECONDS:
+            raise asyncio.TimeoutError("Deadline budget too small to analyze")
+        affordable = int(max(0.0, remaining - 1.0) * TOKENS_PER_SECOND)
+        return remaining, max(256, min(self.client.max_tokens, affordable))
+
+    async def analyze(
+        self, name: str, history: str, deadline: Optional[float] = None, tier: Optional[str] = None
+    ) -> Tuple[str, Optional[dict]]:
+        """Como POST /analyze: (reporte en texto, JSON validado en modo estructurado o None)."""
+        remaining, max_tokens = self._budget(deadline)
+        agent = self.specialists[name]
+        if STRUCTURED_OUTPUT:
+            work = self._analyze_structured(name, history, max_tokens)
+        elif agent.cascada:
+            work = self._analyze_cascade(name, history, max_tokens, tier)
+        else:
+            work = self._analyze_text(agent.analizar(history, max_tokens=max_tokens))
+        async with self.measure(name, "specialist"):
+            return await asyncio.wait_for(work, timeout=remaining)
+
+    @staticmethod
+    async def _analyze_text(work: Awaitable[str]) -> Tuple[str, Optional[dict]]:
+        return await work, None
+
+    async def _analyze_cascade(
+        self, name: str, history: str, max_tokens: Optional[int], tier: Optional[str]
+    ) -> Tuple[str, Optional[dict]]:
+        cascade = await self.specialists[name].analizar_en_cascada(history, max_tokens=max_tokens, nivel=tier)
+        logger.info("local_analysis_completed", agent=name, model=cascade.modelo, escalated=cascade.escalado)
+        return cascade.texto, None
+
+    async def _analyze_structured(
+        self, name: str, history: str, max_tokens: Optional[int]
+    ) -> Tuple[str, Optional[dict]]:
+        """Igual que /analyze en modo estructurado: reporte libre (sin JSON) si el JSON no es válido."""
+        agent = self.specialists[name]
+        try:
+            report = await agent.analizar_estructurado(history, max_tokens=max_tokens)
+        except ValueError as e:
+            logger.warning("structured_output_invalid", agent=name, error=str(e))
+            return await agent.analizar(history, max_tokens=max_tokens), None
+        return report.a_texto(), report.model_dump(mode="json")
+
+    async def synthesize(
+        self,
+        history: str,
+        reports: Dict[str, str],
+        missing: Optional[List[str]] = None,
+        deadline: Optional[float] = None
+    ) -> str:
+        remaining, max_tokens = self._budget(deadline)
+        async with self.measure("DIRECTOR", "director"):
+            return await asyncio.wait_for(
+                self.director.analizar_reportes(history, reports, faltantes=missing, max_tokens=max_tokens),
+                timeout=remaining
+            )
+
+    async def stream(self, name: str, payload: dict) -> AsyncGenerator[tuple[str, dict], None]:
+        """Equivalente en proceso de `stream_agent`: produce ("delta", {"text": ...})."""
+        if name == "DIRECTOR":
+            fragments = self.director.analizar_reportes_stream(
+                payload["historial"], payload["reportes"], payload.get("faltantes")
+            )
+        else:
+            fragments = self.specialists[name].analizar_stream(payload["historial"])
+        async with self.measure(name, "director" if name == "DIRECTOR" else "specialist"):
+            async for fragment in fragments:
+                yield "delta", {"text": fragment}
+        yield "done", {"agent": name}
+
+    def cache_stats(self) -> dict:
+        return self.client.estadisticas_cache()
@@ -1,25 +1,57 @@
 import os
 import time
+import json
 import asyncio
+import weakref
 import httpx
 from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Literal, Optional, Union, AsyncGenerator
 import structlog
 from dotenv import load_dotenv
-from prometheus_client import make_asgi_app, Counter, Histogram
+from prometheus_client import make_asgi_app, Counter, Gauge, Histogram
+from opentelemetry import trace
+from hedging import HedgePolicy
+from triage import TriageRouter, estimate_urgency
+from scheduler import URGENCY_LEVELS, DiagnosisScheduler, QueueFullError
+from jobs import JobStore
+from checkpoints import DIRECTOR_STAGE, CheckpointStore
+from uploads import UploadError, decode_text, is_zip, iter_zip_texts, open_zip, read_limited
+from local_agents import LocalAgents  # antes que Utils: en local añade ../agents a sys.path
+from Utils.trazas import configurar_trazas, hook_propagacion, marcar_error, middleware_trazas
+from Utils.metricas import agente_actual
 
 load_dotenv()
 
 # Logger
 logger = structlog.get_logger()
+tracer = trace.get_tracer("orchestrator")
 
 # App
 app = FastAPI(title="Ophthalmology Diagnoses Orchestrator")
 
+# Trazas: request id y spans por petición; TRACE_DIR los exporta a JSONL (vacío = sin exportar)
+configurar_trazas("orchestrator", os.environ.get("TRACE_DIR", ""))
+app.middleware("http")(middleware_trazas)
+
 # Metrics
 DIAGNOSIS_COUNTER = Counter('diagnosis_total', 'Total diagnoses processed')
 DIAGNOSIS_LATENCY = Histogram('diagnosis_latency_seconds', 'Time taken for full diagnosis')
+BATCH_RECORDS_COUNTER = Counter('batch_records_total', 'Batch records processed', ['status'])
+HEDGED_CALLS_COUNTER = Counter('agent_hedged_calls_total', 'Duplicate specialist calls launched', ['agent', 'winner'])
+TRIAGE_COUNTER = Counter('triage_agent_decisions_total', 'Triage routing decisions per specialist', ['agent', 'decision', 'mode'])
+# Dónde se va el tiempo: por llamada a cada agente y por etapa del diagnóstico
+AGENT_CALL_LATENCY = Histogram(
+    'orchestrator_agent_call_seconds', 'Agent call latency seen by the orchestrator', ['agent', 'outcome'],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+)
+AGENT_CALLS_IN_FLIGHT = Gauge('orchestrator_agent_calls_in_flight', 'Agent calls currently open', ['agent'])
+DIAGNOSIS_STAGE_LATENCY = Histogram(
+    'diagnosis_stage_seconds', 'Time spent per diagnosis stage (triage, specialists, director)', ['stage'],
+    buckets=(0.01, 0.1, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+)
+MISSING_REPORTS_COUNTER = Counter('diagnosis_missing_reports_total', 'Specialists cut off by the diagnosis deadline', ['agent'])
 
 # Configuration (URLs of Agent Services)
 AGENTS_CONFIG = {
@@ -30,80 +62,760 @@ AGENTS_CONFIG = {
 }
 DIRECTOR_URL = os.environ.get("URL_AGENT_DIRECTOR", "http://agent-director:8000")
 
+# ORCHESTRATOR_MODE=monolith ejecuta los agentes en este proceso (un solo cliente de LLM
+# compartido, sin saltos HTTP); "distributed" llama a los servicios de AGENTS_CONFIG.
+MONOLITH_MODE = os.environ.get("ORCHESTRATOR_MODE", "distributed").lower() == "monolith"
+local_agents = None
+if MONOLITH_MODE:
+    local_agents = LocalAgents()
+
+# Triage: TRIAGE_MODE=keywords (clasificador local) o llm (modelo rápido de Groq) consulta
+# solo a los especialistas relevantes; GENERAL siempre. "off" mantiene el fan-out completo.
+# El modo llm usa el cliente de LLM de los agentes: mismo pool de keys, limitador y breaker
+# (en monolito, la misma instancia que los agentes en proceso).
+TRIAGE_MODE = os.environ.get("TRIAGE_MODE", "off").lower()
+triage_client = None
+if TRIAGE_MODE == "llm":
+    if local_agents:
+        triage_client = local_agents.client
+    else:
+        from Utils.enrutador import crear_cliente_llm
+        triage_client = crear_cliente_llm(api_key=os.environ.get("GROQ_API_KEY"))
+triage_router = TriageRouter(
+    agents=list(AGENTS_CONFIG),
+    mode=TRIAGE_MODE,
+    model=os.environ.get("TRIAGE_MODEL", "llama-3.1-8b-instant"),
+    client=triage_client,
+    timeout=float(os.environ.get("TRIAGE_TIMEOUT_SECONDS", 5)),
+)
+
+# Hedging: duplicar llamadas a especialistas que superan su p90 observado.
+# El duplicado va a URL_AGENT_<NOMBRE>_HEDGE si existe (otra réplica/zona) o a la misma URL,
+# donde abre una conexión nueva que el Service puede balancear a otro pod.
+HEDGING_ENABLED = os.environ.get("HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_URLS = {name: os.environ.get(f"URL_AGENT_{name}_HEDGE", url) for name, url in AGENTS_CONFIG.items()}
+hedge_policy = HedgePolicy(
+    quantile=float(os.environ.get("HEDGE_QUANTILE", 0.9)),
+    min_samples=int(os.environ.get("HEDGE_MIN_SAMPLES", 20)),
+    max_ratio=float(os.environ.get("HEDGE_MAX_RATIO", 0.1)),
+)
+
 # Http Client
 timeout = httpx.Timeout(120.0, connect=10.0) # Long timeout for LLM
-http_client = httpx.AsyncClient(timeout=timeout)
+# Las peticiones a los agentes llevan X-Request-ID y traceparent para continuar la traza
+agent_urls = [*AGENTS_CONFIG.values(), *HEDGE_URLS.values(), DIRECTOR_URL]
+http_client = httpx.AsyncClient(timeout=timeout, event_hooks={"request": [hook_propagacion(agent_urls)]})
+
+# Presupuesto de tiempo por diagnóstico. Los especialistas disponen de una fracción;
+# al agotarse, el director sintetiza con los reportes que hayan llegado.
+DIAGNOSIS_DEADLINE_SECONDS = float(os.environ.get("DIAGNOSIS_DEADLINE_SECONDS", 150))
+SPECIALIST_CUTOFF_FRACTION = float(os.environ.get("SPECIALIST_CUTOFF_FRACTION", 0.6))
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+# Límite global de diagnósticos simultáneos lanzados por /diagnose/batch
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 8))
+batch_semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+# Límites de /diagnose/upload: archivo subido, cada historial y número de archivos en un zip
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+MAX_HISTORIAL_BYTES = int(os.environ.get("MAX_HISTORIAL_BYTES", 256 * 1024))
+MAX_UPLOAD_FILES = int(os.environ.get("MAX_UPLOAD_FILES", 500))
+
+# Trabajos asíncronos (POST /jobs): estado compartido entre réplicas en Redis con TTL
+job_store = JobStore(
+    redis_url=os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
+    ttl_seconds=int(os.environ.get("JOB_TTL_SECONDS", 86400)),
+    max_memory_jobs=int(os.environ.get("JOB_MEMORY_MAX", 10000)),  # Solo sin Redis
+)
+
+# Checkpoints de lotes en SQLite (vacío = desactivado): un lote relanzado retoma las etapas hechas
+CHECKPOINT_DB = os.environ.get("CHECKPOINT_DB", "")
+checkpoint_store = CheckpointStore(CHECKPOINT_DB, pipeline="orchestrator") if CHECKPOINT_DB else None
+
+# Admisión: diagnósticos simultáneos acotados y cola por urgencia (503 + Retry-After si se llena)
+scheduler = DiagnosisScheduler(
+    max_in_flight=int(os.environ.get("MAX_INFLIGHT_DIAGNOSES", 16)),
+    max_queue=int(os.environ.get("MAX_QUEUED_DIAGNOSES", 64)),
+)
 
 class DiagnosisRequest(BaseModel):
     historial: str
+    deadline_seconds: Optional[float] = None
+    tier: Optional[Literal["fast", "balanced", "quality"]] = None  # Model cascade tier for the specialists
+    urgency: Optional[Literal["BAJO", "MEDIO", "ALTO", "CRÍTICO"]] = None  # Queue priority; estimated if omitted
 
 class DiagnosisResponse(BaseModel):
     status: str
     diagnosis: Optional[str] = None
     reports: Optional[Dict[str, str]] = None
+    # JSON validado de los especialistas en modo estructurado (no se guarda en checkpoints)
+    structured_reports: Optional[Dict[str, Dict]] = None
+    reported_urgency: Optional[str] = None  # Most urgent nivel_urgencia among structured_reports
+    missing_reports: Optional[List[str]] = None
+    routing: Optional[Dict] = None
+    urgency: Optional[str] = None
+    queue_wait_ms: Optional[float] = None
+    resumed_stages: Optional[List[str]] = None
+    latency_ms: float
+
+class BatchRecord(BaseModel):
+    id: Optional[str] = None
+    historial: str
+    urgency: Optional[Literal["BAJO", "MEDIO", "ALTO", "CRÍTICO"]] = None
+
+class BatchDiagnosisRequest(BaseModel):
+    records: List[BatchRecord]
+
+class BatchItemResult(BaseModel):
+    type: str = "result"
+    index: int
+    id: Optional[str] = None
+    status: str
     latency_ms: float
+    result: Optional[DiagnosisResponse] = None
+    error: Optional[str] = None
+
+@app.on_event("startup")
+async def startup_event():
+    await job_store.connect()
+    if local_agents:
+        await local_agents.conectar()
+    elif triage_client:
+        await triage_client.conectar()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     await http_client.aclose()
+    await job_store.close()
+    if checkpoint_store:
+        checkpoint_store.close()
+    if local_agents:
+        await local_agents.cerrar()
+    elif triage_client:
+        await triage_client.cerrar()
 
-async def call_agent(name: str, url: str, history: str) -> tuple[str, str]:
-    """Llama a un agente y retorna (nombre, reporte)."""
+def deadline_kwargs(deadline: Optional[float]) -> dict:
+    """Cabecera X-Deadline-Ms y timeout HTTP con el tiempo restante hasta `deadline` (monotonic)."""
+    if deadline is None:
+        return {}
+    remaining = max(0.0, deadline - time.monotonic())
+    return {
+        "headers": {DEADLINE_HEADER: str(int(remaining * 1000))},
+        "timeout": httpx.Timeout(remaining, connect=min(10.0, remaining)),
+    }
+
+async def post_agent(
+    url: str, history: str, deadline: Optional[float] = None, tier: Optional[str] = None
+) -> tuple[str, Optional[dict]]:
+    """POST /analyze; devuelve el reporte en texto y, en modo estructurado, el JSON validado."""
+    payload = {"historial": history, "nivel": tier} if tier else {"historial": history}
+    response = await http_client.post(f"{url}/analyze", json=payload, **deadline_kwargs(deadline))
+    response.raise_for_status()
+    body = response.json()
+    return body["resultado"], body.get("estructurado")
+
+async def hedged_post(
+    name: str, url: str, history: str, deadline: Optional[float] = None, tier: Optional[str] = None
+) -> tuple[str, Optional[dict]]:
+    """
+    Llama al agente y, si no responde antes de su p90, lanza un duplicado.
+    Gana la primera respuesta correcta; la otra se cancela, y ambas si se cancela al llamante.
+    """
+    hedge_policy.register_call()
+    primary = asyncio.create_task(post_agent(url, history, deadline, tier))
+    pending = {primary}
+    try:
+        delay = hedge_policy.threshold(name)
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done or not hedge_policy.allow_hedge():
+            return await primary
+
+        logger.info("hedging_agent_call", agent=name, after_s=round(delay, 2))
+        backup = asyncio.create_task(post_agent(HEDGE_URLS[name], history, deadline, tier))
+        pending.add(backup)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    HEDGED_CALLS_COUNTER.labels(agent=name, winner="hedge" if task is backup else "primary").inc()
+                    return task.result()
+        # Ambas fallaron: se propaga el error de la llamada original
+        return primary.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+AGENT_ERROR_PREFIX = "Error al consultar especialista"
+
+def is_deadline_error(error: BaseException) -> bool:
+    """Presupuesto agotado: timeout propio o 504 del agente al que se propagó el deadline."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 504
+    return isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException))
+
+@tracer.start_as_current_span("agent.call")
+async def call_agent(
+    name: str, url: str, history: str, deadline: Optional[float] = None, tier: Optional[str] = None
+) -> tuple[str, str, Optional[dict]]:
+    """Llama a un agente y retorna (nombre, reporte, reporte estructurado o None)."""
+    start_time = time.time()
+    AGENT_CALLS_IN_FLIGHT.labels(agent=name).inc()
     try:
         logger.info("calling_agent", agent=name, url=url)
-        response = await http_client.post(f"{url}/analyze", json={"historial": history})
-        response.raise_for_status()
-        data = response.json()
-        return name, data["resultado"]
+        trace.get_current_span().set_attribute("agent", name)
+        if local_agents:
+            report, structured = await local_agents.analyze(name, history, deadline, tier)
+        elif HEDGING_ENABLED:
+            report, structured = await hedged_post(name, url, history, deadline, tier)
+        else:
+            report, structured = await post_agent(url, history, deadline, tier)
+        hedge_policy.record(name, time.time() - start_time)
+        AGENT_CALL_LATENCY.labels(agent=name, outcome="success").observe(time.time() - start_time)
+        return name, report, structured
+    except asyncio.CancelledError:
+        AGENT_CALL_LATENCY.labels(agent=name, outcome="cancelled").observe(time.time() - start_time)
+        raise
     except Exception as e:
+        AGENT_CALL_LATENCY.labels(agent=name, outcome="error").observe(time.time() - start_time)
         logger.error("agent_call_failed", agent=name, error=str(e))
-        return name, f"Error al consultar especialista: {str(e)}"
+        marcar_error(e)
+        return name, f"{AGENT_ERROR_PREFIX}: {str(e)}", None
+    finally:
+        AGENT_CALLS_IN_FLIGHT.labels(agent=name).dec()
 
-@app.post("/diagnose", response_model=DiagnosisResponse)
-async def diagnose(request: DiagnosisRequest):
-    start_time = time.time()
-    
+def most_urgent(levels: Iterable[Optional[str]]) -> Optional[str]:
+    """El nivel más urgente de `levels` (None si ninguno es válido)."""
+    known = [level for level in levels if level in URGENCY_LEVELS]
+    return min(known, key=URGENCY_LEVELS.index) if known else None
+
+def record_urgency(result: DiagnosisResponse, urgency: str):
+    """Anota la urgencia de la cola y avisa si los especialistas la ven mayor (calibra `estimate_urgency`)."""
+    result.urgency = urgency
+    if result.reported_urgency and most_urgent([urgency, result.reported_urgency]) != urgency:
+        logger.warning("urgency_underestimated", estimated=urgency, reported=result.reported_urgency)
+
+@tracer.start_as_current_span("diagnosis.triage")
+async def route_specialists(historial: str) -> dict:
+    """Decisión de triage, registrada en métricas y logs."""
+    # Las métricas del cliente de LLM se etiquetan con el agente en curso
+    token = agente_actual.set("TRIAGE")
     try:
-        # 1. Parallel call to specialists
-        logger.info("starting_parallel_diagnosis")
-        tasks = []
-        for name, url in AGENTS_CONFIG.items():
-            tasks.append(call_agent(name, url, request.historial))
-            
-        results = await asyncio.gather(*tasks)
-        
-        reports = {name: report for name, report in results}
-        
-        # 2. Call Director
-        logger.info("calling_director")
-        director_payload = {
-            "historial": request.historial,
-            "reportes": reports
-        }
-        
-        director_res = await http_client.post(f"{DIRECTOR_URL}/analyze", json=director_payload)
-        director_res.raise_for_status()
-        final_diagnosis = director_res.json()["resultado"]
-        
-        latency = (time.time() - start_time) * 1000
-        DIAGNOSIS_COUNTER.inc()
-        DIAGNOSIS_LATENCY.observe(latency / 1000)
-        
+        routing = await triage_router.route(historial)
+    finally:
+        agente_actual.reset(token)
+    for name in routing["selected"]:
+        TRIAGE_COUNTER.labels(agent=name, decision="called", mode=routing["mode"]).inc()
+    for name in routing["skipped"]:
+        TRIAGE_COUNTER.labels(agent=name, decision="skipped", mode=routing["mode"]).inc()
+    if routing["skipped"]:
+        logger.info("triage_routed", selected=routing["selected"], skipped=routing["skipped"], mode=routing["mode"])
+    return routing
+
+@tracer.start_as_current_span("diagnosis")
+async def run_diagnosis(
+    historial: str,
+    deadline_seconds: Optional[float] = None,
+    tier: Optional[str] = None,
+    on_report: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    checkpoint: bool = False
+) -> DiagnosisResponse:
+    """
+    Pipeline completo: especialistas en paralelo y síntesis del director.
+
+    Los especialistas tienen `SPECIALIST_CUTOFF_FRACTION` del presupuesto; los que no
+    respondan a tiempo se cancelan y el director sintetiza con los reportes disponibles
+    (status "partial"). El tiempo restante viaja a cada agente en X-Deadline-Ms.
+    `on_report(nombre, reporte)` se invoca según termina cada especialista.
+
+    Con `checkpoint` (y CHECKPOINT_DB configurado) cada etapa se guarda en SQLite al
+    terminar y las ya guardadas para este historial no se vuelven a pedir.
+    """
+    start_time = time.time()
+    budget = deadline_seconds or DIAGNOSIS_DEADLINE_SECONDS
+    deadline = time.monotonic() + budget
+
+    record_hash = CheckpointStore.record_key(historial, tier) if checkpoint and checkpoint_store else None
+    done = await checkpoint_store.aload(record_hash) if record_hash else {}
+    if done:
+        trace.get_current_span().set_attribute("resumed_stages", sorted(done))
+    if DIRECTOR_STAGE in done:
+        logger.info("diagnosis_resumed_from_checkpoint", record_hash=record_hash[:12], stages=len(done))
         return DiagnosisResponse(
             status="completed",
-            diagnosis=final_diagnosis,
-            reports=reports,
-            latency_ms=latency
+            diagnosis=done[DIRECTOR_STAGE],
+            reports={name: done[name] for name in AGENTS_CONFIG if name in done},
+            resumed_stages=sorted(done),
+            latency_ms=(time.time() - start_time) * 1000
         )
-        
+
+    # 0. Triage
+    stage_start = time.time()
+    routing = await route_specialists(historial) if triage_router.enabled else None
+    selected = routing["selected"] if routing else list(AGENTS_CONFIG)
+    if routing:
+        DIAGNOSIS_STAGE_LATENCY.labels(stage="triage").observe(time.time() - stage_start)
+
+    # 1. Parallel call to specialists, cut off at the specialist deadline
+    logger.info("starting_parallel_diagnosis", budget_s=budget)
+    stage_start = time.time()
+    specialist_deadline = time.monotonic() + budget * SPECIALIST_CUTOFF_FRACTION
+    async def consult(name: str) -> tuple[str, str, Optional[dict]]:
+        if name in done:
+            return name, done[name], None
+        result = await call_agent(name, AGENTS_CONFIG[name], historial, specialist_deadline, tier)
+        # Checkpoint y aviso son efectos secundarios: si fallan, el reporte sigue valiendo
+        if record_hash and not result[1].startswith(AGENT_ERROR_PREFIX):
+            try:
+                await checkpoint_store.asave(record_hash, name, result[1])
+            except Exception as e:
+                logger.warning("checkpoint_save_failed", agent=name, error=str(e))
+        if on_report:
+            try:
+                await on_report(name, result[1])
+            except Exception as e:
+                logger.warning("on_report_failed", agent=name, error=str(e))
+        return result
+
+    with tracer.start_as_current_span("diagnosis.specialists", attributes={"agents": selected}) as span:
+        tasks = {name: asyncio.create_task(consult(name)) for name in selected}
+        _, pending = await asyncio.wait(tasks.values(), timeout=budget * SPECIALIST_CUTOFF_FRACTION)
+        for task in pending:
+            task.cancel()
+        span.set_attribute("missing", [name for name, task in tasks.items() if task in pending])
+    DIAGNOSIS_STAGE_LATENCY.labels(stage="specialists").observe(time.time() - stage_start)
+
+    # Mismo orden que AGENTS_CONFIG para que el prompt del director comparta caché
+    reports = {name: task.result()[1] for name, task in tasks.items() if task not in pending}
+    structured = {name: task.result()[2] for name, task in tasks.items() if task not in pending and task.result()[2]}
+    missing = [name for name, task in tasks.items() if task in pending]
+    for name in missing:
+        MISSING_REPORTS_COUNTER.labels(agent=name).inc()
+    if not reports:
+        raise asyncio.TimeoutError("No specialist reported before the deadline")
+    if missing:
+        logger.warning("specialists_cut_off", missing=missing, budget_s=budget)
+    
+    # 2. Call Director
+    logger.info("calling_director")
+    director_payload = {
+        "historial": historial,
+        "reportes": reports,
+        "faltantes": missing
+    }
+    
+    stage_start = time.time()
+    final_diagnosis = None
+    AGENT_CALLS_IN_FLIGHT.labels(agent="DIRECTOR").inc()
+    try:
+        with tracer.start_as_current_span("diagnosis.director", attributes={"agent": "DIRECTOR"}):
+            if local_agents:
+                final_diagnosis = await local_agents.synthesize(historial, reports, missing, deadline)
+            else:
+                director_res = await http_client.post(f"{DIRECTOR_URL}/analyze", json=director_payload, **deadline_kwargs(deadline))
+                director_res.raise_for_status()
+                final_diagnosis = director_res.json()["resultado"]
     except Exception as e:
+        AGENT_CALL_LATENCY.labels(agent="DIRECTOR", outcome="error").observe(time.time() - stage_start)
+        if not is_deadline_error(e):
+            raise
+        # Como un especialista que no llega: se devuelven los reportes y el director queda como faltante
+        logger.warning("director_cut_off", error=str(e), budget_s=budget)
+        MISSING_REPORTS_COUNTER.labels(agent="DIRECTOR").inc()
+        missing.append("DIRECTOR")
+    except BaseException:
+        AGENT_CALL_LATENCY.labels(agent="DIRECTOR", outcome="error").observe(time.time() - stage_start)
+        raise
+    else:
+        AGENT_CALL_LATENCY.labels(agent="DIRECTOR", outcome="success").observe(time.time() - stage_start)
+    finally:
+        AGENT_CALLS_IN_FLIGHT.labels(agent="DIRECTOR").dec()
+    DIAGNOSIS_STAGE_LATENCY.labels(stage="director").observe(time.time() - stage_start)
+    # Un diagnóstico parcial no se guarda: al relanzar se reintentan los especialistas que faltaron
+    failed = [name for name, report in reports.items() if report.startswith(AGENT_ERROR_PREFIX)]
+    if record_hash and not missing and not failed:
+        try:
+            await checkpoint_store.asave(record_hash, DIRECTOR_STAGE, final_diagnosis)
+        except Exception as e:
+            logger.warning("checkpoint_save_failed", agent="DIRECTOR", error=str(e))
+    
+    latency = (time.time() - start_time) * 1000
+    DIAGNOSIS_COUNTER.inc()
+    DIAGNOSIS_LATENCY.observe(latency / 1000)
+    
+    return DiagnosisResponse(
+        status="partial" if missing else "completed",
+        diagnosis=final_diagnosis,
+        reports=reports,
+        structured_reports=structured or None,
+        reported_urgency=most_urgent(report.get("nivel_urgencia") for report in structured.values()),
+        missing_reports=missing or None,
+        routing=routing,
+        resumed_stages=sorted(name for name in selected if name in done) or None,
+        latency_ms=latency
+    )
+
+@app.post("/diagnose", response_model=DiagnosisResponse)
+async def diagnose(request: DiagnosisRequest):
+    urgency = request.urgency or estimate_urgency(request.historial)
+    try:
+        async with scheduler.slot(urgency) as waited:
+            # La espera en cola consume parte del presupuesto del diagnóstico
+            budget = (request.deadline_seconds or DIAGNOSIS_DEADLINE_SECONDS) - waited
+            if budget <= 0:
+                raise asyncio.TimeoutError("Deadline expired while queued")
+            result = await run_diagnosis(request.historial, budget, request.tier)
+        record_urgency(result, urgency)
+        result.queue_wait_ms = waited * 1000
+        return result
+    except QueueFullError as e:
+        logger.warning("diagnosis_rejected", urgency=urgency, reason=e.reason, queue_depth=scheduler.depth())
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        if is_deadline_error(e):
+            logger.error("orchestration_deadline_exceeded", error=str(e))
+            raise HTTPException(status_code=504, detail=f"Diagnosis deadline exceeded: {e}")
         logger.error("orchestration_failed", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+async def diagnose_batch_item(index: int, record: BatchRecord) -> BatchItemResult:
+    """
+    Diagnostica un registro del lote respetando el límite global de concurrencia. Los lotes
+    pasan por la cola de urgencias pero nunca se rechazan: esperan su turno.
+    """
+    async with batch_semaphore:
+        # El span es un context manager síncrono: no puede ir en el `async with`
+        with tracer.start_as_current_span("diagnosis.batch_record", attributes={"index": index, "id": record.id or ""}):
+            start_time = time.time()
+            try:
+                async with scheduler.slot(record.urgency or estimate_urgency(record.historial), shed=False):
+                    result = await run_diagnosis(record.historial, checkpoint=True)
+                BATCH_RECORDS_COUNTER.labels(status="completed").inc()
+                return BatchItemResult(index=index, id=record.id, status="completed",
+                                       latency_ms=(time.time() - start_time) * 1000, result=result)
+            except Exception as e:
+                logger.error("batch_record_failed", index=index, id=record.id, error=str(e))
+                marcar_error(e)
+                BATCH_RECORDS_COUNTER.labels(status="failed").inc()
+                return BatchItemResult(index=index, id=record.id, status="failed",
+                                       latency_ms=(time.time() - start_time) * 1000, error=str(e))
+
+async def ndjson_batch(records: AsyncIterator[Union[BatchRecord, BatchItemResult]]) -> AsyncGenerator[str, None]:
+    """
+    Diagnostica los registros de `records` y emite una línea NDJSON por resultado en cuanto
+    termina, más una línea final `type: "summary"`. Los registros se consumen según se
+    liberan huecos (como mucho BATCH_CONCURRENCY pendientes), así que la fuente puede ser
+    perezosa. Un BatchItemResult en la fuente es un registro que ya falló al leerse.
+    """
+    start_time = time.time()
+    pending: set = set()
+    index = completed = failed = 0
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < BATCH_CONCURRENCY:
+                record = await anext(records, None)
+                if record is None:
+                    exhausted = True
+                elif isinstance(record, BatchItemResult):
+                    record.index = index
+                    BATCH_RECORDS_COUNTER.labels(status="failed").inc()
+                    failed += 1
+                    index += 1
+                    yield record.model_dump_json() + "\n"
+                else:
+                    pending.add(asyncio.create_task(diagnose_batch_item(index, record)))
+                    index += 1
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = task.result()
+                if item.status == "completed":
+                    completed += 1
+                else:
+                    failed += 1
+                yield item.model_dump_json() + "\n"
+
+        elapsed = time.time() - start_time
+        summary = {
+            "type": "summary",
+            "records": index,
+            "completed": completed,
+            "failed": failed,
+            "elapsed_ms": elapsed * 1000,
+            "throughput_per_min": index / elapsed * 60 if elapsed else 0.0,
+        }
+        logger.info("batch_completed", **summary)
+        yield json.dumps(summary) + "\n"
+    finally:
+        for task in pending:
+            task.cancel()
+
+@app.post("/diagnose/batch")
+async def diagnose_batch(request: BatchDiagnosisRequest):
+    """
+    Diagnostica muchos registros con concurrencia acotada (BATCH_CONCURRENCY, compartida
+    entre lotes). Cada resultado se emite como una línea NDJSON en cuanto termina; la última
+    línea (`type: "summary"`) resume el lote. Un registro fallido no aborta el resto.
+    """
+    async def records():
+        for record in request.records:
+            yield record
+
+    logger.info("batch_started", records=len(request.records))
+    return StreamingResponse(ndjson_batch(records()), media_type="application/x-ndjson")
+
+@app.post("/diagnose/upload")
+async def diagnose_upload(
+    file: UploadFile = File(...),
+    tier: Optional[Literal["fast", "balanced", "quality"]] = None,
+    urgency: Optional[Literal["BAJO", "MEDIO", "ALTO", "CRÍTICO"]] = None,
+):
+    """
+    Diagnostica historiales subidos como archivo (multipart, campo `file`).
+
+    - Un archivo de texto (UTF-8 o Latin-1): misma respuesta que /diagnose.
+    - Un zip: un registro por archivo, con la respuesta NDJSON de /diagnose/batch
+      (`id` = nombre del archivo). Los miembros se descomprimen uno a uno.
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit")
+
+    if not is_zip(file.file):
+        try:
+            historial, encoding = decode_text(await asyncio.to_thread(read_limited, file.file, MAX_HISTORIAL_BYTES))
+        except UploadError as e:
+            raise HTTPException(status_code=413 if "limit" in str(e) else 400, detail=str(e))
+        if not historial.strip():
+            raise HTTPException(status_code=400, detail="Empty file")
+        logger.info("upload_received", filename=file.filename, encoding=encoding, chars=len(historial))
+        return await diagnose(DiagnosisRequest(historial=historial, tier=tier, urgency=urgency))
+
+    # El índice del zip se valida antes de abrir el stream, para poder responder 400/413
+    try:
+        archive, members = await asyncio.to_thread(open_zip, file.file, MAX_UPLOAD_FILES)
+    except UploadError as e:
+        raise HTTPException(status_code=413 if "limit" in str(e) else 400, detail=str(e))
+
+    async def records():
+        async for name, historial, error in iter_zip_texts(archive, members, MAX_HISTORIAL_BYTES):
+            if error:
+                logger.warning("upload_member_rejected", filename=name, error=error)
+                yield BatchItemResult(index=0, id=name, status="failed", latency_ms=0.0, error=error)
+            else:
+                yield BatchRecord(id=name, historial=historial, urgency=urgency)
+
+    logger.info("upload_batch_started", filename=file.filename, records=len(members))
+    return StreamingResponse(ndjson_batch(records()), media_type="application/x-ndjson")
+
+class JobAccepted(BaseModel):
+    job_id: str
+    status: str
+    urgency: str
+
+@tracer.start_as_current_span("diagnosis.job")
+async def run_job(job_id: str, request: DiagnosisRequest, urgency: str):
+    """Ejecuta un trabajo en segundo plano, guardando los reportes según llegan."""
+    trace.get_current_span().set_attribute("job_id", job_id)
+    async def save_report(name: str, report: str):
+        await job_store.add_report(job_id, name, report)
+
+    try:
+        async with scheduler.slot(urgency, shed=False):
+            await job_store.update(job_id, status="running", started_at=time.time())
+            result = await run_diagnosis(request.historial, request.deadline_seconds, request.tier, on_report=save_report)
+        record_urgency(result, urgency)
+        await job_store.update(job_id, status=result.status, result=result.model_dump(), reports=result.reports)
+        logger.info("job_completed", job_id=job_id, status=result.status)
+    except Exception as e:
+        logger.error("job_failed", job_id=job_id, error=str(e))
+        marcar_error(e)
+        await job_store.update(job_id, status="failed", error=str(e))
+
+@app.post("/jobs", response_model=JobAccepted, status_code=202)
+async def create_job(request: DiagnosisRequest, background_tasks: BackgroundTasks):
+    """
+    Encola un diagnóstico y responde de inmediato con su id. El progreso se consulta en
+    GET /jobs/{id}. Con la cola de admisión llena responde 503 + Retry-After.
+    """
+    urgency = request.urgency or estimate_urgency(request.historial)
+    if scheduler.depth() >= scheduler.max_queue:
+        retry_after = scheduler.retry_after()
+        raise HTTPException(status_code=503, detail="Diagnosis queue is full", headers={"Retry-After": str(retry_after)})
+    job = await job_store.create(urgency=urgency)
+    background_tasks.add_task(run_job, job["id"], request, urgency)
+    logger.info("job_created", job_id=job["id"], urgency=urgency)
+    return JobAccepted(job_id=job["id"], status=job["status"], urgency=urgency)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Estado del trabajo, reportes de especialistas disponibles y, al terminar, el resultado."""
+    job = await job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+def sse_event(event: str, data: dict) -> str:
+    """Serializa un evento Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_agent(url: str, payload: dict) -> AsyncGenerator[tuple[str, dict], None]:
+    """Consume el endpoint SSE /analyze/stream de un agente y produce (evento, datos)."""
+    async with http_client.stream("POST", f"{url}/analyze/stream", json=payload) as response:
+        response.raise_for_status()
+        event = "message"
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):].strip())
+                if event == "error":
+                    raise RuntimeError(data.get("detail", "agent stream error"))
+                yield event, data
+                event = "message"
+
+def open_agent_stream(name: str, url: str, payload: dict) -> AsyncGenerator[tuple[str, dict], None]:
+    """Stream del agente: en proceso en modo monolito, por SSE en modo distribuido."""
+    if local_agents:
+        return local_agents.stream(name, payload)
+    return stream_agent(url, payload)
+
+@tracer.start_as_current_span("agent.stream")
+async def pump_specialist(name: str, url: str, history: str, queue: asyncio.Queue, reports: Dict[str, str]):
+    """Reenvía los fragmentos de un especialista a la cola común, etiquetados con su nombre."""
+    trace.get_current_span().set_attribute("agent", name)
+    parts = []
+    try:
+        logger.info("streaming_agent", agent=name, url=url)
+        async for event, data in open_agent_stream(name, url, {"historial": history}):
+            if event == "delta":
+                parts.append(data["text"])
+                await queue.put(sse_event("specialist_delta", {"agent": name, "text": data["text"]}))
+        reports[name] = "".join(parts)
+        await queue.put(sse_event("specialist_done", {"agent": name, "status": "completed"}))
+    except Exception as e:
+        logger.error("agent_stream_failed", agent=name, error=str(e))
+        marcar_error(e)
+        reports[name] = f"{AGENT_ERROR_PREFIX}: {str(e)}"
+        await queue.put(sse_event("specialist_done", {"agent": name, "status": "failed", "detail": str(e)}))
+    finally:
+        await queue.put(None)
+
+def slot_releaser() -> Callable[[], None]:
+    """Libera una sola vez el hueco del planificador recién adquirido (un stream tiene varias salidas)."""
+    start = time.monotonic()
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            scheduler.release(time.monotonic() - start)
+
+    return release
+
+@app.post("/diagnose/stream")
+async def diagnose_stream(request: DiagnosisRequest):
+    """
+    Variante SSE de /diagnose. Con triage activo emite primero `routing`; después
+    `specialist_delta`/`specialist_done` de los especialistas multiplexados, luego
+    `director_delta` y finalmente `done` (o `error`).
+    """
+    # La admisión se decide antes de abrir el stream para poder responder 503
+    urgency = request.urgency or estimate_urgency(request.historial)
+    try:
+        await scheduler.acquire(urgency)
+    except QueueFullError as e:
+        logger.warning("diagnosis_rejected", urgency=urgency, reason=e.reason, queue_depth=scheduler.depth())
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    release_slot = slot_releaser()
+
+    async def event_generator():
+        start_time = time.time()
+        queue: asyncio.Queue = asyncio.Queue()
+        reports: Dict[str, str] = {}
+        tasks = []
+        try:
+            # 0. Triage
+            selected = list(AGENTS_CONFIG)
+            if triage_router.enabled:
+                routing = await route_specialists(request.historial)
+                selected = routing["selected"]
+                yield sse_event("routing", routing)
+            tasks = [
+                asyncio.create_task(pump_specialist(name, AGENTS_CONFIG[name], request.historial, queue, reports))
+                for name in selected
+            ]
+
+            # 1. Especialistas en paralelo, reenviados según llegan
+            logger.info("starting_streaming_diagnosis")
+            stage_start = time.time()
+            pending = len(tasks)
+            while pending:
+                item = await queue.get()
+                if item is None:
+                    pending -= 1
+                    continue
+                yield item
+
+            DIAGNOSIS_STAGE_LATENCY.labels(stage="specialists").observe(time.time() - stage_start)
+
+            # 2. Director (mismo orden de reportes que /diagnose para compartir caché)
+            logger.info("streaming_director")
+            stage_start = time.time()
+            director_payload = {
+                "historial": request.historial,
+                "reportes": {name: reports[name] for name in selected}
+            }
+            async for event, data in open_agent_stream("DIRECTOR", DIRECTOR_URL, director_payload):
+                if event == "delta":
+                    yield sse_event("director_delta", {"text": data["text"]})
+            DIAGNOSIS_STAGE_LATENCY.labels(stage="director").observe(time.time() - stage_start)
+
+            latency = (time.time() - start_time) * 1000
+            DIAGNOSIS_COUNTER.inc()
+            DIAGNOSIS_LATENCY.observe(latency / 1000)
+            yield sse_event("done", {"status": "completed", "latency_ms": latency})
+
+        except Exception as e:
+            logger.error("orchestration_stream_failed", error=str(e))
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            for task in tasks:
+                task.cancel()
+            release_slot()
+
+    events = event_generator()
+    # Si el cuerpo nunca se itera (cliente desconectado antes de empezar, respuesta no
+    # enviada) el finally del generador no corre: el hueco se libera al recolectarlo
+    weakref.finalize(events, release_slot)
+    return StreamingResponse(events, media_type="text/event-stream")
+
 # Expose Prometheus metrics
 metrics_app = make_asgi_app()
 app.mount("/metrics", metrics_app)
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Estadísticas de la caché de Groq por agente (en modo monolito, las del cliente compartido)."""
+    if local_agents:
+        return {"MONOLITH": local_agents.cache_stats()}
+
+    async def fetch(name: str, url: str) -> tuple[str, dict]:
+        try:
+            response = await http_client.get(f"{url}/cache/stats", timeout=5.0)
+            response.raise_for_status()
+            return name, response.json()
+        except Exception as e:
+            return name, {"error": str(e)}
+
+    agents = {**AGENTS_CONFIG, "DIRECTOR": DIRECTOR_URL}
+    return dict(await asyncio.gather(*(fetch(name, url) for name, url in agents.items())))
+
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "mode": "monolith" if MONOLITH_MODE else "distributed"}
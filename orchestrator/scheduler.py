@@ -0,0 +1,156 @@
+"""
+Planificador de diagnósticos: admisión acotada y cola por urgencia.
+
+- Como mucho `max_in_flight` diagnósticos se ejecutan a la vez; el resto espera en una
+  cola ordenada por urgencia (CRÍTICO > ALTO > MEDIO > BAJO) y, a igual urgencia, por llegada.
+- Con la cola llena se rechaza la petición (503 + Retry-After). Si la nueva petición es
+  más urgente que la peor en espera que admita rechazo, se expulsa esa en su lugar; los
+  lotes y trabajos (`shed=False`) nunca se expulsan.
+- Retry-After se estima con la duración media reciente de los diagnósticos.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple
+from opentelemetry import trace
+from prometheus_client import Counter, Gauge, Histogram
+
+tracer = trace.get_tracer("orchestrator")
+
+URGENCY_LEVELS = ("CRÍTICO", "ALTO", "MEDIO", "BAJO")
+DEFAULT_URGENCY = "MEDIO"
+
+QUEUE_DEPTH = Gauge('diagnosis_queue_depth', 'Diagnoses waiting for a slot', ['urgency'])
+IN_FLIGHT = Gauge('diagnosis_in_flight', 'Diagnoses currently running')
+QUEUE_WAIT = Histogram(
+    'diagnosis_queue_wait_seconds', 'Time spent waiting for a diagnosis slot', ['urgency'],
+    buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+REJECTED = Counter('diagnosis_rejected_total', 'Diagnoses shed by admission control', ['urgency', 'reason'])
+
+
+class QueueFullError(Exception):
+    """La cola de diagnósticos está llena; reintentar tras `retry_after` segundos."""
+
+    def __init__(self, retry_after: int, reason: str = "queue_full"):
+        super().__init__(f"Diagnosis queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class DiagnosisScheduler:
+    """Semáforo con prioridad por urgencia, cola acotada y desalojo del menos urgente."""
+
+    def __init__(self, max_in_flight: int = 16, max_queue: int = 64, default_duration: float = 30.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        # Duración media (EWMA) de un diagnóstico, para estimar Retry-After
+        self.avg_duration = default_duration
+        # (prioridad, llegada, urgencia, admite desalojo, futuro)
+        self._queue: List[Tuple[int, int, str, bool, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @staticmethod
+    def normalize(urgency: Optional[str]) -> str:
+        urgency = (urgency or DEFAULT_URGENCY).strip().upper().replace("CRITICO", "CRÍTICO")
+        return urgency if urgency in URGENCY_LEVELS else DEFAULT_URGENCY
+
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def retry_after(self) -> int:
+        """Segundos estimados hasta que se libere un hueco para la cola actual."""
+        rounds = (len(self._queue) + 1) / max(1, self.max_in_flight)
+        return max(1, math.ceil(rounds * self.avg_duration))
+
+    def _update_depth_metrics(self):
+        for level in URGENCY_LEVELS:
+            QUEUE_DEPTH.labels(urgency=level).set(sum(1 for entry in self._queue if entry[2] == level))
+
+    async def acquire(self, urgency: str, shed: bool = True) -> float:
+        """
+        Espera un hueco y devuelve los segundos esperados. Con `shed=False` (lotes) nunca
+        rechaza ni puede ser desalojada: espera aunque la cola supere `max_queue`.
+
+        Raises:
+            QueueFullError: si la cola está llena y no hay nadie menos urgente que desalojar.
+        """
+        level = self.normalize(urgency)
+        priority = URGENCY_LEVELS.index(level)
+        start = time.monotonic()
+
+        if self.in_flight < self.max_in_flight and not self._queue:
+            self.in_flight += 1
+            IN_FLIGHT.set(self.in_flight)
+            QUEUE_WAIT.labels(urgency=level).observe(0)
+            return 0.0
+
+        if shed and len(self._queue) >= self.max_queue:
+            self._evict_less_urgent_than(priority, level)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), level, shed, future)
+        heapq.heappush(self._queue, entry)
+        self._update_depth_metrics()
+        try:
+            # Solo las peticiones que realmente esperan dejan un span de cola en la traza
+            with tracer.start_as_current_span(
+                "diagnosis.queue_wait", attributes={"urgency": level, "queue_depth": len(self._queue)}
+            ):
+                await future
+        except BaseException:
+            if entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._update_depth_metrics()
+            elif future.done() and not future.cancelled() and future.exception() is None:
+                # El hueco ya nos fue asignado: se cede al siguiente
+                self.release()
+            raise
+        waited = time.monotonic() - start
+        QUEUE_WAIT.labels(urgency=level).observe(waited)
+        return waited
+
+    def _evict_less_urgent_than(self, priority: int, level: str):
+        """
+        Expulsa al último en llegar de los menos urgentes que admitan desalojo, o rechaza
+        la petición nueva si no hay ninguno menos urgente que ella.
+        """
+        sheddable = [entry for entry in self._queue if entry[3]]
+        worst = max(sheddable, key=lambda entry: (entry[0], entry[1]), default=None)
+        if worst is None or worst[0] <= priority:
+            REJECTED.labels(urgency=level, reason="queue_full").inc()
+            raise QueueFullError(self.retry_after())
+        self._queue.remove(worst)
+        heapq.heapify(self._queue)
+        REJECTED.labels(urgency=worst[2], reason="preempted").inc()
+        worst[4].set_exception(QueueFullError(self.retry_after(), reason="preempted"))
+
+    def release(self, duration: Optional[float] = None):
+        """Libera un hueco (y, si se indica, actualiza la duración media)."""
+        if duration is not None:
+            self.avg_duration = 0.8 * self.avg_duration + 0.2 * duration
+        while self._queue:
+            future = heapq.heappop(self._queue)[4]
+            if not future.done():
+                future.set_result(None)
+                self._update_depth_metrics()
+                return
+        self._update_depth_metrics()
+        self.in_flight -= 1
+        IN_FLIGHT.set(self.in_flight)
+
+    @asynccontextmanager
+    async def slot(self, urgency: Optional[str], shed: bool = True) -> AsyncIterator[float]:
+        """`async with scheduler.slot(urgencia):` ejecuta el bloque con un hueco asignado."""
+        waited = await self.acquire(urgency, shed)
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - start)
@@ -0,0 +1,164 @@
+"""
+Triage: decide qué especialistas consultar antes del fan-out.
+
+- "keywords": clasificador local por palabras clave sobre el historial (sin llamadas a Groq).
+- "llm": un modelo rápido (p. ej. llama-3.1-8b-instant) elige los especialistas; si la
+  llamada falla o la respuesta no es válida se usa el clasificador local. La llamada pasa
+  por el cliente de LLM de los agentes (pool de keys, limitador y circuit breaker compartidos).
+
+GENERAL se consulta siempre. Si ninguna especialidad tiene señales se consulta a todos:
+ante la duda es preferible el coste de una llamada de más que omitir un especialista.
+"""
+
+import asyncio
+import json
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+import structlog
+
+logger = structlog.get_logger()
+
+ALWAYS_INCLUDED = "GENERAL"
+
+# Raíces sin acentos; se buscan al inicio de palabra sobre el historial normalizado
+KEYWORDS: Dict[str, List[str]] = {
+    "RETINA": [
+        "retin", "macula", "vitre", "desprendimiento", "miodesopsia", "moscas volantes",
+        "fotopsia", "destello", "fondo de ojo", "dmae", "degeneracion macular", "diabet",
+        "oclusion venosa", "oclusion arterial", "hemorragia vitrea", "edema macular", "drusa",
+        "metamorfopsia", "angiografia", "cortina",
+    ],
+    "CORNEA": [
+        "cornea", "querat", "abrasion", "ulcera", "erosion", "lente de contacto", "lentes de contacto",
+        "cuerpo extrano", "ojo seco", "conjuntiv", "epitel", "fluoresce", "pterigion",
+        "sensacion de arena", "ojo rojo", "lagrimeo", "fotofobia", "trasplante", "leucoma", "queratocono",
+    ],
+    "NEURO": [
+        "nervio optico", "papil", "diplopia", "vision doble", "campo visual", "hemianop", "cuadrantanop",
+        "cefalea", "migrana", "pupila", "anisocoria", "ptosis", "neuritis", "esclerosis multiple",
+        "ictus", "paralisis", "nistagm", "atrofia optica", "defecto pupilar", "marcus gunn",
+        "hipertension intracraneal", "perdida de vision transitoria", "amaurosis",
+    ],
+}
+
+# Señales de urgencia para priorizar la cola cuando el cliente no la indica
+URGENCY_KEYWORDS: Dict[str, List[str]] = {
+    "CRÍTICO": [
+        "desprendimiento de retina", "perdida subita", "perdida brusca", "perdida de vision subita",
+        "ceguera subita", "amaurosis", "quemadura quimica", "causticacion", "trauma penetrante",
+        "herida penetrante", "estallido ocular", "cortina", "oclusion arterial", "endoftalmitis",
+        "celulitis orbitaria",
+    ],
+    "ALTO": [
+        "dolor ocular intenso", "dolor intenso", "glaucoma agudo", "cierre angular", "papiledema",
+        "diplopia subita", "vision doble subita", "anisocoria", "defecto pupilar", "ulcera corneal",
+        "hipopion", "fotopsia", "destello", "cuerpo extrano", "hemorragia vitrea", "neuritis",
+    ],
+    "MEDIO": [
+        "vision borrosa", "ojo rojo", "dolor", "miodesopsia", "moscas volantes", "fotofobia",
+    ],
+}
+
+# Palabras completas (admiten plural): "dolor" no debe saltar con "indolora"
+URGENCY_PATTERNS: Dict[str, "re.Pattern[str]"] = {
+    level: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in keywords) + r")(?:e?s)?\b")
+    for level, keywords in URGENCY_KEYWORDS.items()
+}
+
+LLM_SYSTEM_PROMPT = """Eres un sistema de triage oftalmológico. Decide qué subespecialistas deben revisar el caso.
+Opciones: RETINA (retina y vítreo), CORNEA (córnea y superficie ocular), NEURO (neuro-oftalmología).
+Responde ÚNICAMENTE con JSON: {"especialistas": ["..."], "motivo": "..."}.
+Incluye un especialista si hay cualquier duda razonable de que su área esté implicada."""
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFD", text.lower())
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+
+def estimate_urgency(historial: str) -> str:
+    """Urgencia aproximada (BAJO/MEDIO/ALTO/CRÍTICO) por palabras clave, sin llamadas a Groq."""
+    text = _normalize(historial)
+    for level, pattern in URGENCY_PATTERNS.items():
+        if pattern.search(text):
+            return level
+    return "BAJO"
+
+
+class TriageRouter:
+    """
+    Selecciona especialistas por palabras clave o con un modelo pequeño de Groq.
+
+    `client` es el cliente de LLM de los agentes (`Utils.enrutador.crear_cliente_llm`):
+    cualquier objeto con `generar_respuesta(..., formato_json=, modelo=)`.
+    """
+
+    def __init__(
+        self,
+        agents: List[str],
+        mode: str = "off",
+        model: str = "llama-3.1-8b-instant",
+        client: Optional[Any] = None,
+        timeout: float = 5.0,
+    ):
+        self.agents = agents
+        self.mode = mode
+        self.model = model
+        self.client = client
+        self.timeout = timeout
+        self._patterns = {
+            agent: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in keywords) + r")")
+            for agent, keywords in KEYWORDS.items()
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("keywords", "llm")
+
+    def _decision(self, mode: str, selected: List[str], reason: str) -> dict:
+        selected = [a for a in self.agents if a == ALWAYS_INCLUDED or a in selected]
+        return {
+            "mode": mode,
+            "selected": selected,
+            "skipped": [a for a in self.agents if a not in selected],
+            "reason": reason,
+        }
+
+    def classify_keywords(self, historial: str) -> dict:
+        text = _normalize(historial)
+        scores = {agent: len(pattern.findall(text)) for agent, pattern in self._patterns.items()}
+        selected = [agent for agent, score in scores.items() if score > 0]
+        if not selected:
+            return self._decision("keywords", self.agents, "sin señales de especialidad: se consulta a todos")
+        return self._decision("keywords", selected, "coincidencias: " + ", ".join(f"{a}={s}" for a, s in scores.items()))
+
+    async def classify_llm(self, historial: str) -> dict:
+        answer = await asyncio.wait_for(
+            self.client.generar_respuesta(
+                historial,
+                system_prompt=LLM_SYSTEM_PROMPT,
+                temperature=0,
+                max_tokens=150,
+                formato_json=True,
+                modelo=self.model,
+            ),
+            timeout=self.timeout,
+        )
+        content = json.loads(answer)
+        selected = [str(a).upper() for a in content.get("especialistas", [])]
+        unknown = [a for a in selected if a not in self.agents]
+        if unknown:
+            raise ValueError(f"Unknown specialists in triage answer: {unknown}")
+        return self._decision("llm", selected, str(content.get("motivo", ""))[:300])
+
+    async def route(self, historial: str) -> dict:
+        """Decisión de enrutado: {"mode", "selected", "skipped", "reason"}."""
+        if not self.enabled:
+            return self._decision("off", self.agents, "triage desactivado")
+        if self.mode == "llm" and self.client:
+            try:
+                return await self.classify_llm(historial)
+            except Exception as e:
+                logger.warning("triage_llm_failed", error=str(e))
+        return self.classify_keywords(historial)
@@ -0,0 +1,92 @@
+"""
+Lectura de historiales subidos como archivo (POST /diagnose/upload).
+
+Acepta un archivo de texto o un zip con muchos (como `Historales_Oftalmologicos/`).
+Los archivos se leen por bloques con límites de tamaño; del zip se descomprime un
+miembro cada vez, de modo que nunca se carga el archivo completo en memoria.
+"""
+
+import asyncio
+import os
+import zipfile
+from typing import AsyncIterator, BinaryIO, List, Optional, Tuple
+
+CHUNK_SIZE = 64 * 1024
+ZIP_MAGIC = b"PK\x03\x04"
+
+
+class UploadError(ValueError):
+    """El archivo subido no es un historial válido (tamaño, formato o codificación)."""
+    pass
+
+
+def decode_text(data: bytes) -> Tuple[str, str]:
+    """Decodifica un historial: UTF-8 (con o sin BOM) y, si no es válido, Latin-1."""
+    if b"\x00" in data:
+        raise UploadError("Binary content is not a clinical text file")
+    try:
+        return data.decode("utf-8-sig"), "utf-8"
+    except UnicodeDecodeError:
+        return data.decode("latin-1"), "latin-1"
+
+
+def read_limited(stream: BinaryIO, max_bytes: int) -> bytes:
+    """Lee por bloques hasta `max_bytes`; más allá lanza UploadError sin seguir leyendo."""
+    chunks, total = [], 0
+    while chunk := stream.read(CHUNK_SIZE):
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadError(f"File exceeds the {max_bytes} byte limit")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def is_zip(stream: BinaryIO) -> bool:
+    head = stream.read(len(ZIP_MAGIC))
+    stream.seek(0)
+    return head == ZIP_MAGIC
+
+
+def _is_candidate(info: zipfile.ZipInfo) -> bool:
+    name = os.path.basename(info.filename)
+    return not info.is_dir() and not info.filename.startswith("__MACOSX/") and bool(name) and not name.startswith(".")
+
+
+def open_zip(stream: BinaryIO, max_files: int) -> Tuple[zipfile.ZipFile, List[zipfile.ZipInfo]]:
+    """Abre el zip (solo lee el índice) y devuelve los archivos candidatos a historial."""
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile as e:
+        raise UploadError(f"Invalid zip archive: {e}") from e
+    members = [info for info in archive.infolist() if _is_candidate(info)]
+    if len(members) > max_files:
+        archive.close()
+        raise UploadError(f"Archive has {len(members)} files, the limit is {max_files}")
+    return archive, members
+
+
+async def iter_zip_texts(
+    archive: zipfile.ZipFile, members: List[zipfile.ZipInfo], max_file_bytes: int
+) -> AsyncIterator[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    Produce (nombre, texto, error) por cada archivo del zip, descomprimiendo uno a la vez
+    en un hilo. Un miembro inválido produce un error sin interrumpir los demás.
+    """
+    with archive:
+        for info in members:
+            try:
+                # `file_size` lo declara el propio zip: se vuelve a comprobar al leer
+                if info.file_size > max_file_bytes:
+                    raise UploadError(f"File exceeds the {max_file_bytes} byte limit")
+
+                def read_member() -> bytes:
+                    with archive.open(info) as member:
+                        return read_limited(member, max_file_bytes)
+
+                text, _ = decode_text(await asyncio.to_thread(read_member))
+                if not text.strip():
+                    raise UploadError("Empty file")
+                yield info.filename, text, None
+            except (UploadError, zipfile.BadZipFile, RuntimeError) as e:
+                yield info.filename, None, str(e)
+
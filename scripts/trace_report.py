@@ -0,0 +1,127 @@
+"""
+Análisis offline de las trazas JSONL que escriben orquestador y agentes con TRACE_DIR.
+
+Reúne los archivos de todos los servicios y muestra cada traza como un árbol con el
+desplazamiento y la duración de cada span, o un resumen de tiempo por tipo de span:
+
+    python scripts/trace_report.py traces/                       # últimas trazas
+    python scripts/trace_report.py traces/ --request-id 3f2a...  # una petición concreta
+    python scripts/trace_report.py traces/ --summary             # dónde se va el tiempo
+"""
+
+import argparse
+import glob
+import json
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+# Atributos que se muestran junto al nombre del span en el árbol
+SHOWN_ATTRIBUTES = ("agent", "request_id", "groq.model", "groq.attempt", "groq.retry_reason",
+                    "groq.wait_seconds", "cache.hit", "urgency", "http.status_code", "missing")
+
+
+def parse_time(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def load_spans(paths: List[str]) -> List[dict]:
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "*.jsonl"))) if os.path.isdir(path) else [path])
+    spans = []
+    for file in files:
+        with open(file, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                raw = json.loads(line)
+                spans.append({
+                    "trace_id": raw["context"]["trace_id"],
+                    "span_id": raw["context"]["span_id"],
+                    "parent_id": raw.get("parent_id"),
+                    "name": raw["name"],
+                    "service": raw["resource"]["attributes"].get("service.name", "?"),
+                    "start": parse_time(raw["start_time"]),
+                    "end": parse_time(raw["end_time"]),
+                    "status": raw["status"]["status_code"],
+                    "attributes": raw.get("attributes", {}),
+                })
+    return spans
+
+
+def print_tree(trace: List[dict]):
+    by_id = {span["span_id"]: span for span in trace}
+    children: Dict[str, List[dict]] = defaultdict(list)
+    roots = []
+    for span in trace:
+        # Un padre que no está en los archivos (p. ej. un cliente externo) se trata como raíz
+        if span["parent_id"] in by_id:
+            children[span["parent_id"]].append(span)
+        else:
+            roots.append(span)
+    origin = min(span["start"] for span in trace)
+
+    def walk(span: dict, depth: int):
+        attrs = " ".join(f"{k}={span['attributes'][k]}" for k in SHOWN_ATTRIBUTES if k in span["attributes"])
+        error = " ERROR" if span["status"] == "ERROR" else ""
+        print(f"{(span['start'] - origin) * 1000:9.1f}ms {(span['end'] - span['start']) * 1000:9.1f}ms  "
+              f"{'  ' * depth}{span['name']} [{span['service']}]{error} {attrs}".rstrip())
+        for child in sorted(children[span["span_id"]], key=lambda s: s["start"]):
+            walk(child, depth + 1)
+
+    print(f"trace {trace[0]['trace_id']}")
+    print(f"{'offset':>11} {'duration':>11}")
+    for root in sorted(roots, key=lambda s: s["start"]):
+        walk(root, 0)
+    print()
+
+
+def print_summary(spans: List[dict]):
+    """Número, tiempo total y p50/p95 por (servicio, span): qué etapa acumula más tiempo."""
+    groups: Dict[tuple, List[float]] = defaultdict(list)
+    for span in spans:
+        groups[(span["service"], span["name"])].append((span["end"] - span["start"]) * 1000)
+    print(f"{'service':<18} {'span':<32} {'count':>6} {'total_s':>9} {'p50_ms':>9} {'p95_ms':>9}")
+    for (service, name), durations in sorted(groups.items(), key=lambda item: -sum(item[1])):
+        durations.sort()
+        p50 = durations[len(durations) // 2]
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        print(f"{service:<18} {name:<32} {len(durations):>6} {sum(durations) / 1000:>9.2f} {p50:>9.1f} {p95:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumen offline de trazas JSONL (TRACE_DIR)")
+    parser.add_argument("paths", nargs="+", help="Directorios o archivos .jsonl")
+    parser.add_argument("--request-id", help="Solo la traza de esta petición (cabecera X-Request-ID)")
+    parser.add_argument("--trace-id", help="Solo esta traza (hex, con o sin 0x)")
+    parser.add_argument("--last", type=int, default=3, help="Número de trazas más recientes a mostrar")
+    parser.add_argument("--summary", action="store_true", help="Tiempo agregado por tipo de span")
+    args = parser.parse_args()
+
+    spans = load_spans(args.paths)
+    if not spans:
+        parser.error("no spans found")
+    if args.summary:
+        print_summary(spans)
+        return
+
+    traces: Dict[str, List[dict]] = defaultdict(list)
+    for span in spans:
+        traces[span["trace_id"]].append(span)
+    if args.trace_id:
+        wanted = "0x" + args.trace_id.lower().removeprefix("0x")
+        selected = [traces[wanted]] if wanted in traces else []
+    elif args.request_id:
+        selected = [t for t in traces.values() if any(s["attributes"].get("request_id") == args.request_id for s in t)]
+    else:
+        selected = sorted(traces.values(), key=lambda t: min(s["start"] for s in t))[-args.last:]
+    if not selected:
+        parser.error("no matching trace")
+    for trace in selected:
+        print_tree(trace)
+
+
+if __name__ == "__main__":
+    main()
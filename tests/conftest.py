@@ -0,0 +1,23 @@
+"""
+Configuración común de las pruebas.
+
+Los agentes importan `Utils.*` desde `agents/` y el orquestador usa imports planos desde
+`orchestrator/`. La raíz del repo tiene además el paquete `Utils/` del CLI legado, que
+ocultaría al de los agentes: se saca de sys.path (aparece con `python -m pytest`).
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path[:] = [p for p in sys.path if os.path.abspath(p or os.curdir) != ROOT]
+sys.path.insert(0, os.path.join(ROOT, "agents"))
+sys.path.insert(0, os.path.join(ROOT, "orchestrator"))
+
+# Sin servicios externos: Redis inalcanzable (se usan los estados en memoria) y sin caché ni limitador
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:1/0")
+os.environ.setdefault("ENABLE_CACHE", "false")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("TRACE_DIR", "")
@@ -0,0 +1,87 @@
+import asyncio
+import io
+import json
+import zipfile
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def agentes(monkeypatch):
+    """Sustituye a los agentes y al director por un transporte falso; devuelve las peticiones recibidas."""
+    recibidas = []
+
+    def responder(request: httpx.Request) -> httpx.Response:
+        cuerpo = json.loads(request.content)
+        recibidas.append((request.url.host, cuerpo))
+        if "fallo" in cuerpo["historial"]:
+            return httpx.Response(500, json={"detail": "error simulado"})
+        return httpx.Response(200, json={"resultado": f"reporte de {request.url.host}"})
+
+    monkeypatch.setattr(main, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(responder)))
+    return recibidas
+
+
+def lineas_ndjson(response) -> list:
+    return [json.loads(linea) for linea in response.text.splitlines() if linea.strip()]
+
+
+def test_batch_diagnostica_cada_registro(agentes):
+    registros = [{"id": f"r{i}", "historial": f"paciente {i} con visión borrosa"} for i in range(3)]
+    with TestClient(main.app) as client:
+        response = client.post("/diagnose/batch", json={"records": registros})
+    assert response.status_code == 200
+    lineas = lineas_ndjson(response)
+    resultados = sorted((l for l in lineas if l["type"] == "result"), key=lambda l: l["index"])
+    assert [r["id"] for r in resultados] == ["r0", "r1", "r2"]
+    assert all(r["status"] == "completed" for r in resultados)
+    assert resultados[0]["result"]["diagnosis"] == "reporte de agent-director"
+    assert set(resultados[0]["result"]["reports"]) == set(main.AGENTS_CONFIG)
+    assert lineas[-1] == {**lineas[-1], "type": "summary", "records": 3, "completed": 3, "failed": 0}
+    # Cuatro especialistas y el director por registro
+    assert len(agentes) == 15
+
+
+def test_upload_zip_emite_un_resultado_por_archivo(agentes):
+    archivo = io.BytesIO()
+    with zipfile.ZipFile(archivo, "w") as zf:
+        zf.writestr("a.txt", "paciente A con dolor ocular")
+        zf.writestr("b.txt", "paciente B con miodesopsias")
+        zf.writestr("vacio.txt", "")
+    with TestClient(main.app) as client:
+        response = client.post("/diagnose/upload", files={"file": ("lote.zip", archivo.getvalue(), "application/zip")})
+    assert response.status_code == 200
+    lineas = lineas_ndjson(response)
+    estados = {l["id"]: l["status"] for l in lineas if l["type"] == "result"}
+    assert estados == {"a.txt": "completed", "b.txt": "completed", "vacio.txt": "failed"}
+    assert lineas[-1]["completed"] == 2 and lineas[-1]["failed"] == 1
+
+
+def test_registro_fallido_no_aborta_el_lote(agentes):
+    registros = [{"id": "ok", "historial": "paciente sano"}, {"id": "ko", "historial": "fallo del director"}]
+    with TestClient(main.app) as client:
+        response = client.post("/diagnose/batch", json={"records": registros})
+    estados = {l["id"]: l["status"] for l in lineas_ndjson(response) if l["type"] == "result"}
+    assert estados == {"ok": "completed", "ko": "failed"}
+
+
+def test_fallos_de_checkpoint_y_on_report_no_pierden_el_diagnostico(agentes, monkeypatch):
+    class CheckpointsRotos:
+        async def aload(self, record_hash):
+            return {}
+
+        async def asave(self, record_hash, stage, content):
+            raise OSError("disco lleno")
+
+    async def on_report(nombre, reporte):
+        raise RuntimeError("cliente desconectado")
+
+    monkeypatch.setattr(main, "checkpoint_store", CheckpointsRotos())
+    resultado = asyncio.run(main.run_diagnosis("paciente con visión borrosa", on_report=on_report, checkpoint=True))
+    assert resultado.status == "completed"
+    assert set(resultado.reports) == set(main.AGENTS_CONFIG)
+    assert resultado.diagnosis == "reporte de agent-director"
@@ -0,0 +1,58 @@
+import asyncio
+from datetime import timedelta
+
+from Utils.cache import CacheDosNiveles, CacheLRU, canonicalizar, codificar, decodificar
+from Utils.cliente_groq import ClienteGroqAsync
+
+
+def test_canonicalizar_ignora_espacios_tipografia_y_campos():
+    a = "PACIENTE: Ana\r\nFECHA: 2024-01-01\r\nDolor   “ocular” izquierdo\n\n\n\nPIO 24"
+    b = "PACIENTE: Luis\nFECHA: 2025-02-02\nDolor \"ocular\" izquierdo\n\nPIO 24"
+    assert canonicalizar(a, ["PACIENTE", "FECHA"]) == canonicalizar(b, ["paciente", "fecha"])
+    assert canonicalizar(a) != canonicalizar(b)
+
+
+def test_codificar_y_decodificar():
+    texto = "Diagnóstico: glaucoma " * 50
+    for compresion in ("zlib", "zstd", "none"):
+        assert decodificar(codificar(texto, compresion)) == texto
+    assert len(codificar(texto, "zlib")) < len(texto.encode())
+    # Entradas antiguas sin cabecera de compresión
+    assert decodificar(texto.encode()) == texto
+
+
+def test_lru_acotada_por_bytes():
+    lru = CacheLRU(max_bytes=10)
+    lru.set("a", "1234")
+    lru.set("b", "1234")
+    assert lru.get("a") == "1234"  # "a" pasa a ser el más reciente
+    lru.set("c", "1234")
+    assert lru.get("b") is None
+    assert lru.get("a") == "1234" and lru.get("c") == "1234"
+    assert lru.evictions == 1 and lru.bytes_usados == 8
+    lru.set("grande", "x" * 11)
+    assert lru.get("grande") is None
+
+
+def test_cache_solo_l1_sin_redis():
+    async def escenario():
+        cache = CacheDosNiveles("redis://127.0.0.1:1/0", ttl=timedelta(seconds=60), redis_enabled=False)
+        await cache.conectar()
+        assert await cache.get("k") is None
+        await cache.set("k", "valor")
+        assert await cache.get("k") == "valor"
+        return cache.stats
+
+    stats = asyncio.run(escenario())
+    assert stats["l1_hits"] == 1 and stats["misses"] == 1 and stats["l2_hits"] == 0
+
+
+def test_clave_de_cache_por_parametros_y_canonica():
+    cliente = ClienteGroqAsync(api_key="test-key")
+    base = cliente._get_cache_key("Dolor  ocular", "sistema", "modelo-a", 0.7, 100)
+    assert base == cliente._get_cache_key("Dolor ocular", "sistema", "modelo-a", 0.7, 100)
+    assert base.startswith("groq:cache:modelo-a:")
+    assert base != cliente._get_cache_key("Dolor ocular", "sistema", "modelo-b", 0.7, 100)
+    assert base != cliente._get_cache_key("Dolor ocular", "sistema", "modelo-a", 0.2, 100)
+    assert base != cliente._get_cache_key("Dolor ocular", "sistema", "modelo-a", 0.7, 200)
+    assert base != cliente._get_cache_key("Dolor ocular", "sistema", "modelo-a", 0.7, 100, formato_json=True)
@@ -0,0 +1,40 @@
+from Utils.cascada import PoliticaCascada
+
+REPORTE = """1. HALLAZGOS RELEVANTES
+- PIO 24 mmHg
+
+2. DIAGNÓSTICO DIFERENCIAL
+1. Glaucoma
+
+3. PRUEBAS DIAGNÓSTICAS RECOMENDADAS
+- Campimetría
+
+4. TRATAMIENTO SUGERIDO
+- Latanoprost
+
+5. NIVEL DE URGENCIA: {urgencia}
+
+CERTEZA: {certeza}%
+"""
+
+
+def politica() -> PoliticaCascada:
+    return PoliticaCascada("RETINA", "rapido", "grande", certeza_minima=70)
+
+
+def test_acepta_reporte_completo_y_seguro():
+    assert politica().motivo_escalado(REPORTE.format(urgencia="BAJO", certeza=85)) is None
+
+
+def test_motivos_de_escalado():
+    p = politica()
+    assert p.motivo_escalado(REPORTE.format(urgencia="BAJO", certeza=50)) == "low_certainty"
+    assert p.motivo_escalado(REPORTE.format(urgencia="CRÍTICO", certeza=95)) == "high_urgency"
+    assert p.motivo_escalado(REPORTE.format(urgencia="BAJO", certeza=85).replace("CERTEZA: 85%", "")) == "no_certainty"
+    assert p.motivo_escalado("1. HALLAZGOS RELEVANTES\n- algo") == "missing_sections"
+
+
+def test_nivel_por_defecto():
+    assert politica().nivel(None) == "balanced"
+    assert politica().nivel("quality") == "quality"
+    assert politica().nivel("otro") == "balanced"
@@ -0,0 +1,34 @@
+import pytest
+
+from checkpoints import DIRECTOR_STAGE, CheckpointStore
+
+
+def test_guarda_y_retoma_etapas(tmp_path):
+    ruta = tmp_path / "lotes" / "checkpoints.sqlite3"
+    store = CheckpointStore(str(ruta), pipeline="orchestrator")
+    clave = CheckpointStore.record_key("historial", "balanced")
+    store.save(clave, "RETINA", "reporte retina")
+    store.save(clave, "RETINA", "reporte retina v2")
+    store.save(clave, DIRECTOR_STAGE, "síntesis")
+    store.close()
+
+    reabierto = CheckpointStore(str(ruta), pipeline="orchestrator")
+    assert reabierto.load(clave) == {"RETINA": "reporte retina v2", DIRECTOR_STAGE: "síntesis"}
+    assert reabierto.stats() == {"records": 1, "stages": 2}
+    reabierto.close()
+
+
+def test_record_key_separa_por_scope():
+    assert CheckpointStore.record_key(" historial \n") == CheckpointStore.record_key("historial")
+    assert CheckpointStore.record_key("historial", None) == CheckpointStore.record_key("historial", "")
+    assert CheckpointStore.record_key("historial", "fast") != CheckpointStore.record_key("historial", "quality")
+
+
+def test_cada_base_pertenece_a_un_pipeline(tmp_path):
+    ruta = str(tmp_path / "checkpoints.sqlite3")
+    CheckpointStore(ruta, pipeline="cli").close()
+    with pytest.raises(ValueError):
+        CheckpointStore(ruta, pipeline="orchestrator")
+    CheckpointStore(ruta, pipeline="cli").close()
+    with pytest.raises(ValueError):
+        CheckpointStore(str(tmp_path / "otra.sqlite3"), pipeline="lotes")
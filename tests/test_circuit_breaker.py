@@ -0,0 +1,178 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from groq import AsyncGroq, RateLimitError
+from tenacity import stop_after_attempt
+
+from Utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerOpenException
+from Utils.cliente_groq import ClienteGroqAsync
+
+
+def breaker(**kwargs) -> CircuitBreaker:
+    opciones = dict(failure_rate=0.5, min_requests=4, window_seconds=60, reset_timeout=0.1, max_probes=2)
+    opciones.update(kwargs)
+    return CircuitBreaker(lambda: None, nombre="test", **opciones)
+
+
+async def llamar(cb: CircuitBreaker, exito: bool):
+    sonda = await cb.permitir()
+    await cb.registrar(exito, sonda)
+    return sonda
+
+
+def test_abre_con_tasa_de_error_y_volumen_minimo():
+    async def escenario():
+        cb = breaker()
+        for _ in range(3):
+            await llamar(cb, False)
+        assert cb.estado == CLOSED  # por debajo de min_requests
+        await llamar(cb, False)
+        assert cb.estado == OPEN and cb.abierto()
+        with pytest.raises(CircuitBreakerOpenException):
+            await cb.permitir()
+
+    asyncio.run(escenario())
+
+
+def test_errores_aislados_no_abren():
+    async def escenario():
+        cb = breaker()
+        for exito in (True, True, False, True, True, False, True):
+            await llamar(cb, exito)
+        assert cb.estado == CLOSED
+
+    asyncio.run(escenario())
+
+
+def test_half_open_limita_sondas_y_cierra_tras_exitos():
+    async def escenario():
+        cb = breaker()
+        for _ in range(4):
+            await llamar(cb, False)
+        await asyncio.sleep(0.15)
+        sondas = [await cb.permitir(), await cb.permitir()]
+        assert sondas == [True, True] and cb.estado == HALF_OPEN
+        with pytest.raises(CircuitBreakerOpenException):
+            await cb.permitir()  # sin huecos de sonda libres
+        await cb.registrar(True, True)
+        await cb.registrar(True, True)
+        assert cb.estado == CLOSED
+        assert await cb.permitir() is False
+
+    asyncio.run(escenario())
+
+
+def test_sonda_fallida_reabre():
+    async def escenario():
+        cb = breaker()
+        for _ in range(4):
+            await llamar(cb, False)
+        await asyncio.sleep(0.15)
+        assert await llamar(cb, False) is True
+        assert cb.estado == OPEN
+
+    asyncio.run(escenario())
+
+
+def test_sonda_liberada_y_caducidad_local():
+    async def escenario():
+        cb = breaker(max_probes=1)
+        for _ in range(4):
+            await llamar(cb, False)
+        await asyncio.sleep(0.15)
+        assert await cb.permitir() is True
+        await cb.liberar_sonda()  # cancelada: el hueco vuelve sin contar como éxito
+        assert await cb.permitir() is True and cb.estado == HALF_OPEN
+        with pytest.raises(CircuitBreakerOpenException):
+            await cb.permitir()
+        await asyncio.sleep(0.15)  # sonda perdida: caduca a los reset_timeout, como en Redis
+        assert await cb.permitir() is True
+
+    asyncio.run(escenario())
+
+
+def cliente_falso(monkeypatch, manejador) -> ClienteGroqAsync:
+    """ClienteGroqAsync con la API servida por `manejador` (httpx.MockTransport)."""
+    monkeypatch.setenv("BREAKER_MIN_REQUESTS", "1")
+    monkeypatch.setenv("BREAKER_RESET_TIMEOUT", "0.1")
+    monkeypatch.setenv("BREAKER_HALF_OPEN_PROBES", "1")
+    cliente = ClienteGroqAsync(api_key="k")
+    sdk = AsyncGroq(api_key="k", max_retries=0, http_client=httpx.AsyncClient(transport=httpx.MockTransport(manejador)))
+    for clave in cliente.pool.claves:
+        clave.cliente = sdk
+    return cliente
+
+
+def respuesta_chat(request: httpx.Request) -> httpx.Response:
+    if json.loads(request.content).get("stream"):
+        trozos = [{"choices": [{"index": 0, "delta": {"content": texto}}]} for texto in ("uno ", "dos")]
+        cuerpo = "".join(f"data: {json.dumps(trozo)}\n\n" for trozo in trozos) + "data: [DONE]\n\n"
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=cuerpo.encode())
+    return httpx.Response(200, json={
+        "id": "1", "object": "chat.completion", "created": 0, "model": "m",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    })
+
+
+async def abrir_y_esperar_half_open(cliente: ClienteGroqAsync):
+    await cliente.breaker.registrar(False)
+    assert cliente.breaker.estado == OPEN
+    await asyncio.sleep(0.15)
+
+
+def test_sonda_cancelada_del_cliente_devuelve_su_hueco(monkeypatch):
+    async def lenta(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(5)
+        return respuesta_chat(request)
+
+    async def escenario():
+        cliente = cliente_falso(monkeypatch, lenta)
+        await abrir_y_esperar_half_open(cliente)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(cliente._llamar_api("k1", "hola", "", 0.1, 16), 0.05)
+        assert await cliente.breaker.permitir() is True
+        await cliente.breaker.liberar_sonda()
+
+        # Stream abandonado a medias (el cliente SSE se desconecta)
+        cliente = cliente_falso(monkeypatch, respuesta_chat)
+        await abrir_y_esperar_half_open(cliente)
+        stream = cliente.generar_respuesta_stream("hola")
+        assert await stream.__anext__() == "uno "
+        await stream.aclose()
+        assert await cliente.breaker.permitir() is True
+
+    asyncio.run(escenario())
+
+
+def test_sonda_con_429_no_cierra_el_circuito(monkeypatch):
+    def limitada(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, headers={"retry-after": "0"}, json={"error": {"message": "rate limited"}})
+
+    async def escenario():
+        cliente = cliente_falso(monkeypatch, limitada)
+        await abrir_y_esperar_half_open(cliente)
+        with pytest.raises(RateLimitError):
+            await cliente._llamar_api.retry_with(stop=stop_after_attempt(1), reraise=True)(cliente, "k1", "hola", "", 0.1, 16)
+        # Ni éxito ni fallo: sigue en half-open y la sonda vuelve a estar libre
+        assert cliente.breaker.estado == HALF_OPEN
+        assert await cliente.breaker.permitir() is True
+
+    asyncio.run(escenario())
+
+
+def test_breaker_abierto_no_gasta_tokens_del_limitador(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_ENABLED", "true")
+
+    async def escenario():
+        cliente = cliente_falso(monkeypatch, respuesta_chat)
+        await cliente.breaker.registrar(False)
+        cubo = cliente.pool.claves[0].limitador._local
+        with pytest.raises(CircuitBreakerOpenException):
+            await cliente.generar_respuesta("hola")
+        return cubo.tokens["rpm"], cubo.cap["rpm"]
+
+    restantes, capacidad = asyncio.run(escenario())
+    assert restantes == capacidad
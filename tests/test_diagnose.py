@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+def estructurado(urgencia: str) -> dict:
+    return {"hallazgos": ["retina desprendida"], "nivel_urgencia": urgencia}
+
+
+@pytest.fixture
+def agentes_estructurados(monkeypatch):
+    """Especialistas en modo estructurado: el de retina ve una urgencia CRÍTICO."""
+    def responder(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        cuerpo = {"resultado": f"reporte de {host}"}
+        if host == "agent-retina":
+            cuerpo["estructurado"] = estructurado("CRÍTICO")
+        elif host != "agent-director":
+            cuerpo["estructurado"] = estructurado("BAJO")
+        return httpx.Response(200, json=cuerpo)
+
+    monkeypatch.setattr(main, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(responder)))
+
+
+def test_diagnose_expone_los_reportes_estructurados(agentes_estructurados):
+    with TestClient(main.app) as client:
+        response = client.post("/diagnose", json={"historial": "paciente con visión borrosa", "urgency": "BAJO"})
+    assert response.status_code == 200
+    cuerpo = response.json()
+    assert cuerpo["status"] == "completed"
+    assert set(cuerpo["structured_reports"]) == set(main.AGENTS_CONFIG)
+    assert cuerpo["structured_reports"]["RETINA"]["nivel_urgencia"] == "CRÍTICO"
+    assert cuerpo["reported_urgency"] == "CRÍTICO"
+    assert cuerpo["urgency"] == "BAJO"
+
+
+@pytest.fixture
+def director_agotado(monkeypatch):
+    """Especialistas correctos y un director que agota el deadline (504); devuelve las cabeceras recibidas."""
+    cabeceras = {}
+
+    def responder(request: httpx.Request) -> httpx.Response:
+        cabeceras[request.url.host] = request.headers.get(main.DEADLINE_HEADER)
+        if request.url.host == "agent-director":
+            return httpx.Response(504, json={"detail": "Deadline exceeded"})
+        return httpx.Response(200, json={"resultado": f"reporte de {request.url.host}"})
+
+    monkeypatch.setattr(main, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(responder)))
+    return cabeceras
+
+
+def test_director_504_devuelve_reportes_con_el_director_faltante(director_agotado):
+    with TestClient(main.app) as client:
+        response = client.post("/diagnose", json={"historial": "paciente con visión borrosa", "deadline_seconds": 20})
+    assert response.status_code == 200
+    cuerpo = response.json()
+    assert cuerpo["status"] == "partial"
+    assert cuerpo["diagnosis"] is None
+    assert cuerpo["missing_reports"] == ["DIRECTOR"]
+    assert set(cuerpo["reports"]) == set(main.AGENTS_CONFIG)
+    # El deadline restante viaja a cada agente y nunca supera el presupuesto pedido
+    assert set(director_agotado) == {"agent-general", "agent-retina", "agent-cornea", "agent-neuro", "agent-director"}
+    assert all(0 < int(ms) <= 20000 for ms in director_agotado.values())
+
+
+def test_sin_reportes_antes_del_deadline_responde_504(monkeypatch):
+    async def responder(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(1)
+        return httpx.Response(200, json={"resultado": "tarde"})
+
+    monkeypatch.setattr(main, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(responder)))
+    with TestClient(main.app) as client:
+        response = client.post("/diagnose", json={"historial": "paciente con visión borrosa", "deadline_seconds": 0.2})
+    assert response.status_code == 504
@@ -0,0 +1,103 @@
+"""
+Conmutación entre proveedores contra dos instancias de `benchmarks/fake_groq.py` servidas en
+proceso (httpx.ASGITransport): Groq con el SDK y un respaldo compatible con OpenAI con httpx.
+"""
+
+import asyncio
+import importlib.util
+import os
+
+import httpx
+import pytest
+from groq import AsyncGroq, RateLimitError
+from tenacity import wait_none
+
+from Utils.circuit_breaker import OPEN
+from Utils.cliente_groq import ClienteGroqAsync
+from Utils.cliente_openai import ClienteOpenAICompatAsync
+from Utils.enrutador import EnrutadorProveedores
+
+FAKE_GROQ = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fake_groq.py")
+
+
+def servidor_falso(nombre: str):
+    """Una instancia independiente de fake_groq (su perfil y estadísticas son globales del módulo)."""
+    spec = importlib.util.spec_from_file_location(nombre, FAKE_GROQ)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    modulo.profile = modulo.Profile(ttft_ms=0, tokens_per_second=1e6, completion_tokens=50)
+    return modulo
+
+
+def transporte(servidor) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=servidor.app))
+
+
+@pytest.fixture
+def proveedores(monkeypatch):
+    monkeypatch.setattr(ClienteGroqAsync._llamar_api.retry, "wait", wait_none())
+    monkeypatch.setenv("LOCAL_BASE_URL", "http://respaldo/openai/v1")
+    monkeypatch.setenv("LOCAL_MODEL", "fake")
+    monkeypatch.setenv("LOCAL_API_KEY", "clave-respaldo")
+    groq, respaldo = servidor_falso("fake_groq_principal"), servidor_falso("fake_groq_respaldo")
+
+    principal = ClienteGroqAsync(api_key="clave-groq")
+    sdk = AsyncGroq(api_key="clave-groq", base_url="http://groq", max_retries=0, http_client=transporte(groq))
+    for clave in principal.pool.claves:
+        clave.cliente = sdk
+
+    secundario = ClienteOpenAICompatAsync("local")
+    secundario.client = httpx.AsyncClient(
+        base_url=secundario.client.base_url, transport=httpx.ASGITransport(app=respaldo.app)
+    )
+    for clave in secundario.pool.claves:
+        clave.cliente = secundario.client
+    return EnrutadorProveedores([principal, secundario]), groq, respaldo
+
+
+def test_conmuta_al_respaldo_y_abre_el_breaker_de_groq(proveedores):
+    enrutador, groq, respaldo = proveedores
+    groq.profile.error_rate = 1.0
+
+    async def escenario():
+        reporte = await enrutador.generar_respuesta("paciente con visión borrosa")
+        principal = enrutador.principal
+        assert principal.breaker.estado == OPEN
+        assert [p.proveedor for p in enrutador.orden()] == ["local", "groq"]
+        # Con el breaker abierto la siguiente llamada va directa al respaldo
+        await enrutador.generar_respuesta("otro paciente")
+        return reporte
+
+    reporte = asyncio.run(escenario())
+    assert "DIAGNÓSTICO DIFERENCIAL" in reporte
+    assert groq.stats["errors"] == 5 and groq.stats["completed"] == 0
+    assert respaldo.stats["completed"] == 2
+    assert respaldo.stats["by_model"] == {"fake": 2}
+
+
+def test_stream_conmuta_antes_del_primer_fragmento(proveedores):
+    enrutador, groq, respaldo = proveedores
+    groq.profile.error_rate = 1.0
+
+    async def escenario():
+        return [fragmento async for fragmento in enrutador.generar_respuesta_stream("paciente")]
+
+    fragmentos = asyncio.run(escenario())
+    assert len(fragmentos) > 1 and "NIVEL DE URGENCIA" in "".join(fragmentos)
+    assert groq.stats["errors"] == 1 and respaldo.stats["streams"] == 1
+
+
+def test_errores_http_del_respaldo_son_los_del_sdk(proveedores):
+    enrutador, _, respaldo = proveedores
+    respaldo.profile.rate_limit_rate = 1.0
+    respaldo.profile.retry_after = 7
+    secundario = enrutador.proveedores[1]
+
+    async def escenario():
+        clave = secundario.pool.claves[0]
+        with pytest.raises(RateLimitError) as error:
+            await secundario._completar(clave, messages=[{"role": "user", "content": "hola"}], model="fake")
+        return error.value, secundario._actualizar_clave(clave, error.value)
+
+    error, reposo = asyncio.run(escenario())
+    assert error.status_code == 429 and reposo == 7
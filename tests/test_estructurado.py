@@ -0,0 +1,40 @@
+import asyncio
+import json
+
+import pytest
+
+import local_agents
+from local_agents import LocalAgents
+
+
+class ClienteFalso:
+    """Responde `json_respuesta` en modo JSON y un reporte libre en el resto de llamadas."""
+
+    def __init__(self, json_respuesta: str):
+        self.json_respuesta = json_respuesta
+
+    async def generar_respuesta(self, prompt, formato_json=False, **kwargs):
+        return self.json_respuesta if formato_json else "reporte libre"
+
+
+@pytest.fixture
+def retina(monkeypatch):
+    monkeypatch.setattr(local_agents, "STRUCTURED_OUTPUT", True)
+    agentes = LocalAgents(api_key="k")
+
+    def analizar(json_respuesta: str):
+        agentes.specialists["RETINA"].cliente = ClienteFalso(json_respuesta)
+        return asyncio.run(agentes.analyze("RETINA", "paciente con miodesopsias"))
+
+    return analizar
+
+
+def test_reporte_estructurado_valido_incluye_el_json(retina):
+    texto, estructurado = retina(json.dumps({"hallazgos": ["miodesopsias"], "nivel_urgencia": "alto"}))
+    assert estructurado["nivel_urgencia"] == "ALTO"
+    assert "miodesopsias" in texto
+
+
+@pytest.mark.parametrize("respuesta", ["no es json", json.dumps({"hallazgos": ["sin urgencia"]})])
+def test_json_invalido_recurre_al_reporte_libre(retina, respuesta):
+    assert retina(respuesta) == ("reporte libre", None)
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+import main
+from hedging import HedgePolicy
+
+
+@pytest.fixture
+def llamadas(monkeypatch):
+    """`post_agent` falso: la URL primaria tarda 1 s y la de respaldo responde al momento."""
+    canceladas = []
+
+    async def post_agent(url, history, deadline=None, tier=None):
+        try:
+            await asyncio.sleep(1 if url == "primaria" else 0)
+            return f"reporte de {url}", None
+        except asyncio.CancelledError:
+            canceladas.append(url)
+            raise
+
+    politica = HedgePolicy(min_samples=1, max_ratio=1.0)
+    politica.record("RETINA", 0.01)
+    monkeypatch.setattr(main, "hedge_policy", politica)
+    monkeypatch.setattr(main, "post_agent", post_agent)
+    monkeypatch.setitem(main.HEDGE_URLS, "RETINA", "respaldo")
+    return canceladas
+
+
+def test_gana_el_duplicado_y_se_cancela_la_primaria(llamadas):
+    resultado = asyncio.run(main.hedged_post("RETINA", "primaria", "historial"))
+    assert resultado == ("reporte de respaldo", None)
+    assert llamadas == ["primaria"]
+
+
+def test_cancelar_al_llamante_antes_del_duplicado_cancela_la_primaria(llamadas):
+    async def escenario():
+        main.hedge_policy.record("RETINA", 5.0)  # El umbral sube: la cancelación llega antes del duplicado
+        llamada = asyncio.create_task(main.hedged_post("RETINA", "primaria", "historial"))
+        await asyncio.sleep(0.05)
+        llamada.cancel()
+        await asyncio.gather(llamada, return_exceptions=True)
+        await asyncio.sleep(0)
+        return list(llamadas)  # Antes de que asyncio.run cancele lo que quede pendiente
+
+    assert asyncio.run(escenario()) == ["primaria"]
@@ -0,0 +1,19 @@
+import asyncio
+
+from jobs import JobStore
+
+
+def test_memoria_barre_caducados_y_acota_el_tamano():
+    async def escenario():
+        store = JobStore("redis://127.0.0.1:1/0", ttl_seconds=0.05, max_memory_jobs=2)
+        caducado = await store.create()
+        await asyncio.sleep(0.1)
+        store.ttl_seconds = 60
+        antiguo, medio, nuevo = [await store.create() for _ in range(3)]
+        # El caducado se barre al escribir aunque nadie lo lea; del resto solo caben dos
+        assert caducado["id"] not in store._memory and antiguo["id"] not in store._memory
+        await store.update(medio["id"], status="running")  # Reescribirlo lo pasa al final
+        await store.create()
+        return [await store.get(job["id"]) is not None for job in (antiguo, medio, nuevo)]
+
+    assert asyncio.run(escenario()) == [False, True, False]
@@ -0,0 +1,59 @@
+import pytest
+
+from Utils.pool_claves import ClaveGroq, PoolClavesGroq, SinClavesDisponibles
+from Utils.rate_limit import LimiteTasaExcedido
+
+
+def pool(n: int = 3, **kwargs) -> PoolClavesGroq:
+    return PoolClavesGroq([ClaveGroq(f"k{i}", cliente=None) for i in range(n)], **kwargs)
+
+
+def test_leer_claves(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEYS", " a, b ,a,")
+    assert PoolClavesGroq.leer_claves("x") == ["a", "b"]
+    monkeypatch.delenv("GROQ_API_KEYS")
+    assert PoolClavesGroq.leer_claves("x") == ["x"]
+    assert PoolClavesGroq.leer_claves("x", ["p", "q"]) == ["p", "q"]
+    monkeypatch.setenv("GEMINI_API_KEY", "g")
+    assert PoolClavesGroq.leer_claves(entorno="GEMINI") == ["g"]
+
+
+def test_elige_la_key_con_mas_margen():
+    p = pool()
+    p.registrar_cabeceras(p.claves[0], {
+        "x-ratelimit-limit-tokens": "6000", "x-ratelimit-remaining-tokens": "300", "x-ratelimit-reset-tokens": "60s"
+    })
+    elegidas = {p.elegir()[0].api_key for _ in range(6)}
+    assert "k0" not in elegidas
+
+
+def test_reparte_segun_llamadas_en_vuelo():
+    p = pool(2)
+    primera, _ = p.elegir()
+    with p.usar(primera):
+        segunda, _ = p.elegir()
+    assert segunda is not primera
+
+
+def test_reposo_tras_429_y_espera_cuando_todas_reposan():
+    p = pool(2, max_espera=10)
+    p.enfriar(p.claves[0], 5)
+    assert all(p.elegir()[0].api_key == "k1" for _ in range(4))
+    p.enfriar(p.claves[1], 2)
+    clave, espera = p.elegir()
+    assert clave.api_key == "k1" and 1 < espera <= 2
+    for clave in p.claves:
+        p.enfriar(clave, 60)
+    with pytest.raises(LimiteTasaExcedido):
+        p.elegir()
+
+
+def test_retirar_conserva_la_ultima_key():
+    p = pool(2)
+    p.retirar(p.claves[0], "AuthenticationError")
+    p.retirar(p.claves[1], "AuthenticationError")
+    assert [c.retirada for c in p.claves] == [True, False]
+    assert p.elegir()[0].api_key == "k1"
+    p.claves[1].retirada = True
+    with pytest.raises(SinClavesDisponibles):
+        p.elegir()
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from scheduler import DiagnosisScheduler, QueueFullError
+
+
+async def esperar_en_cola(scheduler: DiagnosisScheduler, profundidad: int):
+    for _ in range(1000):
+        if scheduler.depth() >= profundidad:
+            return
+        await asyncio.sleep(0)
+    raise AssertionError(f"la cola no llegó a {profundidad} (hay {scheduler.depth()})")
+
+
+def test_respeta_max_in_flight_y_prioriza_urgencia():
+    async def escenario():
+        scheduler = DiagnosisScheduler(max_in_flight=1, max_queue=10)
+        orden = []
+
+        async def diagnostico(nombre: str, urgencia: str):
+            async with scheduler.slot(urgencia):
+                orden.append(nombre)
+                await asyncio.sleep(0.01)
+
+        primero = asyncio.create_task(diagnostico("primero", "BAJO"))
+        await asyncio.sleep(0)
+        tareas = [asyncio.create_task(diagnostico(n, u)) for n, u in
+                  [("bajo", "BAJO"), ("medio", "MEDIO"), ("critico", "CRITICO"), ("alto", "ALTO")]]
+        await esperar_en_cola(scheduler, 4)
+        assert scheduler.in_flight == 1
+        await asyncio.gather(primero, *tareas)
+        return orden, scheduler.in_flight
+
+    orden, in_flight = asyncio.run(escenario())
+    assert orden == ["primero", "critico", "alto", "medio", "bajo"]
+    assert in_flight == 0
+
+
+def test_cola_llena_rechaza_o_desaloja_al_menos_urgente():
+    async def escenario():
+        scheduler = DiagnosisScheduler(max_in_flight=1, max_queue=2)
+        await scheduler.acquire("MEDIO")
+        en_cola = [asyncio.create_task(scheduler.acquire(u)) for u in ("BAJO", "MEDIO")]
+        await esperar_en_cola(scheduler, 2)
+
+        with pytest.raises(QueueFullError) as rechazo:
+            await scheduler.acquire("BAJO")
+        assert rechazo.value.reason == "queue_full" and rechazo.value.retry_after >= 1
+
+        urgente = asyncio.create_task(scheduler.acquire("ALTO"))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError) as desalojo:
+            await en_cola[0]
+        assert desalojo.value.reason == "preempted"
+
+        scheduler.release()
+        await urgente
+        scheduler.release()
+        await en_cola[1]
+        scheduler.release()
+        return scheduler.in_flight, scheduler.depth()
+
+    assert asyncio.run(escenario()) == (0, 0)
+
+
+def test_cancelar_en_cola_libera_la_entrada():
+    async def escenario():
+        scheduler = DiagnosisScheduler(max_in_flight=1, max_queue=5)
+        await scheduler.acquire("MEDIO")
+        espera = asyncio.create_task(scheduler.acquire("MEDIO"))
+        await esperar_en_cola(scheduler, 1)
+        espera.cancel()
+        await asyncio.gather(espera, return_exceptions=True)
+        depth = scheduler.depth()
+        scheduler.release()
+        return depth, scheduler.in_flight
+
+    assert asyncio.run(escenario()) == (0, 0)
+
+
+def test_lotes_y_trabajos_nunca_se_desalojan():
+    async def escenario():
+        scheduler = DiagnosisScheduler(max_in_flight=1, max_queue=2)
+        await scheduler.acquire("MEDIO")
+        lotes = [asyncio.create_task(scheduler.acquire("BAJO", shed=False)) for _ in range(2)]
+        await esperar_en_cola(scheduler, 2)
+
+        with pytest.raises(QueueFullError) as rechazo:
+            await scheduler.acquire("CRÍTICO")
+        assert rechazo.value.reason == "queue_full"
+
+        # Con una petición desalojable en cola el urgente expulsa a esa y no a los lotes
+        scheduler.max_queue = 3
+        interactivo = asyncio.create_task(scheduler.acquire("BAJO"))
+        await esperar_en_cola(scheduler, 3)
+        urgente = asyncio.create_task(scheduler.acquire("CRÍTICO"))
+        with pytest.raises(QueueFullError) as desalojo:
+            await interactivo
+        assert desalojo.value.reason == "preempted"
+        assert not any(lote.done() for lote in lotes)
+
+        for siguiente in (urgente, *lotes):
+            scheduler.release()
+            await siguiente
+        scheduler.release()
+        return scheduler.in_flight, scheduler.depth()
+
+    assert asyncio.run(escenario()) == (0, 0)
@@ -0,0 +1,40 @@
+import asyncio
+
+from Utils.single_flight import SingleFlight
+
+
+def test_llamadas_identicas_se_agrupan():
+    llamadas = []
+
+    async def lenta():
+        llamadas.append(1)
+        await asyncio.sleep(0.05)
+        return "resultado"
+
+    async def escenario():
+        sf = SingleFlight()
+        resultados = await asyncio.gather(*[sf.ejecutar("k", lenta) for _ in range(5)], sf.ejecutar("otra", lenta))
+        return resultados, sf.en_vuelo()
+
+    resultados, en_vuelo = asyncio.run(escenario())
+    assert resultados == ["resultado"] * 6
+    assert len(llamadas) == 2
+    assert en_vuelo == 0
+
+
+def test_cancelar_al_primero_no_afecta_a_los_demas():
+    async def escenario():
+        sf = SingleFlight()
+
+        async def lenta():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        primero = asyncio.create_task(sf.ejecutar("k", lenta))
+        await asyncio.sleep(0)
+        segundo = asyncio.create_task(sf.ejecutar("k", lenta))
+        await asyncio.sleep(0)
+        primero.cancel()
+        return await segundo
+
+    assert asyncio.run(escenario()) == "ok"
@@ -0,0 +1,54 @@
+import asyncio
+import gc
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def agentes_sse(monkeypatch):
+    """Agentes que responden /analyze/stream con dos fragmentos y `done`."""
+
+    def responder(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        cuerpo = "".join(
+            main.sse_event("delta", {"text": texto}) for texto in (f"{host} ", "ok")
+        ) + main.sse_event("done", {})
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=cuerpo.encode())
+
+    monkeypatch.setattr(main, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(responder)))
+
+
+def eventos(texto: str) -> list:
+    salida = []
+    for bloque in texto.strip().split("\n\n"):
+        evento, datos = bloque.split("\n", 1)
+        salida.append((evento[len("event: "):], json.loads(datos[len("data: "):])))
+    return salida
+
+
+def test_stream_emite_especialistas_director_y_libera_el_hueco(agentes_sse):
+    with TestClient(main.app) as client:
+        response = client.post("/diagnose/stream", json={"historial": "paciente con visión borrosa"})
+    recibidos = eventos(response.text)
+    nombres = [evento for evento, _ in recibidos]
+    hechos = {datos["agent"] for evento, datos in recibidos if evento == "specialist_done"}
+    assert hechos == set(main.AGENTS_CONFIG)
+    assert "".join(d["text"] for e, d in recibidos if e == "director_delta") == "agent-director ok"
+    assert nombres[-1] == "done" and recibidos[-1][1]["status"] == "completed"
+    assert main.scheduler.in_flight == 0
+
+
+def test_stream_nunca_iterado_libera_el_hueco(agentes_sse):
+    async def escenario():
+        response = await main.diagnose_stream(main.DiagnosisRequest(historial="paciente"))
+        ocupados = main.scheduler.in_flight
+        del response  # el cliente se fue antes de que empezara el cuerpo
+        gc.collect()
+        return ocupados, main.scheduler.in_flight
+
+    assert asyncio.run(escenario()) == (1, 0)
@@ -0,0 +1,31 @@
+import httpx
+from fastapi.testclient import TestClient
+
+import main
+from Utils.trazas import hook_propagacion
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+
+def test_request_id_y_traceparent_llegan_a_cada_agente(monkeypatch):
+    cabeceras = []
+
+    def responder(request: httpx.Request) -> httpx.Response:
+        cabeceras.append((request.headers.get("x-request-id"), request.headers.get("traceparent", "")))
+        return httpx.Response(200, json={"resultado": f"reporte de {request.url.host}"})
+
+    cliente = httpx.AsyncClient(
+        transport=httpx.MockTransport(responder), event_hooks={"request": [hook_propagacion(main.agent_urls)]}
+    )
+    monkeypatch.setattr(main, "http_client", cliente)
+    with TestClient(main.app) as client:
+        response = client.post(
+            "/diagnose",
+            json={"historial": "paciente con visión borrosa"},
+            headers={"X-Request-ID": "req-1", "traceparent": f"00-{TRACE_ID}-00f067aa0ba902b7-01"},
+        )
+    assert response.status_code == 200
+    assert response.headers["X-Request-ID"] == "req-1"
+    # Cuatro especialistas y el director continúan la misma traza con el mismo request id
+    assert len(cabeceras) == 5
+    assert all(request_id == "req-1" and TRACE_ID in traceparent for request_id, traceparent in cabeceras)
@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+from triage import TriageRouter, estimate_urgency
+
+AGENTES = ["GENERAL", "RETINA", "CORNEA", "NEURO"]
+
+
+class ClienteFalso:
+    """Cliente de LLM mínimo: responde `respuesta` (o lanza si es una excepción) y guarda cada llamada."""
+
+    def __init__(self, respuesta):
+        self.respuesta = respuesta
+        self.llamadas = []
+
+    async def generar_respuesta(self, prompt, **kwargs):
+        self.llamadas.append(kwargs)
+        if isinstance(self.respuesta, Exception):
+            raise self.respuesta
+        return self.respuesta
+
+
+def test_triage_llm_usa_el_cliente_compartido():
+    cliente = ClienteFalso(json.dumps({"especialistas": ["retina"], "motivo": "miodesopsias"}))
+    router = TriageRouter(AGENTES, mode="llm", model="rapido", client=cliente)
+    decision = asyncio.run(router.route("paciente con miodesopsias"))
+    assert decision["mode"] == "llm"
+    assert decision["selected"] == ["GENERAL", "RETINA"]
+    assert cliente.llamadas == [{**cliente.llamadas[0], "formato_json": True, "modelo": "rapido", "temperature": 0}]
+
+
+def test_triage_llm_cae_al_clasificador_local():
+    for respuesta in (RuntimeError("circuito abierto"), "no es json", json.dumps({"especialistas": ["OTRO"]})):
+        router = TriageRouter(AGENTES, mode="llm", client=ClienteFalso(respuesta))
+        decision = asyncio.run(router.route("desprendimiento de retina"))
+        assert decision["mode"] == "keywords"
+        assert "RETINA" in decision["selected"]
+
+
+def test_urgencia_por_palabras_completas():
+    assert estimate_urgency("Desprendimiento de retina con pérdida súbita") == "CRÍTICO"
+    assert estimate_urgency("dolores oculares y ojos rojos") == "MEDIO"
+    # Subcadenas de otras palabras no cuentan
+    assert estimate_urgency("masa indolora en el párpado") == "BAJO"
+    assert estimate_urgency("revisión tras cortinaje nuevo en casa") == "BAJO"